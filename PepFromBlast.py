@@ -7,54 +7,102 @@
 # using the def-lines listed in the blast results and a large fasta file used to generate
 # the blastdb the blast results came from.
 #
-# This script takes 2 arguments:
+# This script takes 2 arguments (plus 1 optional one):
 # 1) --blast - The directory containing the blast output files (in XML format)
 # 2) --outdir - The directory to write the text files to
+# 3) --threads - [OPTIONAL] The number of gene_species lists to build at once (default 1)
 #
-# Usage: PepFromBlast.py --blast ~/GreenAlgae/big_blastp/ --outdir ~/GreenAlgae/pepfromblast_txt/
+# Usage: PepFromBlast.py --blast ~/GreenAlgae/big_blastp/ --outdir ~/GreenAlgae/pepfromblast_txt/ --threads 24
+#
+# The XML files are read as a stream that only keeps the hit currently being read, and every
+# gene_species list is written once, replacing any list left by an earlier run. The lists written are
+# recorded in OUTDIR/PepFromBlast.manifest, and the lists of an earlier run that get no hits in this
+# one are removed. Only lists named in the manifest or by the BLAST files of this run are ever removed,
+# no other file in OUTDIR.
 #
 # The script get_seq.sh should be used after this script to write the fasta files using the text
 # files generated by this script. 
 
-from Bio.Blast import NCBIXML
+from xml.etree.cElementTree import iterparse
+from multiprocessing import Pool
 from glob import glob
 from Bio import SeqIO, Seq
-import sys
+import sys, os
 import argparse
 #from pyfaidx import Fasta
 
-def ExtractPeps(BLAST_Results, OutDirectory):
-	SPECIES_GENE = {}
-  # Loop over the BLAST XML and retrieve the compIDs
+# Read the sequence IDs of the hits in one BLAST XML file, in the order of the file. Each ID is the
+# second word of the hit title (Hit_id followed by Hit_def), as str(Alignment).split()[1] was
+# with NCBIXML. Every hit is cleared once read, so memory does not grow with the file.
+def HitIDs(BLASTout):
+	ORF_IDS = []
+	for EVENT, ELEMENT in iterparse(BLASTout):
+		if ELEMENT.tag == 'Hit':
+			TITLE = '%s %s' % (ELEMENT.findtext('Hit_id', ''), ELEMENT.findtext('Hit_def', ''))
+			# A hit without a description gave the first word of the Length line
+			ORF_IDS.append((TITLE.split() + ['Length'])[1])
+			ELEMENT.clear()
+		elif ELEMENT.tag == 'Iteration':
+			ELEMENT.clear()
+	return ORF_IDS
+
+# Build one gene_species list from all its BLAST files and write it through a temporary file, so
+# the list is either complete or missing. A list without hits is not written. Returns whether the
+# list was written.
+def WriteList(JOB):
+	OutFasta, BLAST_FILES = JOB
+	SEEN = set()
+	ORFS = []
+	for BLASTout in BLAST_FILES:
+		for ORF_ID in HitIDs(BLASTout):
+			if ORF_ID not in SEEN:
+				SEEN.add(ORF_ID)
+				ORFS.append(ORF_ID)
+	if not ORFS:
+		return False
+	TMP_FILE = '%s.%d.tmp' % (OutFasta, os.getpid())
+	with open(TMP_FILE, 'w') as Out:
+		for VALUE in ORFS:
+			Out.write('%s\n' % VALUE)
+	os.rename(TMP_FILE, OutFasta)
+	return True
+
+# The lists written by the last run, as recorded in its manifest
+def ReadManifest(MANIFEST):
+	if not os.path.isfile(MANIFEST):
+		return []
+	with open(MANIFEST, 'r') as INPUT:
+		return [ LINE.rstrip('\n') for LINE in INPUT if LINE.strip() ]
+
+def ExtractPeps(BLAST_Results, OutDirectory, THREADS=1):
+	# Group the BLAST files by the gene_species list they go to. Only the file names are read here,
+	# the hits are read by the pool.
+	LISTS = {}
 	for BLASTout in glob('%s*out' % BLAST_Results):
 		# Define species and gene ID
 		SPECIES = '_'.join(BLASTout.split('/')[-1].split('.')[1].split('_')[2:])
 		GENE = BLASTout.split('query_')[-1].split('.')[0]
-		# Create a list of ORFs we want to retrieve from Transdecoder
-		# Take the sequence ID from the BLAST XML and put it into a list
-		for blast_record in NCBIXML.parse(open(BLASTout)):
-			for Alignment in blast_record.alignments:
-				ORF_ID = str(Alignment).split()[1]
-				try:
-					SPECIES_GENE[SPECIES][GENE].add(ORF_ID)
-				except KeyError:
-					try:
-						SPECIES_GENE[SPECIES]
-						SPECIES_GENE[SPECIES][GENE] = set()
-						SPECIES_GENE[SPECIES][GENE].add(ORF_ID)
-					except KeyError:
-						SPECIES_GENE[SPECIES] = {}
-						SPECIES_GENE[SPECIES][GENE] = set()
-						SPECIES_GENE[SPECIES][GENE].add(ORF_ID)
-				continue
+		LISTS.setdefault('%s/%s_%s.txt' % (OutDirectory, GENE, SPECIES), []).append(BLASTout)
 # Write text files for each gene_species of all the sequences to be fetched by a 
 # separate script: get_seq.sh
-	for SPECIES, GENE_ORFS in SPECIES_GENE.iteritems():
-		for KOG, GENE_ORF in GENE_ORFS.iteritems():
-			OutFasta = '%s/%s_%s.txt' % (OutDirectory,KOG, SPECIES)
-			with open(OutFasta, 'a') as Out:
-				for VALUE in list(GENE_ORF):
-					Out.write('%s\n' % VALUE)
+	POOL = Pool(THREADS)
+	JOBS = sorted(LISTS.iteritems())
+	WRITTEN = POOL.map(WriteList, JOBS, chunksize=1)
+	POOL.close()
+	POOL.join()
+	NEW_LISTS = [ OutFasta for ( OutFasta, BLAST_FILES ), DONE in zip(JOBS, WRITTEN) if DONE ]
+# Remove the lists of the last run, and the lists of this run's gene_species, that have no hits in
+# this run. Then record the lists of this run.
+	MANIFEST = '%s/PepFromBlast.manifest' % OutDirectory
+	KEEP = set( os.path.basename(OutFasta) for OutFasta in NEW_LISTS )
+	STALE = set(ReadManifest(MANIFEST)) | set( os.path.basename(OutFasta) for OutFasta in LISTS )
+	for OLD_LIST in sorted(STALE - KEEP):
+		if os.path.exists('%s/%s' % (OutDirectory, OLD_LIST)):
+			os.remove('%s/%s' % (OutDirectory, OLD_LIST))
+	TMP_FILE = '%s.%d.tmp' % (MANIFEST, os.getpid())
+	with open(TMP_FILE, 'w') as Out:
+		Out.write(''.join( '%s\n' % os.path.basename(OutFasta) for OutFasta in NEW_LISTS ))
+	os.rename(TMP_FILE, MANIFEST)
 					
 # Alternative code to write fasta files out directly rather than just text files.
 # These methods are much much slower than outputting text files then fetching the
@@ -87,6 +135,7 @@ def ExtractPeps(BLAST_Results, OutDirectory):
 parser = argparse.ArgumentParser(description = 'This script fetches sequences listed in blast results files and writes out a plain text file to be used by another script to write new fasta files with the full length sequences using the def-lines listed in the blast results and a large fasta file used to generate the blastdb the blast results came from.')
 parser.add_argument('--blast', required=True, help='BLAST results XML directory') 
 parser.add_argument('--outdir', required=True, help='Output gets written here') 
+parser.add_argument('--threads', type=int, default=1, help='[OPTIONAL] Number of gene_species lists to build at once') 
 args = parser.parse_args() 
 
-ExtractPeps(args.blast, args.outdir)
+ExtractPeps(args.blast, args.outdir, args.threads)
@@ -0,0 +1,240 @@
+#
+# alignment.py
+#
+# Alignments as a numpy uint8 matrix, read from and written to FASTA, NEXUS and relaxed PHYLIP as bytes,
+# for the scripts that only move alignments between formats or take subsets of them and do not need
+# Bio SeqRecords.
+#
+# An alignment is a dictionary:
+#   NAMES     every taxon name read, in file order
+#   INDEX     row of every name in MATRIX
+#   MATRIX    uint8 array with a row for every name and a column for every site
+#   ROWS      int array of the rows of MATRIX in the alignment, in order
+#   COLUMNS   the columns of MATRIX in the alignment, a slice or an int array
+#   DATATYPE  the nexus datatype ('dna' when read from FASTA or PHYLIP)
+#   GAP, MISSING  the gap and missing characters of the nexus format line
+# SUBSET returns a new dictionary sharing MATRIX with other ROWS and COLUMNS, so subsets of rows and
+# columns are not copied until they are written.
+#
+# The writers give the same files as Bio: WRITE_NEXUS as Nexus.write_nexus_data, WRITE_PHYLIP as
+# AlignIO's phylip-relaxed and WRITE_FASTA with the sequence on one line.
+
+import re
+import numpy as np
+
+# Characters that make a nexus name need quotes, as Bio.Nexus has them
+NEXUS_PUNCTUATION = "()[]{}\\,;:=*\\'\"`+-<>"
+NEXUS_WHITESPACE = " \t\n"
+
+def BUILD_ALIGNMENT(NAMES, SEQUENCES, DATATYPE='dna', GAP='-', MISSING='?'):
+    LENGTHS = set( len(SEQUENCE) for SEQUENCE in SEQUENCES )
+    if len(LENGTHS) > 1:
+        raise ValueError('Sequences must all be the same length')
+    NCHAR = LENGTHS.pop() if LENGTHS else 0
+    MATRIX = np.frombuffer(bytearray(''.join(SEQUENCES)), dtype=np.uint8).reshape(len(SEQUENCES), NCHAR)
+    return { 'NAMES': list(NAMES), 'INDEX': dict( ( NAME, ROW ) for ROW, NAME in enumerate(NAMES) ), 'MATRIX': MATRIX,
+             'ROWS': np.arange(len(NAMES)), 'COLUMNS': slice(None), 'DATATYPE': DATATYPE, 'GAP': GAP, 'MISSING': MISSING }
+
+# Names of the taxa in the alignment, in order
+def TAXA(ALIGNMENT):
+    return [ ALIGNMENT['NAMES'][ROW] for ROW in ALIGNMENT['ROWS'] ]
+
+def NCHAR(ALIGNMENT):
+    return len(np.arange(ALIGNMENT['MATRIX'].shape[1])[ALIGNMENT['COLUMNS']])
+
+# The name and sequence bytes of every taxon in the alignment
+def SEQUENCES(ALIGNMENT):
+    for ROW in ALIGNMENT['ROWS']:
+        yield ALIGNMENT['NAMES'][ROW], ALIGNMENT['MATRIX'][ROW, ALIGNMENT['COLUMNS']].tobytes()
+
+# A subset of the taxa (in the order given, by name or by row of the matrix for repeated names) and/or
+# columns (a slice, int array or bool array of the current columns) of an alignment, sharing its matrix
+def SUBSET(ALIGNMENT, NAMES=None, COLUMNS=None, ROWS=None):
+    SUB = dict(ALIGNMENT)
+    if NAMES is not None:
+        SUB['ROWS'] = np.array([ ALIGNMENT['INDEX'][NAME] for NAME in NAMES ], dtype=int)
+    elif ROWS is not None:
+        SUB['ROWS'] = np.asarray(ROWS, dtype=int)
+    if COLUMNS is not None:
+        if isinstance(ALIGNMENT['COLUMNS'], slice) and ALIGNMENT['COLUMNS'] == slice(None) and isinstance(COLUMNS, slice):
+            SUB['COLUMNS'] = COLUMNS
+        else:
+            SUB['COLUMNS'] = np.arange(ALIGNMENT['MATRIX'].shape[1])[ALIGNMENT['COLUMNS']][COLUMNS]
+    return SUB
+
+#### Readers
+def READ_FASTA(FASTA_FILE):
+    with open(FASTA_FILE, 'rb') as INPUT:
+        TEXT = INPUT.read()
+    NAMES = []
+    SEQUENCES = []
+    for RECORD in ( '\n' + TEXT ).split('\n>')[1:]:
+        HEADER, _, SEQUENCE = RECORD.partition('\n')
+        FIELDS = HEADER.split(None, 1)
+        NAMES.append(FIELDS[0] if FIELDS else '')
+        SEQUENCES.append(''.join(SEQUENCE.split()))
+    return BUILD_ALIGNMENT(NAMES, SEQUENCES)
+
+# Relaxed phylip, sequential or interleaved. The first block (the lines up to the first blank line) of an
+# interleaved file has one line for each taxon, so a first block of any other size is read as sequential
+# with each sequence wrapped over as many lines as it needs. Interleaved files without blank lines between
+# the blocks are read as interleaved when the sequential reading does not give NCHAR characters to every
+# taxon.
+def READ_PHYLIP(PHYLIP_FILE):
+    with open(PHYLIP_FILE, 'rb') as INPUT:
+        ALL_LINES = [ LINE.strip() for LINE in INPUT ]
+    LINES = [ LINE for LINE in ALL_LINES if LINE ]
+    NTAX, NCHAR = [ int(FIELD) for FIELD in LINES[0].split()[:2] ]
+    START = ALL_LINES.index(LINES[0]) + 1
+    while START < len(ALL_LINES) and not ALL_LINES[START]:
+        START += 1
+    FIRST_BLOCK = ALL_LINES[START:].index('') if '' in ALL_LINES[START:] else len(ALL_LINES) - START
+    if FIRST_BLOCK != NTAX:
+        SEQUENTIAL = READ_SEQUENTIAL(LINES[1:], NTAX, NCHAR)
+        if SEQUENTIAL:
+            return BUILD_ALIGNMENT(*SEQUENTIAL)
+    NAMES = []
+    PIECES = []
+    for LINE in LINES[1:NTAX + 1]:
+        FIELDS = LINE.split(None, 1)
+        NAMES.append(FIELDS[0])
+        PIECES.append([ ''.join(FIELDS[1].split()) if len(FIELDS) > 1 else '' ])
+    for COUNT, LINE in enumerate(LINES[NTAX + 1:]):
+        PIECES[COUNT % NTAX].append(''.join(LINE.split()))
+    return BUILD_ALIGNMENT(NAMES, [ ''.join(PIECE) for PIECE in PIECES ])
+
+# The names and sequences of sequential phylip lines, where a sequence goes on over the next lines until
+# it has NCHAR characters. None if the lines do not make NTAX sequences of NCHAR characters.
+def READ_SEQUENTIAL(LINES, NTAX, NCHAR):
+    NAMES = []
+    SEQUENCES = []
+    LINE_ITER = iter(LINES)
+    for LINE in LINE_ITER:
+        FIELDS = LINE.split(None, 1)
+        NAMES.append(FIELDS[0])
+        SEQUENCE = ''.join(FIELDS[1].split()) if len(FIELDS) > 1 else ''
+        while len(SEQUENCE) < NCHAR:
+            LINE = next(LINE_ITER, None)
+            if LINE is None:
+                return None
+            SEQUENCE += ''.join(LINE.split())
+        if len(SEQUENCE) != NCHAR:
+            return None
+        SEQUENCES.append(SEQUENCE)
+    if len(NAMES) != NTAX:
+        return None
+    return NAMES, SEQUENCES
+
+# A nexus name with its quotes taken off
+def NEXUS_WORD(LINE):
+    if LINE.startswith("'"):
+        END = 1
+        while True:
+            END = LINE.index("'", END)
+            if LINE[END + 1:END + 2] == "'":
+                END += 2
+            else:
+                break
+        return LINE[1:END].replace("''", "'"), LINE[END + 1:]
+    FIELDS = LINE.split(None, 1)
+    return FIELDS[0], FIELDS[1] if len(FIELDS) > 1 else ''
+
+# The data block of a nexus file, read the way Bio.Nexus reads it for the files trimal and Bio write
+def READ_NEXUS(NEXUS_FILE):
+    with open(NEXUS_FILE, 'rb') as INPUT:
+        TEXT = re.sub(r'\[[^\]]*\]', '', INPUT.read())
+    DIMENSIONS = re.search(r'\bdimensions\b([^;]*);', TEXT, re.I).group(1)
+    NTAX = int(re.search(r'\bntax\s*=\s*(\d+)', DIMENSIONS, re.I).group(1))
+    NCHAR = int(re.search(r'\bnchar\s*=\s*(\d+)', DIMENSIONS, re.I).group(1))
+    FORMAT = re.search(r'\bformat\b([^;]*);', TEXT, re.I)
+    FORMAT = FORMAT.group(1) if FORMAT else ''
+    OPTIONS = dict( ( KEY.lower(), VALUE ) for KEY, VALUE in re.findall(r'(\w+)\s*=\s*(\S+)', FORMAT) )
+    INTERLEAVE = OPTIONS.get('interleave', 'yes' if re.search(r'\binterleave\b(?!\s*=)', FORMAT, re.I) else 'no').lower() == 'yes'
+    MATRIX_TEXT = re.search(r'\bmatrix\b(.*?);', TEXT, re.I | re.S).group(1)
+    LINES = [ LINE.strip() for LINE in MATRIX_TEXT.split('\n') if LINE.strip() ]
+    NAMES = []
+    PIECES = {}
+    LINE_ITER = iter(LINES)
+    COUNT = 0
+    for LINE in LINE_ITER:
+        NAME, REST = NEXUS_WORD(LINE)
+        if INTERLEAVE:
+            CHARS = ''.join(REST.split()) if REST.strip() else ''.join(next(LINE_ITER).split())
+        else:
+            CHARS = ''.join(REST.split())
+            while len(CHARS) < NCHAR:
+                CHARS += ''.join(next(LINE_ITER).split())
+        if COUNT < NTAX:
+            NAMES.append(NAME)
+            PIECES[NAME] = [ CHARS ]
+        else:
+            PIECES[NAMES[COUNT % NTAX]].append(CHARS)
+        COUNT += 1
+    return BUILD_ALIGNMENT(NAMES, [ ''.join(PIECES[NAME]) for NAME in NAMES ], DATATYPE=OPTIONS.get('datatype', 'dna').lower(),
+                           GAP=OPTIONS.get('gap', '-'), MISSING=OPTIONS.get('missing', '?'))
+
+FORMATS = { 'fasta': READ_FASTA, 'nexus': READ_NEXUS, 'phylip': READ_PHYLIP }
+def READ_ALIGNMENT(ALIGNMENT_FILE, FORMAT):
+    return FORMATS[FORMAT](ALIGNMENT_FILE)
+
+#### Writers
+def WRITE_FASTA(ALIGNMENT, OUT_FILE):
+    with open(OUT_FILE, 'wb') as OUT:
+        for NAME, SEQUENCE in SEQUENCES(ALIGNMENT):
+            OUT.write('>%s\n%s\n' % ( NAME, SEQUENCE ))
+
+# A taxon name quoted as the nexus standard needs it
+def NEXUS_NAME(NAME):
+    SAFE = NAME.replace("'", "''")
+    if set(SAFE).intersection(NEXUS_WHITESPACE + NEXUS_PUNCTUATION):
+        SAFE = "'" + SAFE + "'"
+    return SAFE
+
+def WRITE_NEXUS(ALIGNMENT, OUT_FILE):
+    NAMES = [ NEXUS_NAME(NAME) for NAME in TAXA(ALIGNMENT) ]
+    WIDTH = max( len(NAME) for NAME in NAMES ) + 1
+    with open(OUT_FILE, 'wb') as OUT:
+        OUT.write('#NEXUS\nbegin data;\n\tdimensions ntax=%d nchar=%d;\n\tformat datatype=%s missing=%s gap=%s;\nmatrix\n' % (
+            len(NAMES), NCHAR(ALIGNMENT), ALIGNMENT['DATATYPE'], ALIGNMENT['MISSING'], ALIGNMENT['GAP'] ))
+        for NAME, ( TAXON, SEQUENCE ) in zip(NAMES, SEQUENCES(ALIGNMENT)):
+            OUT.write('%s%s\n' % ( NAME.ljust(WIDTH), SEQUENCE ))
+        OUT.write(';\nend;\n')
+
+# A name as Bio's phylip writer cleans it
+def PHYLIP_NAME(NAME):
+    NAME = NAME.strip()
+    for CHAR in '[](),':
+        NAME = NAME.replace(CHAR, '')
+    for CHAR in ':;':
+        NAME = NAME.replace(CHAR, '|')
+    return NAME
+
+# Relaxed phylip, interleaved in blocks of 50 characters in groups of 10 as Bio writes it
+def WRITE_PHYLIP(ALIGNMENT, OUT_FILE):
+    ROWS = list(SEQUENCES(ALIGNMENT))
+    if not ROWS or not len(ROWS[0][1]):
+        raise ValueError('Non-empty sequences are required')
+    NAMES = [ PHYLIP_NAME(NAME) for NAME, SEQUENCE in ROWS ]
+    WIDTH = max( len(NAME) for NAME, SEQUENCE in ROWS ) + 1
+    LENGTH = len(ROWS[0][1])
+    # The groups of each line of a block; the last line stops after its group that reaches the end
+    GROUPS = []
+    for BLOCK in range(0, LENGTH, 50):
+        STARTS = []
+        for START in range(BLOCK, BLOCK + 50, 10):
+            STARTS.append(START)
+            if START + 10 > LENGTH:
+                break
+        GROUPS.append(STARTS)
+    with open(OUT_FILE, 'wb') as OUT:
+        OUT.write(' %i %s\n' % ( len(ROWS), LENGTH ))
+        for COUNT, STARTS in enumerate(GROUPS):
+            if COUNT:
+                OUT.write('\n')
+            for NAME, ( TAXON, SEQUENCE ) in zip(NAMES, ROWS):
+                OUT.write(NAME[:WIDTH].ljust(WIDTH) if COUNT == 0 else ' ' * WIDTH)
+                OUT.write(''.join( ' ' + SEQUENCE[START:START + 10] for START in STARTS ) + '\n')
+
+WRITERS = { 'fasta': WRITE_FASTA, 'nexus': WRITE_NEXUS, 'phylip': WRITE_PHYLIP }
+def WRITE_ALIGNMENT(ALIGNMENT, OUT_FILE, FORMAT):
+    WRITERS[FORMAT](ALIGNMENT, OUT_FILE)
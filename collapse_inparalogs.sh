@@ -180,13 +180,8 @@ FIND_PARALOGS () {
         cd $INP_DIR/$GENE
         # echo $GENE
         mkdir out
-        for SUB_FILE in *___labels.txt
-            do
-                SPECIES=$(SPLIT 0 ___ ${SUB_FILE})
-                echo $SPECIES
-                TREE_FILE="RAxML_bestTree."$SPECIES".tre"
-                paralogs.py --tree $TREE_FILE --para $PARALOGS_DIR/"outlier_taxa."$GENE".txt" --others $SUB_FILE --out out --outgroups $OUTGROUPS_FILE
-            done
+        # One paralogs.py run covers the tree of every species added to this gene
+        paralogs.py --gene_dir $INP_DIR/$GENE --para $PARALOGS_DIR/"outlier_taxa."$GENE".txt" --out out --outgroups $OUTGROUPS_FILE
     fi
 }
 
@@ -253,17 +248,15 @@ if [ $LOOP_NUMBER > 1 ]; then
     mkdir $ALI_DIR/trees/CDS
     printf "%s\n" "${GENES[@]}" | xargs -n 1 -P $THREADS -I % bash -c 'GENE=%; \
     find $INP_DIR -name "RAxML_bestTree."$GENE".tre"  -exec cp {} $ALI_DIR/trees/CDS/"RAxML_result."$GENE".constrained.tre" \;'
-    printf "***************************   Generating distance matrixes for constrained trees ***************************\n"
-    echo "Starting RAxML distance matrix calculation on $(date)" >> $INPUT/log.txt
-    cd $ALI_DIR/trees/CDS
-    printf "%s\n" "${GENES[@]}" | xargs -n 1 -P $RUNS -I % raxmlHPC-PTHREADS-SSE3 -T 2 -f x -p 258755 -s %".phy" -n %".txt" -m GTRGAMMA -t "RAxML_result."%".constrained.tre"
+    # The pairwise distances are taken from the branch lengths of these trees (--patristic),
+    # so there is no separate raxml distance matrix run.
     # Run analysis of distances to flag outliers for each sequence
     printf "***************************   Running distance matrix analysis  ***************************\n"
     echo "Starting distance_matrix_zscore.py on $(date)" >> $INPUT/log.txt
     mkdir -p $WORKING/dist_m_zscore/CDS
     printf "***************************   CDS Files  ***************************\n"
-    echo "distance_matrix_zscore.py --input $ALI_DIR/trees/CDS  --score 85 --tree $ALI_DIR/trees/CDS --out $WORKING/dist_m_zscore/CDS/ --outgroups $OUTGROUPS_FILE" >> $INPUT/log.txt
-    distance_matrix_zscore.py --input $ALI_DIR/trees/CDS/ --score 85 --tree $ALI_DIR/trees/CDS/ --out $WORKING/dist_m_zscore/CDS/ --outgroups $OUTGROUPS_FILE
+    echo "distance_matrix_zscore.py --input $ALI_DIR/trees/CDS  --score 85 --tree $ALI_DIR/trees/CDS --out $WORKING/dist_m_zscore/CDS/ --outgroups $OUTGROUPS_FILE --patristic" >> $INPUT/log.txt
+    distance_matrix_zscore.py --input $ALI_DIR/trees/CDS/ --score 85 --tree $ALI_DIR/trees/CDS/ --out $WORKING/dist_m_zscore/CDS/ --outgroups $OUTGROUPS_FILE --patristic
 fi
 
 # We add the other sequences to our alignments
@@ -284,78 +277,58 @@ printf "%s\n" "${GENES[@]}" | xargs -n 1 -P $THREADS -I % bash -c 'GENE=%; \
 ##################
 # Generate Report
 ##################
-function REPORT_PARA {
-    HTML_FILE=$1
-    FILE_PATH=$INPUT/report/genes/$HTML_FILE
-    GENE=${HTML_FILE/.html/}
-    FIGURES=$REPORT/figures
-    if [ $LOOP_NUMBER > 1 ]; then
-        # Generate Report for Distance Matrix Analysis
-        DIST_CDS=$WORKING/dist_m_zscore/CDS/"outlier_taxa."$GENE".txt"
-        if [ -f $DIST_CDS ]
-            then
-                readarray BAD_SPECIES_LIST < $DIST_CDS
-                for SPECIES in ${BAD_SPECIES_LIST[@]}
-                    do
-                        ROW=\<\!--ROW_"$SPECIES"--\>
-                        sed -i "s,$ROW,<td class='fail dist_cds'>FAIL</td>$ROW," $FILE_PATH
-                    done
-                sed -i "s,\(hmm'>[0-9]*</td>\)<\!--,\1<td class='dist_cds'>PASS</td><\!--,g" $FILE_PATH
-            else
-                sed -i "s,\(hmm'>[0-9]*</td>\)<\!--,\1<td class='dist_cds'>PASS</td><\!--,g" $FILE_PATH
-        fi
-        # Add header column to gene report files and fill in zero counts in species and gene tables
-        sed -i "s,\(<\!--THEAD-->\),<th>Distance CDS</th>\1," $FILE_PATH
-        # Add Distance Matrix Figures
-        RPATH=../figures/"loop_"$LOOP_NUMBER/dist_m_zscore
-        HIST=$GENE".hist.pdf"
+# The report data of this step is gathered in these files and added to the report with report.py
+FIGURES=$REPORT/figures
+REPORT_DATA=$WORKING/report_inparalogs
+export FIGURES
+export REPORT_DATA
+mkdir -p $REPORT_DATA
+rm -f $REPORT_DATA/*.txt
+touch $REPORT_DATA/figures.txt $REPORT_DATA/cells.txt $REPORT_DATA/fills.txt
+if [ $LOOP_NUMBER -gt 1 ]; then
+    # Report for Distance Matrix Analysis. Species listed for a gene FAIL and its other species PASS.
+    report.py --report $REPORT --stage loop_"$LOOP_NUMBER"/collapse_inparalogs column --pages genes --header 'Distance CDS' --class dist_cds --default PASS --fail_lists "$WORKING/dist_m_zscore/CDS/outlier_taxa.*.txt"
+    # Add Distance Matrix Figures
+    DIST_FIG_CDS=$FIGURES/"loop_"$LOOP_NUMBER/dist_m_zscore/CDS
+    mkdir -p $DIST_FIG_CDS
+    cp $WORKING/dist_m_zscore/CDS/*.pdf $DIST_FIG_CDS
+    RPATH=../figures/"loop_"$LOOP_NUMBER/dist_m_zscore
+    for GENE in $(cat $REPORT/genes.txt); do
         TREE=$GENE".tre.pdf"
-        DIST_FIG_CDS=$REPORT/figures/"loop_"$LOOP_NUMBER/dist_m_zscore/CDS
-        export DIST_FIG_PEP
-        mkdir -p $DIST_FIG_CDS
-        cp $WORKING/dist_m_zscore/CDS/*.pdf $DIST_FIG_CDS
-
-        if [ -f $DIST_FIG_CDS/$TREE ]
-            then sed -i "s,\(<\!--FIGURES-->\),<h3>Loop $LOOP_NUMBER Distance Matrix CDS Tree</h3>\n\t<img src=\"$RPATH/CDS/$TREE\" />\n\t\1," $FILE_PATH
+        if [ -f $DIST_FIG_CDS/$TREE ]; then
+            printf "%s\t3\tLoop %s Distance Matrix CDS Tree\t%s\n" $GENE $LOOP_NUMBER $RPATH/CDS/$TREE
         fi
+    done >> $REPORT_DATA/figures.txt
+fi
 
-    fi
+# Number of sequences left for each species after collapsing its inparalogs, and the paralog trees
+function REPORT_PARA {
+    GENE=$1
     if [ -d $WORKING/inparalogs/$GENE ]
         then
             cd $WORKING/inparalogs/$GENE/out/
             mkdir -p $FIGURES/"loop_"$LOOP_NUMBER/inparalogs/$GENE
+            RPATH=../figures/"loop_"$LOOP_NUMBER/inparalogs/$GENE
+            printf "%s\t0\n" $GENE >> $REPORT_DATA/fills.txt
             for FILE in *___paralogs.txt
                 do
+                    [ -f $FILE ] || continue
                     SPECIES=${FILE/___paralogs.txt/}
-                    PARA_FILE=$WORKING/inparalogs/$GENE/out/$SPECIES"___paralogs.txt"
                     LABELS_FILE=$WORKING/inparalogs/$GENE/$SPECIES"___labels.txt"
                     START_NUMBER=$(wc -l < $LABELS_FILE)
-                    NUMBER=$(wc -l < $PARA_FILE)
+                    NUMBER=$(wc -l < $FILE)
                     NEW_TOTAL=$(($START_NUMBER - $NUMBER))
-                    ROW=\<\!--ROW_"$SPECIES"--\>
-                    sed -i "s,$ROW,<td class='paralog'>$NEW_TOTAL</td>$ROW," $FILE_PATH
+                    printf "%s\t%s\t%s\n" $GENE $SPECIES $NEW_TOTAL >> $REPORT_DATA/cells.txt
                     # Figures
                     TREE=$SPECIES".paralog_tree.pdf"
                     cp $TREE $FIGURES/"loop_"$LOOP_NUMBER/inparalogs/$GENE/
-                    RPATH=../figures/"loop_"$LOOP_NUMBER/inparalogs/$GENE
-                    sed -i "s,\(<\!--FIGURES-->\),<h3>Loop $LOOP_NUMBER $SPECIES Paralog Gene Tree</h3>\n\t<img src=\"$RPATH/$TREE\" />\n\t\1," $FILE_PATH
+                    printf "%s\t3\tLoop %s %s Paralog Gene Tree\t%s\n" $GENE $LOOP_NUMBER $SPECIES $RPATH/$TREE >> $REPORT_DATA/figures.txt
                 done
-            if [ $LOOP_NUMBER == 1 ]; then
-            sed -i "s,\(dist_pep'>[ A-Z]*</td>\)<\!--,\1<td class='paralog'>0</td><\!--,g" $FILE_PATH
-            else
-                sed -i "s,\(dist_cds'>[ A-Z]*</td>\)<\!--,\1<td class='paralog'>0</td><\!--,g" $FILE_PATH
-            fi
-        else
-            if [ $LOOP_NUMBER == 1 ]; then
-            sed -i "s,\(dist_pep'>[ A-Z/]*</td>\)<\!--,\1<td class='paralog'>N/A</td><\!--,g" $FILE_PATH
-            fi
     fi
 }
 
 export -f REPORT_PARA
-RFILE=($(find $REPORT/genes/*.html -type f | sed 's#.*/##'))
-printf "%s\n" "${RFILE[@]}" | xargs -n 1 -P $THREADS -I % bash -c 'REPORT_PARA %'
-
-# Add header column to gene report files and fill in zero counts in species and gene tables
-cd $REPORT/genes
-printf "%s\n" "${RFILE[@]}" | xargs -n 1 -P $THREADS -I % sed -i "s,\(<\!--THEAD-->\),<th>Other Hits</th>\1," %
+cat $REPORT/genes.txt | xargs -n 1 -P $THREADS -I % bash -c 'REPORT_PARA %'
+report.py --report $REPORT --stage loop_"$LOOP_NUMBER"/collapse_inparalogs column --pages genes --header 'Other Hits' --class paralog --default 'N/A' --cells $REPORT_DATA/cells.txt --fills $REPORT_DATA/fills.txt
+report.py --report $REPORT --stage loop_"$LOOP_NUMBER"/collapse_inparalogs figures --figures $REPORT_DATA/figures.txt
+report.py --report $REPORT render
@@ -0,0 +1,184 @@
+#
+# compact_tree.py
+#
+# Array based trees for the tree QC scripts, read from newick without Bio.Phylo or ete2.
+#
+# A tree is a dictionary of flat arrays with the nodes in preorder, so the root is node 0 and every
+# clade is a contiguous run of nodes:
+#   PARENT        index of the parent of every node, -1 for the root
+#   FIRST_CHILD   index of the first child of every node, -1 for leaves
+#   NEXT_SIBLING  index of the next child of the same parent, -1 for the last one
+#   LENGTH        float64 branch length above every node, NaN where the newick had none
+#   LABEL         index of the node's name in LABELS, -1 for unnamed nodes
+#   LABELS        every name in the tree, once
+#   SPECIES       every species in the tree, once. Names are SPECIES___SEQID
+#   LABEL_SPECIES index in SPECIES of every name in LABELS
+#   SEQIDS        the sequence id part of every name in LABELS ('' if it has none)
+#
+# LOAD_TREE keeps these arrays in a binary sidecar in a cache directory, normally OUT/cache/trees of
+# the script reading the tree, keyed on the size and modification time of the tree file, so the scripts
+# run on the same trees again later in the loop load the arrays instead of parsing the text again.
+# TO_ETE builds an ete2 tree straight from the arrays for the scripts that root and render trees.
+
+import os, re, zipfile
+import numpy as np
+
+TREE_ARRAYS = ['PARENT', 'FIRST_CHILD', 'NEXT_SIBLING', 'LENGTH', 'LABEL', 'LABEL_SPECIES']
+
+# Brackets, separators, [comments], 'quoted names' and everything in between
+TOKENS = re.compile(r"[(),:;]|\[[^\]]*\]|'[^']*'|[^(),:;\['\s][^(),:;\[']*")
+
+# Parse newick text into a tree. Comments in square brackets are skipped.
+def READ_NEWICK_TEXT(TEXT):
+    PARENT = []
+    LENGTH = []
+    LABEL = []
+    LABELS = []
+    LABEL_INDEX = {}
+    CURRENT = -1
+    # The node a name or branch length belongs to, -1 before a leaf has been started
+    LAST = -1
+    READ_LENGTH = False
+    for TOKEN in TOKENS.findall(TEXT):
+        if TOKEN == '(':
+            PARENT.append(CURRENT)
+            LENGTH.append(np.nan)
+            LABEL.append(-1)
+            CURRENT = len(PARENT) - 1
+            LAST = -1
+            continue
+        if TOKEN in ( ',', ')', ':' ) and LAST == -1 and PARENT:
+            # A leaf without a name
+            PARENT.append(CURRENT)
+            LENGTH.append(np.nan)
+            LABEL.append(-1)
+            LAST = len(PARENT) - 1
+        if TOKEN == ',':
+            LAST = -1
+        elif TOKEN == ')':
+            LAST = CURRENT
+            CURRENT = PARENT[CURRENT]
+        elif TOKEN == ':':
+            READ_LENGTH = True
+        elif TOKEN == ';':
+            break
+        elif TOKEN[0] == '[':
+            continue
+        elif READ_LENGTH:
+            LENGTH[LAST] = float(TOKEN)
+            READ_LENGTH = False
+        else:
+            NAME = TOKEN[1:-1] if TOKEN[0] == "'" else TOKEN.strip()
+            if LAST == -1:
+                # A leaf, or a tree that is a single leaf
+                PARENT.append(CURRENT)
+                LENGTH.append(np.nan)
+                LABEL.append(-1)
+                LAST = len(PARENT) - 1
+            if NAME not in LABEL_INDEX:
+                LABEL_INDEX[NAME] = len(LABELS)
+                LABELS.append(NAME)
+            LABEL[LAST] = LABEL_INDEX[NAME]
+    return BUILD_TREE(np.array(PARENT, dtype=np.int32), np.array(LENGTH, dtype=np.float64), np.array(LABEL, dtype=np.int32), LABELS)
+
+# Fill in the child and sibling links and the species of every name
+def BUILD_TREE(PARENT, LENGTH, LABEL, LABELS):
+    TOTAL_NODES = len(PARENT)
+    FIRST_CHILD = np.full(TOTAL_NODES, -1, dtype=np.int32)
+    NEXT_SIBLING = np.full(TOTAL_NODES, -1, dtype=np.int32)
+    LAST_CHILD = np.full(TOTAL_NODES, -1, dtype=np.int32)
+    for NODE in range(1, TOTAL_NODES):
+        UP = PARENT[NODE]
+        if LAST_CHILD[UP] == -1:
+            FIRST_CHILD[UP] = NODE
+        else:
+            NEXT_SIBLING[LAST_CHILD[UP]] = NODE
+        LAST_CHILD[UP] = NODE
+    SPECIES = []
+    SPECIES_INDEX = {}
+    LABEL_SPECIES = np.zeros(len(LABELS), dtype=np.int32)
+    SEQIDS = []
+    for N, NAME in enumerate(LABELS):
+        PARTS = NAME.split('___', 1)
+        if PARTS[0] not in SPECIES_INDEX:
+            SPECIES_INDEX[PARTS[0]] = len(SPECIES)
+            SPECIES.append(PARTS[0])
+        LABEL_SPECIES[N] = SPECIES_INDEX[PARTS[0]]
+        SEQIDS.append(PARTS[1] if len(PARTS) > 1 else '')
+    return { 'PARENT': PARENT, 'FIRST_CHILD': FIRST_CHILD, 'NEXT_SIBLING': NEXT_SIBLING, 'LENGTH': LENGTH,
+             'LABEL': LABEL, 'LABELS': LABELS, 'SPECIES': SPECIES, 'LABEL_SPECIES': LABEL_SPECIES, 'SEQIDS': SEQIDS }
+
+def READ_NEWICK(TREE_FILE):
+    with open(TREE_FILE, 'r') as INPUT:
+        return READ_NEWICK_TEXT(INPUT.read())
+
+# Load a tree through its binary sidecar in CACHE_DIR, parsing the newick file only when the sidecar
+# is missing or the file has changed. With no CACHE_DIR the file is always parsed. A sidecar that can
+# not be read, e.g. one truncated by a killed run, is parsed again and replaced.
+def LOAD_TREE(TREE_FILE, CACHE_DIR=None):
+    if CACHE_DIR is None:
+        return READ_NEWICK(TREE_FILE)
+    STAT = os.stat(TREE_FILE)
+    CACHE_FILE = '%s/%s.npz' % ( CACHE_DIR, os.path.basename(TREE_FILE) )
+    try:
+        with np.load(CACHE_FILE) as CACHE:
+            if CACHE['SIZE'] == STAT.st_size and CACHE['MTIME'] == STAT.st_mtime:
+                TREE = dict( ( NAME, CACHE[NAME] ) for NAME in TREE_ARRAYS )
+                for NAME in ( 'LABELS', 'SPECIES', 'SEQIDS' ):
+                    TREE[NAME] = CACHE[NAME].tolist()
+                return TREE
+    except (IOError, OSError, EOFError, KeyError, ValueError, zipfile.BadZipfile):
+        pass
+    TREE = READ_NEWICK(TREE_FILE)
+    # Write to a temporary file and rename it so parallel runs never see half written caches
+    TMP_FILE = '%s.%d.tmp' % ( CACHE_FILE, os.getpid() )
+    try:
+        # Another worker may make the directory at the same time
+        try:
+            os.makedirs(CACHE_DIR)
+        except OSError:
+            if not os.path.isdir(CACHE_DIR):
+                raise
+        ARRAYS = dict( ( NAME, TREE[NAME] ) for NAME in TREE_ARRAYS )
+        with open(TMP_FILE, 'wb') as OUT:
+            np.savez(OUT, LABELS=np.array(TREE['LABELS'], dtype=str), SPECIES=np.array(TREE['SPECIES'], dtype=str),
+                     SEQIDS=np.array(TREE['SEQIDS'], dtype=str), SIZE=STAT.st_size, MTIME=STAT.st_mtime, **ARRAYS)
+        os.rename(TMP_FILE, CACHE_FILE)
+    except (IOError, OSError):
+        print('Could not write tree cache %s' % CACHE_FILE)
+    return TREE
+
+# Boolean array marking the leaves
+def LEAVES(TREE):
+    return TREE['FIRST_CHILD'] == -1
+
+# Names of the leaves in preorder
+def LEAF_NAMES(TREE):
+    LABELS = TREE['LABELS']
+    return [ LABELS[N] if N >= 0 else '' for N in TREE['LABEL'][LEAVES(TREE)] ]
+
+# Build an ete2 tree from the arrays, giving the same tree Tree(TREE_FILE) reads: missing branch
+# lengths are ete2's default of 1.0 (0.0 for the root) and numeric internal names are support values.
+def TO_ETE(TREE):
+    # Only the scripts that use ete2 need it installed
+    from ete2 import Tree
+    PARENT = TREE['PARENT'].tolist()
+    LABELS = TREE['LABELS']
+    ROOT = Tree()
+    ROOT.dist = 0.0
+    NODES = [ROOT]
+    for NODE in range(1, len(PARENT)):
+        NODES.append(NODES[PARENT[NODE]].add_child())
+    for NODE, LENGTH, LABEL, FIRST_CHILD in zip(NODES, TREE['LENGTH'].tolist(), TREE['LABEL'].tolist(), TREE['FIRST_CHILD'].tolist()):
+        # NaN, the only value not equal to itself, is a missing length
+        if LENGTH == LENGTH:
+            NODE.dist = LENGTH
+        if LABEL >= 0:
+            if FIRST_CHILD == -1:
+                NODE.name = LABELS[LABEL]
+            else:
+                try:
+                    NODE.support = float(LABELS[LABEL])
+                except ValueError:
+                    NODE.name = LABELS[LABEL]
+    return ROOT
@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+#
+# concordance.py
+#
+# This script measures how far each gene tree disagrees with the species (constraint) tree, e.g.
+# the supermatrix tree RAxML_bestTree.loop_N_cds.tre, and optionally with every other gene tree.
+#
+# Every tree is reduced to its splits, each one stored as an integer bitset over a taxon index
+# shared by all the trees. Gene tree tips are named SPECIES___SEQID and are matched to the species
+# tree by SPECIES; species with more than one sequence in a gene tree are left out of that gene.
+# Two trees are compared over the species they share: the splits of both are cut down to those
+# species and compared as sets of integers, giving
+#   rf           the Robinson-Foulds distance, the number of splits found in only one of the trees
+#   norm_rf      rf divided by the total number of splits of the two trees
+#   concordance  the fraction of the gene tree's splits also found in the species tree
+#
+# This script takes 2 arguments (plus 4 optional ones):
+# 1) --constraint | The species tree in newick format.
+# 2) --trees | The gene trees in newick format. The gene name is the second part of the file name,
+# as in RAxML_bestTree.GENE.tre.
+# 3) --out | [OPTIONAL] The directory to write concordance.txt, and pairwise_rf.txt with --pairwise (default .).
+# 4) --pairwise | [OPTIONAL] Also compare every pair of gene trees.
+# 5) --min_concordance | [OPTIONAL] Genes with a lower concordance are flagged in the table (default 0.5).
+# 6) --threads | [OPTIONAL] Number of gene trees to compare at once (default 1).
+#
+# Usage: concordance.py --constraint RAxML_bestTree.loop_1_cds.tre --trees inparalogs/*/RAxML_bestTree.*.tre --out concordance --threads 8
+
+import sys, argparse, os
+from multiprocessing import Pool
+import compact_tree
+
+# Argument Parser
+parser = argparse.ArgumentParser(description = 'This script measures how far each gene tree disagrees with the species (constraint) tree, and optionally with every other gene tree, from the splits of the trees.')
+parser.add_argument('--constraint', required=True, help='The species tree in newick format.')
+parser.add_argument('--trees', required=True, nargs='+', help='The gene trees in newick format. The gene name is the second part of the file name, as in RAxML_bestTree.GENE.tre.')
+parser.add_argument('--out', default='.', help='[OPTIONAL] The directory to write the tables to.')
+parser.add_argument('--pairwise', action='store_true', help='[OPTIONAL] Also compare every pair of gene trees.')
+parser.add_argument('--min_concordance', type=float, default=0.5, help='[OPTIONAL] Genes with a lower concordance are flagged in the table.')
+parser.add_argument('--threads', type=int, default=1, help='[OPTIONAL] Number of gene trees to compare at once.')
+args = parser.parse_args()
+
+##### Functions
+# Species index shared by every tree
+TAXA = {}
+
+# Number of taxa in a bitset
+def COUNT(BITS):
+    return bin(BITS).count('1')
+
+# Read a tree and return the bitset of its species and the bitsets of the species below each of its
+# internal nodes. Species found more than once in the tree are left out.
+def TREE_CLADES(TREE_FILE):
+    TREE = compact_tree.READ_NEWICK(TREE_FILE)
+    PARENT = TREE['PARENT'].tolist()
+    LEAF = compact_tree.LEAVES(TREE).tolist()
+    NODE_SPECIES = [ TREE['SPECIES'][TREE['LABEL_SPECIES'][LABEL]] if IS_LEAF and LABEL >= 0 else None for LABEL, IS_LEAF in zip(TREE['LABEL'].tolist(), LEAF) ]
+    SEEN = set()
+    REPEATED = set()
+    for SPECIES in NODE_SPECIES:
+        if SPECIES is not None:
+            if SPECIES in SEEN:
+                REPEATED.add(SPECIES)
+            SEEN.add(SPECIES)
+    BITS = [0] * len(PARENT)
+    for NODE, SPECIES in enumerate(NODE_SPECIES):
+        if SPECIES is not None and SPECIES not in REPEATED:
+            if SPECIES not in TAXA:
+                TAXA[SPECIES] = len(TAXA)
+            BITS[NODE] = 1 << TAXA[SPECIES]
+    for NODE in range(len(PARENT) - 1, 0, -1):
+        BITS[PARENT[NODE]] |= BITS[NODE]
+    return BITS[0], [ BITS[NODE] for NODE in range(1, len(PARENT)) if not LEAF[NODE] ]
+
+# The splits of a tree cut down to the taxa in COMMON. Each split is stored as the side without the
+# first taxon of COMMON, and splits with fewer than 2 taxa on a side are dropped.
+def SPLITS(CLADES, COMMON):
+    LOWEST = COMMON & -COMMON
+    TOTAL = COUNT(COMMON)
+    SPLIT_SET = set()
+    for CLADE in CLADES:
+        SIDE = CLADE & COMMON
+        if SIDE & LOWEST:
+            SIDE ^= COMMON
+        SIZE = COUNT(SIDE)
+        if SIZE >= 2 and TOTAL - SIZE >= 2:
+            SPLIT_SET.add(SIDE)
+    return SPLIT_SET
+
+# Compare the splits of two trees over the taxa they share. Returns the number of shared taxa,
+# the splits of each tree and the number of shared splits.
+def COMPARE(TAXA_A, CLADES_A, TAXA_B, CLADES_B):
+    COMMON = TAXA_A & TAXA_B
+    SPLITS_A = SPLITS(CLADES_A, COMMON)
+    SPLITS_B = SPLITS(CLADES_B, COMMON)
+    return COUNT(COMMON), len(SPLITS_A), len(SPLITS_B), len(SPLITS_A & SPLITS_B)
+
+def RF(SPLITS_A, SPLITS_B, SHARED):
+    DISTANCE = SPLITS_A + SPLITS_B - 2 * SHARED
+    if SPLITS_A + SPLITS_B == 0:
+        return DISTANCE, 0.0
+    return DISTANCE, DISTANCE / float(SPLITS_A + SPLITS_B)
+
+# Pool workers only get a single argument. The trees are module level lists read before the
+# pool starts, so they are shared with the workers rather than sent to them.
+def CONSTRAINT_ROW(INDEX):
+    COMMON, GENE_SPLITS, CONSTRAINT_SPLITS, SHARED = COMPARE(GENE_TAXA[INDEX], GENE_CLADES[INDEX], CONSTRAINT_TAXA, CONSTRAINT_CLADES)
+    DISTANCE, NORM_RF = RF(GENE_SPLITS, CONSTRAINT_SPLITS, SHARED)
+    if GENE_SPLITS > 0:
+        CONCORDANCE = SHARED / float(GENE_SPLITS)
+        FLAG = 'FLAG' if CONCORDANCE < args.min_concordance else 'PASS'
+        CONCORDANCE = '%.4f' % CONCORDANCE
+    else:
+        CONCORDANCE = 'NA'
+        FLAG = 'NA'
+    return '%s\t%d\t%d\t%d\t%d\t%d\t%.4f\t%s\t%s\n' % ( GENES[INDEX], COMMON, GENE_SPLITS, CONSTRAINT_SPLITS, SHARED, DISTANCE, NORM_RF, CONCORDANCE, FLAG )
+
+def PAIRWISE_ROW(INDEX):
+    LINES = []
+    for OTHER in range(INDEX + 1, len(GENES)):
+        COMMON, SPLITS_A, SPLITS_B, SHARED = COMPARE(GENE_TAXA[INDEX], GENE_CLADES[INDEX], GENE_TAXA[OTHER], GENE_CLADES[OTHER])
+        DISTANCE, NORM_RF = RF(SPLITS_A, SPLITS_B, SHARED)
+        LINES.append('%s\t%s\t%d\t%d\t%.4f\n' % ( GENES[INDEX], GENES[OTHER], COMMON, DISTANCE, NORM_RF ))
+    return ''.join(LINES)
+
+##### END FUNCTIONS
+
+# Read every tree up front, which also fixes the taxon index
+CONSTRAINT_TAXA, CONSTRAINT_CLADES = TREE_CLADES(args.constraint)
+GENES = []
+GENE_TAXA = []
+GENE_CLADES = []
+for TREE_FILE in args.trees:
+    GENES.append(os.path.basename(TREE_FILE).split(".")[1])
+    TREE_TAXA, CLADES = TREE_CLADES(TREE_FILE)
+    GENE_TAXA.append(TREE_TAXA)
+    GENE_CLADES.append(CLADES)
+
+if not os.path.isdir(args.out):
+    os.makedirs(args.out)
+POOL = Pool(args.threads)
+with open('%s/concordance.txt' % args.out, 'w') as OUT:
+    OUT.write('gene\ttaxa\tgene_splits\tconstraint_splits\tshared_splits\trf\tnorm_rf\tconcordance\tflag\n')
+    for LINE in POOL.imap(CONSTRAINT_ROW, range(len(GENES)), chunksize=64):
+        OUT.write(LINE)
+if args.pairwise:
+    with open('%s/pairwise_rf.txt' % args.out, 'w') as OUT:
+        OUT.write('gene_a\tgene_b\ttaxa\trf\tnorm_rf\n')
+        for LINES in POOL.imap(PAIRWISE_ROW, range(len(GENES)), chunksize=8):
+            OUT.write(LINES)
+POOL.close()
+POOL.join()
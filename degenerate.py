@@ -4,29 +4,111 @@
 #
 # This script uses the degenerate_dna python library from https://github.com/carlosp420/degenerate-dna
 #
-# This script takes an input fasta file and converts the third codon position to 
+# This script takes an input fasta file and converts the third codon position to
 # degenerate code that could produce the same amino acid for that codon.
 #
+# The codons are not degenerated one at a time. Every codon the library can be given is made of the
+# bases ACGT, the ambiguity codes MWRYSKHVDBN, X, gaps and other characters, and the library treats all
+# the other characters alike, so it is run once on each of the 18^3 codons of these classes (with
+# method S) to fill a lookup table. Each sequence is then read as a numpy byte array, upper cased
+# with ? read as N as the library does, split into codons and looked up in one step. The output is
+# the same as running the library on each sequence. Bases after the last full codon are written as
+# they are.
+#
+# This script takes 1 argument (plus 1 optional one):
+# 1) --dna | One or more DNA fasta files. Each FILE.fasta is written to FILE.deg.fas in the current directory.
+# 2) --threads | [OPTIONAL] The number of files to degenerate at once (default 1).
+#
 # Example:
 # degenerate.py --dna /home/mendezg/greenalgae/translations/cds/env10972015_1.cds
+# degenerate.py --dna cds/*.fasta --threads 24
 
-from Bio import SeqIO
 from degenerate_dna import Degenera
-import argparse
+import argparse, os, warnings
+from multiprocessing import Pool
+import numpy
 
 # Argument Parser
 parser = argparse.ArgumentParser(description = 'This script uses the degenerate_dna python library to substitute the third codon position of input DNA sequences with degenerate codes for the same codon.')
-parser.add_argument('--dna', required=True, help='The full file path to the desired input DNA sequence in FASTA format.') 
-args = parser.parse_args() 
-
-DNA = args.dna
-OUTPUT_FILE = ( "%s.deg.fas" % DNA.split("/")[-1].split(".")[0] )
-INPUT_HANDLE = open(DNA, "rU")
-
-FASTA_SEQUENCES = SeqIO.parse(INPUT_HANDLE,'fasta')
-with open (OUTPUT_FILE, 'a') as FILE:
-    for SeqRecord in FASTA_SEQUENCES:
-        res = Degenera(dna=SeqRecord.seq, table=1, method='S')
-        res.degenerate()
-        DEG = res.degenerated
-        FILE.write( ">%s\n%s\n" % ( SeqRecord.id, DEG ) )
\ No newline at end of file
+parser.add_argument('--dna', required=True, nargs='+', help='The full file path to the desired input DNA sequence in FASTA format. Several files can be given.')
+parser.add_argument('--threads', type=int, default=1, help='[OPTIONAL] The number of files to degenerate at once.')
+args = parser.parse_args()
+
+##### Functions
+# Base classes of the lookup table. Every character not listed is in the last class.
+CLASSES = 'ACGTMWRYSKHVDBNX-'
+OTHER = '.'
+
+# Upper case with ? as N, as the library cleans each codon
+CLEAN = numpy.arange(256, dtype=numpy.uint8)
+CLEAN[ord('a'):ord('z') + 1] -= ord('a') - ord('A')
+CLEAN[ord('?')] = ord('N')
+
+CLASS = numpy.full(256, len(CLASSES), dtype=numpy.int32)
+for INDEX, BASE in enumerate(CLASSES):
+    CLASS[ord(BASE)] = INDEX
+
+# The degenerated codon of every codon of base classes, and whether the library keeps the (cleaned)
+# codon as it is, which it does for codons with gaps or characters it cannot degenerate
+def BUILD_TABLE():
+    BASES = CLASSES + OTHER
+    SIZE = len(BASES)
+    CODONS = numpy.zeros(( SIZE ** 3, 3 ), dtype=numpy.uint8)
+    KEEP = numpy.zeros(SIZE ** 3, dtype=bool)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        for FIRST in range(SIZE):
+            for SECOND in range(SIZE):
+                for THIRD in range(SIZE):
+                    CODON = BASES[FIRST] + BASES[SECOND] + BASES[THIRD]
+                    RESULT = Degenera(dna=CODON, table=1, method='S')
+                    RESULT.degenerate()
+                    INDEX = ( FIRST * SIZE + SECOND ) * SIZE + THIRD
+                    if RESULT.degenerated == CODON:
+                        KEEP[INDEX] = True
+                    else:
+                        CODONS[INDEX] = numpy.frombuffer(RESULT.degenerated, dtype=numpy.uint8)
+    return CODONS, KEEP
+
+def DEGENERATE(SEQUENCE):
+    FULL = len(SEQUENCE) - len(SEQUENCE) % 3
+    if not FULL:
+        return SEQUENCE
+    CODONS = CLEAN[numpy.frombuffer(SEQUENCE, dtype=numpy.uint8, count=FULL)].reshape(-1, 3)
+    CLASSES_OF = CLASS[CODONS]
+    INDEX = ( CLASSES_OF[:, 0] * SIZE + CLASSES_OF[:, 1] ) * SIZE + CLASSES_OF[:, 2]
+    OUT = numpy.where(KEEP[INDEX][:, None], CODONS, TABLE[INDEX])
+    return OUT.tobytes() + SEQUENCE[FULL:]
+
+# The id and sequence of every record of a fasta file, read as SeqIO reads them
+def READ_FASTA(INPUT):
+    NAME = None
+    LINES = []
+    for LINE in INPUT:
+        if LINE.startswith('>'):
+            if NAME is not None:
+                yield NAME, ''.join(LINES).replace(' ', '').replace('\r', '')
+            FIELDS = LINE[1:].rstrip().split(None, 1)
+            NAME = FIELDS[0] if FIELDS else ''
+            LINES = []
+        elif NAME is not None:
+            LINES.append(LINE.rstrip())
+    if NAME is not None:
+        yield NAME, ''.join(LINES).replace(' ', '').replace('\r', '')
+
+def DEGENERATE_FILE(DNA):
+    OUTPUT_FILE = ( "%s.deg.fas" % DNA.split("/")[-1].split(".")[0] )
+    TMP_FILE = '%s.%d.tmp' % ( OUTPUT_FILE, os.getpid() )
+    with open(DNA, 'rU') as INPUT, open(TMP_FILE, 'w') as FILE:
+        for NAME, SEQUENCE in READ_FASTA(INPUT):
+            FILE.write( ">%s\n%s\n" % ( NAME, DEGENERATE(SEQUENCE) ) )
+    os.rename(TMP_FILE, OUTPUT_FILE)
+
+##### END FUNCTIONS
+
+SIZE = len(CLASSES) + 1
+TABLE, KEEP = BUILD_TABLE()
+POOL = Pool(args.threads)
+POOL.map(DEGENERATE_FILE, args.dna, chunksize=1)
+POOL.close()
+POOL.join()
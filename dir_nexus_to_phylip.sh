@@ -7,7 +7,8 @@
 # Scripts called by this script:
 # 1) nexus_to_phylip.py
 #
-# This script converts a directory full of nexus files to phylip.
+# This script converts a directory full of nexus files to phylip. The files are converted in a
+# single nexus_to_phylip.py run with a pool of THREADS workers.
 #
 #Code to handle the named variable inputs:
 while [[ $# > 1 ]]
@@ -38,8 +39,4 @@ esac
 shift # past argument or value
 done
 
-# get basename of nexus files and load them into an array
-BASE=($(find $INPUT/*.$EXT -type f | sed 's#.*/##' | sed 's,.nex,,'))
-
-# find all the folders and launch a separate bash shell for each. In each shell concatenate the sequences then align them
-printf "%s\n" "${BASE[@]}" | xargs -n 1 -P $THREADS -I % nexus_to_phylip.py --input "$INPUT/"%".$EXT" --out "$OUT/"%".phy"
+nexus_to_phylip.py --input_dir $INPUT --out_dir $OUT --extension $EXT --threads $THREADS
@@ -15,44 +15,66 @@
 # If an entire library has a lot of contamination some contaminates will probably slip through this test,
 # so it is wise to have another contamination test if you suspect large amounts of contaminating sequences.
 
-# This script takes 5 arguments:
+# This script takes 5 arguments (plus 5 optional ones):
 # 1) --input | The directory containing the distance matrix files with names formatted so they all start with RAxML_distances.
-# 2) --score | The percent of outlier distances required to flag a sequence as an outlier.
+# Several directories can be given (e.g. CDS and PEP) to analyze them all in one run.
+# 2) --score | The percent of outlier distances required to flag a sequence as an outlier. Give one score per input
+# directory, or a single score to use for all of them.
 # 3) --tree | The directory containing newick formatted tree files used to generate the distance matrixes (used for visualization only)
-# 4) --out | The directory where you want output files written.
+# One per input directory.
+# 4) --out | The directory where you want output files written. One per input directory. Along with the outlier files
+# and trees, OUT/outlier_ratios.txt lists the outlier ratio of every species in every gene (gene, species, seqid, ratio).
 # 5) --outgroups | A text file defining the outgroups used to root the tree. If you expect the outgroup taxa not always to be present it is a good idea to provide multiple outgroups.
+# 6) --no_cache | [OPTIONAL] Re-parse every distance and tree file. By default each parsed file is kept as a binary
+# sidecar in OUT/cache/distances (OUT/cache/trees for the trees) and only re-parsed when its size or modification
+# time changes.
+# 7) --max_mem | [OPTIONAL] Memory budget in megabytes. When given, the ratio table is written to a memory-mapped
+# file in OUT and processed in blocks of species pairs that fit the budget, for taxon sets too big to hold in memory.
+# The budget covers the numeric arrays; the sequence names of every gene (for the output files) are kept as well.
+# 8) --sweep | [OPTIONAL] Extra scores to test. The ratios are only calculated once and the outlier files for each extra
+# score are written to OUT/sweep/score_SCORE/. Trees are only drawn for the main --score.
+# 9) --patristic | [OPTIONAL] Take the pairwise distances from the branch lengths of the RAxML_result.*.constrained.tre
+# files in the --tree directory instead of from RAxML_distances files, so raxmlHPC -f x does not need to be run.
+# 10) --incremental | [OPTIONAL] Keep the scoring state in OUT/cache/state (OUT/cache/state_patristic with --patristic) and
+# on the next run only add and remove the genes that were added, removed or changed since. Can not be combined with --max_mem.
 
 # Example:
 # distance_matrix_zscore.py --input ~/data/munchies/gene_trees/distances/ --score 30 --tree ~/data/munchies/gene_trees/ - ~/data/munchies/outliers/
+# distance_matrix_zscore.py --input CDS/ PEP/ --score 85 90 --tree CDS/ PEP/ --out zscore/CDS/ zscore/PEP/ --outgroups outgroups.txt --sweep 70 80 95
+# Any other threshold can be read straight from the ratio table, e.g.:
+# awk -F'\t' 'NR > 1 && $4 > 75' zscore/CDS/outlier_ratios.txt
 
 from __future__ import print_function
-import sys, argparse, os
+import sys, argparse, os, tempfile
 import numpy as np
 from glob import glob
 import matplotlib
 matplotlib.use('Agg')
 import matplotlib.pyplot as plt
-import copy
 from time import time
-from ete2 import Tree, faces, AttrFace, TreeStyle, NodeStyle, TextFace
+from ete2 import faces, AttrFace, TreeStyle, NodeStyle, TextFace
+import zscore_engine, zscore_state, patristic, compact_tree
+from rooting import READ_OUTGROUPS, ROOT_TREE
 
 # Argument Parser
 parser = argparse.ArgumentParser(description = 'This script analyzes a set of distance matrixes for different genes for genes with significantly different distances than the rest of the genes from the same species.')
-parser.add_argument('--input', required=True, help='The input RAxML distance matrix file.')
-parser.add_argument('--score', required=True, help='The percent of pairwise distance outliers required to mark an enture gene an outlier.')
-parser.add_argument('--tree', required=True, help='The directory containing newick formatted tree files used to generate the distance matrixes (used for visualization only)')
-parser.add_argument('--out', required=True, help='The directory where you want output files written.')
+parser.add_argument('--input', required=True, nargs='+', help='The directories containing the RAxML distance matrix files.')
+parser.add_argument('--score', required=True, nargs='+', type=float, help='The percent of pairwise distance outliers required to mark an enture gene an outlier. One per input directory, or one for all of them.')
+parser.add_argument('--tree', required=True, nargs='+', help='The directory containing newick formatted tree files used to generate the distance matrixes (used for visualization, and for the distances themselves with --patristic). One per input directory.')
+parser.add_argument('--out', required=True, nargs='+', help='The directory where you want output files written. One per input directory.')
 parser.add_argument('--outgroups', required=True, help='A text document with your outgroups listed. The line should start with the word Outgroup1 followed by a list of all the species in the outgroup with everything separated by spaces. You can specify Outgroup2 and Outgroup3 on other lines as backup outgroups if no species from your outgroup are present.')
+parser.add_argument('--no_cache', action='store_true', help='Always re-parse the distance and tree files instead of loading them from the binary caches kept in OUT/cache/distances and OUT/cache/trees.')
+parser.add_argument('--max_mem', '--max-mem', type=float, default=None, help='[OPTIONAL] Memory budget in megabytes. Switches to the out-of-core mode, where the ratio table is kept in a memory-mapped file in OUT and processed in blocks.')
+parser.add_argument('--sweep', nargs='+', type=float, default=[], help='[OPTIONAL] Extra scores to write outlier files for, in OUT/sweep/score_SCORE/.')
+parser.add_argument('--patristic', action='store_true', help='[OPTIONAL] Calculate the pairwise distances from the branch lengths of the RAxML_result.*.constrained.tre files in the tree directory instead of reading RAxML_distances files.')
+parser.add_argument('--incremental', action='store_true', help='[OPTIONAL] Keep the scoring state in OUT/cache/state and only update it for genes that were added, removed or changed since the last run.')
 args = parser.parse_args()
-
-# Functions to calculate Median absolute deviation, and Modified Z-score
-def MAD(VALUES, axis=None):
-    return np.median(np.absolute(VALUES - np.median(VALUES, axis)), axis)
-def MODZ(VALUES, axis=None):
-    if MAD(VALUES) == 0:
-        return VALUES
-    else:
-        return (0.6745 * (VALUES - np.median(VALUES))) / MAD(VALUES)
+if len(args.score) == 1:
+    args.score = args.score * len(args.input)
+if not len(args.input) == len(args.score) == len(args.tree) == len(args.out):
+    parser.error('--score, --tree and --out need one value for every --input directory (or a single --score for all of them).')
+if args.incremental and args.max_mem is not None:
+    parser.error('--incremental keeps its own scoring state and can not be combined with --max_mem.')
 
 #### ETE TOOLKIT BASED FUNCTIONS AND STYLES:
 ts = TreeStyle()
@@ -67,224 +89,166 @@ RED["bgcolor"] = "#dedede"
 nstyle = NodeStyle()
 nstyle["size"] = 0
 
-def MODZ_ALL(DIST_DIR, SCORE, TREE, OUT_DIR, OUTGROUPS):
+# Calculate the outlier ratio of every species in every gene for one directory of distance files.
+# Returns the species, genes, the Species -> seqid name of each gene and the species x gene ratios.
+def LOAD_RATIOS(DIST_DIR, TREE, OUT_DIR, NO_CACHE=False, MAX_MEM=None, PATRISTIC=False, INCREMENTAL=False):
 #######################################
 #        Load all distances into a data matrix
 #######################################
-    OUTGROUP_FILE = open( OUTGROUPS, 'r' )
+# Each distance is divided by the median distance of its gene. The ratios go into one matrix with
+# a row for every species pair and a column for every gene (see zscore_engine.py). With MAX_MEM
+# that table goes to a memory-mapped file instead and only the sequence names are kept here.
+# With PATRISTIC the distances are the tip to tip distances along each gene's tree (see patristic.py).
+# With INCREMENTAL the saved scoring state is updated instead (see zscore_state.py).
     t0 = time()
     print('************************** Loading data from distance files.')
-    DATA = {}
-    for DIST_FILE in glob('%s/RAxML_distances.*' % DIST_DIR):
-        GENE = os.path.basename(DIST_FILE).split('.')[1]
-        JUST_DATA = []
-        with open(DIST_FILE, 'r') as INPUT:
-            for LINE in INPUT:
-                # Find distance by splitting the line on a space tab space, select last item in that list, and stripping out the line break
-                DATUM = float(LINE.split(' \t ')[-1].strip('\n'))
-                JUST_DATA.append(DATUM)
-            JUST_MEDIAN = np.median(JUST_DATA)
-        with open(DIST_FILE, 'r') as INPUT:
-            for LINE in INPUT:
-                # Find distance by splitting the line on a space tab space, select last item in that list, and stripping out the line break
-                DATUM = float(LINE.split(' \t ')[-1].strip('\n'))
-                RATIO = ( DATUM / JUST_MEDIAN )
-#             # For each species we first split on a space-tab-space, then split on just a space. Now we have the two species separated.
-#             # Now we need to remove the seq-id. So we split each species by a triple underscore. Lastly we join the species with a
-#             # triple underscore.
-                SPECIES1 = sorted(LINE.split(' \t ')[0].split(' '))[0].split("___")[0]
-                SPECIES2 = sorted(LINE.split(' \t ')[0].split(' '))[1].split("___")[0]
-                KEY = "___".join([SPECIES1, SPECIES2])
-                #Fill Dictionary with the newly found KEY and DATUM
-                try:
-                    DATA[KEY][GENE] = RATIO
-                except KeyError:
-                    DATA[KEY] = { GENE:RATIO }
-    t1 = time()
-    print('Loading took %f seconds' %( t1 - t0 ))
-
-#######################################
-#        LOAD SEQ IDS
-#######################################
+    if NO_CACHE:
+        CACHE_DIR = None
+    else:
+        CACHE_DIR = '%s/cache/distances' % OUT_DIR
+    if PATRISTIC:
+        DIST_FILES = sorted(glob('%s/RAxML_result.*.constrained.tre' % TREE))
+        READER = patristic.READ_PATRISTIC
+    else:
+        DIST_FILES = sorted(glob('%s/RAxML_distances.*' % DIST_DIR))
+        READER = zscore_engine.READ_DISTANCES
+    if INCREMENTAL:
+        if PATRISTIC:
+            STATE_DIR = '%s/cache/state_patristic' % OUT_DIR
+        else:
+            STATE_DIR = '%s/cache/state' % OUT_DIR
+        STATE = zscore_state.LOAD_STATE(STATE_DIR)
+        GENE_FILES = [ ( os.path.basename(DIST_FILE).split('.')[1], DIST_FILE ) for DIST_FILE in DIST_FILES ]
+        zscore_state.UPDATE_STATE(STATE, GENE_FILES, CACHE_DIR, READER)
+        zscore_state.SAVE_STATE(STATE)
+        TAXA, GENES, GENE_LABELS, RATIOS = zscore_state.STATE_RATIOS(STATE)
+        SEQ_ARR = {}
+        for GENE, LABELS in zip(GENES, GENE_LABELS):
+            SEQ_ARR[GENE] = dict( LABEL.split('___')[:2] for LABEL in LABELS )
+        t1 = time()
+        print('Updating the scoring state took %f seconds' %( t1 - t0 ))
+        return TAXA, GENES, SEQ_ARR, RATIOS
+    GENE_DATA = []
     SEQ_ARR = {}
-    for SEQ_FILE in glob('%s/*.phy' % DIST_DIR):
-        GENE = os.path.basename(SEQ_FILE).split('.')[0]
-        with open(SEQ_FILE, 'r ') as SEQ_DATA:
-            for LINE in SEQ_DATA:
-                if LINE and LINE[0].isalpha():
-                    SPECIES = LINE.split('___')[0]
-                    SEQ_ID = LINE.split('___')[1].split(' ')[0]
-                    try:
-                        SEQ_ARR[GENE][SPECIES] = SEQ_ID
-                    except KeyError:
-                        SEQ_ARR[GENE] = { SPECIES:SEQ_ID }
-    # GENE = 'KOG3218'
-    # TAXON = 'Scrippsiella_trochoidea'
-    # TEST = SEQ_ARR[GENE][TAXON]
-    # print('%s' % TEST)
-
+    for DIST_FILE in DIST_FILES:
+        GENE = os.path.basename(DIST_FILE).split('.')[1]
+        LABELS, I, J, DISTANCES = zscore_engine.LOAD_DISTANCES(DIST_FILE, CACHE_DIR, READER)
+        if MAX_MEM is None:
+            GENE_DATA.append( ( GENE, LABELS, I, J, DISTANCES ) )
+        else:
+            GENE_DATA.append( ( GENE, DIST_FILE ) )
+        # The distance file rows carry the same Species___seqid names as the alignment
+        SEQ_ARR[GENE] = dict( LABEL.split('___')[:2] for LABEL in LABELS )
+    MEMMAP_FILE = None
+    if MAX_MEM is None:
+        TAXA, GENES, PAIR_I, PAIR_J, DATA = zscore_engine.BUILD_MATRIX(GENE_DATA)
+    else:
+        TAXA = sorted(set( TAXON for GENE in SEQ_ARR for TAXON in SEQ_ARR[GENE] ))
+        MEMMAP_HANDLE, MEMMAP_FILE = tempfile.mkstemp(prefix='zscore_', suffix='.memmap', dir=OUT_DIR)
+        os.close(MEMMAP_HANDLE)
+    # The memory-mapped table is as big as the whole ratio table, so it is removed however the run ends
+    try:
+        if MEMMAP_FILE is not None:
+            GENES, PAIR_I, PAIR_J, DATA = zscore_engine.BUILD_MEMMAP(GENE_DATA, TAXA, MEMMAP_FILE, CACHE_DIR, READER)
+        del GENE_DATA
+        t1 = time()
+        print('Loading took %f seconds' %( t1 - t0 ))
 
 #######################################
-#        Generate Modified Z-Scores For Each Distance
+#        Normalize Distances and Sum Them by Species
 #######################################
 
-# Create a new matrix by copying the data and dividing each datum by 0.1 * median -
+# Divide each ratio by 0.1 * the median ratio of its species pair and take the log.
 # This centers the distribution on 10 for every distance distribution, which will allow
 # normalizing the data (by taking the log) without shifting the distribution into negative
-# values which will cause problems for a Z-Score calculation.
-    t0 = time()
-    print("************************** Calculating Z-Scores")
-    DATA_NORMALIZED = copy.deepcopy(DATA)
-    for SPECIES___SPECIES, GENES_DATA in DATA_NORMALIZED.iteritems():
-        DEMON = 0.1 * np.median(GENES_DATA.values())
-        for GENE, DATUM in GENES_DATA.iteritems():
-            DATUM_WEIRDED = DATUM / DEMON
-            DATUM_NORMALIZED = np.log(DATUM_WEIRDED)
-            GENES_DATA[GENE] = DATUM_NORMALIZED
-    DATA_MODZ = copy.deepcopy(DATA_NORMALIZED)
-    for SPECIES___SPECIES, GENES_DATA in DATA_MODZ.iteritems():
-        MEDIAN = np.median(GENES_DATA.values())
-        MAD_GENES_DATA = MAD(GENES_DATA.values())
-        if MAD_GENES_DATA == 0:
-            for GENE, DATUM in GENES_DATA.iteritems():
-                if DATUM >= 2.31:
-                    GENES_DATA[GENE] = DATUM + 1.2
+# values which will cause problems for a Z-Score calculation. Modified z-scores of these values
+# are available from zscore_engine.MODZ, but the outlier test below works on the normalized
+# values themselves: for every gene each species gets the sum of the normalized distances to
+# all the other species in that gene.
+        t0 = time()
+        print("************************** Calculating Z-Scores")
+        if MAX_MEM is None:
+            PRESENT = ~np.isnan(DATA)
+            DATA_NORMALIZED = zscore_engine.NORMALIZE(DATA)
+            SUMS, COUNTS = zscore_engine.SPECIES_SUMS(DATA_NORMALIZED, PRESENT, PAIR_I, PAIR_J, len(TAXA))
+            del DATA_NORMALIZED, PRESENT
         else:
-            for GENE, DATUM in GENES_DATA.iteritems():
-              DATUM_MODZ = (0.6745 * (DATUM - MEDIAN)) / MAD_GENES_DATA
-              GENES_DATA[GENE] = DATUM_MODZ
+            SUMS, COUNTS = zscore_engine.CHUNKED_SPECIES_SUMS(DATA, PAIR_I, PAIR_J, len(TAXA), len(GENES), MAX_MEM)
+            del DATA
+    finally:
+        if MEMMAP_FILE is not None:
+            os.remove(MEMMAP_FILE)
+    RATIOS = zscore_engine.OUTLIER_RATIOS(SUMS, COUNTS)
     t1 = time()
     print('Calculating took %f seconds' %( t1 - t0 ))
+    return TAXA, GENES, SEQ_ARR, RATIOS
 
-#######################################
-#        Collect Modified Z-Scores by Gene
-#######################################
+# Write a table of the outlier ratio of every species present in every gene
+def WRITE_RATIOS(TAXA, GENES, SEQ_ARR, RATIOS, OUT_FILE):
+    with open( OUT_FILE, 'w' ) as OUT:
+        OUT.write('gene\tspecies\tseqid\tratio\n')
+        for COLUMN, GENE in enumerate(GENES):
+            for ROW in np.flatnonzero(~np.isnan(RATIOS[:, COLUMN])):
+                OUT.write('%s\t%s\t%s\t%f\n' % ( GENE, TAXA[ROW], SEQ_ARR[GENE][TAXA[ROW]], RATIOS[ROW, COLUMN] ))
 
-# So here I am generating a new data matrix where all the data is organized by gene, rather
-# than by species-to-species distances. Each gene will have a list of species, and each species
-# will have a list of distances. Lots of nested dictionaries, but it makes sense to me.
+# Write the outlier taxa of every gene and the seqids of every outlier taxon for one score.
+# Returns a dictionary of the outlier species and their ratios for each gene. The lists of an
+# earlier run into OUT_DIR are removed first, so a rerun neither repeats seqids nor keeps the list
+# of a gene or taxon that is no longer an outlier.
+def WRITE_OUTLIERS(TAXA, GENES, SEQ_ARR, RATIOS, SCORE, OUT_DIR):
+    for OLD_LIST in glob('%s/outlier_taxa.*.txt' % OUT_DIR) + glob('%s/*_seqids.txt' % OUT_DIR):
+        os.remove(OLD_LIST)
+    OUTLIERS = {}
+    SEQIDS = {}
+    for COLUMN, GENE in enumerate(GENES):
+        BADSPECIES = {}
+        with np.errstate(invalid='ignore'):
+            for ROW in np.flatnonzero(RATIOS[:, COLUMN] > float(SCORE)):
+                BADSPECIES[TAXA[ROW]] = RATIOS[ROW, COLUMN]
+        if BADSPECIES:
+            with open ( '%s/outlier_taxa.%s.txt' % ( OUT_DIR, GENE ), 'w') as OUT_OUT:
+                for TAXON in sorted(BADSPECIES.keys()):
+                    OUT_OUT.write("%s\n" % TAXON)
+        for TAXON in sorted(BADSPECIES.keys()):
+            SEQIDS.setdefault(TAXON, []).append(SEQ_ARR[GENE][TAXON])
+        OUTLIERS[GENE] = BADSPECIES
+    for TAXON in sorted(SEQIDS):
+        with open ( '%s/%s_seqids.txt' % ( OUT_DIR, TAXON ), 'w') as OUT_IDS:
+            for TAXON_SEQ in SEQIDS[TAXON]:
+                OUT_IDS.write("%s\n" % TAXON_SEQ)
+    return OUTLIERS
 
-    GENE_DATA = {}
-    for SPECIES___SPECIES, GENES_DATA in DATA_NORMALIZED.iteritems():
-        SPECIES_1 = SPECIES___SPECIES.split('___')[0]
-        SPECIES_2 = SPECIES___SPECIES.split('___')[1]
-        for GENE, DATUM in GENES_DATA.iteritems():
-            try:
-                GENE_DATA[GENE][SPECIES_1][SPECIES___SPECIES] = DATUM
-            except KeyError:
-                try:
-                    GENE_DATA[GENE][SPECIES_1] = {}
-                    GENE_DATA[GENE][SPECIES_1][SPECIES___SPECIES] = DATUM
-                except KeyError:
-                    GENE_DATA[GENE] = {}
-                    GENE_DATA[GENE][SPECIES_1] = {}
-                    GENE_DATA[GENE][SPECIES_1][SPECIES___SPECIES] = DATUM
-            try:
-                GENE_DATA[GENE][SPECIES_2][SPECIES___SPECIES] = DATUM
-            except KeyError:
-                try:
-                    GENE_DATA[GENE][SPECIES_2] = {}
-                    GENE_DATA[GENE][SPECIES_2][SPECIES___SPECIES] = DATUM
-                except KeyError:
-                    GENE_DATA[GENE] = {}
-                    GENE_DATA[GENE][SPECIES_2] = {}
-                    GENE_DATA[GENE][SPECIES_2][SPECIES___SPECIES] = DATUM
+def MODZ_ALL(DIST_DIR, SCORE, TREE, OUT_DIR, OUTGROUPS, NO_CACHE=False, MAX_MEM=None, SWEEP=[], PATRISTIC=False, INCREMENTAL=False):
+    TAXA, GENES, SEQ_ARR, RATIOS = LOAD_RATIOS(DIST_DIR, TREE, OUT_DIR, NO_CACHE, MAX_MEM, PATRISTIC, INCREMENTAL)
 
-# First loop through text file and save the taxa from the Outgroup line to a list
-    OUTGROUP1 = []
-    OUTGROUP2 = []
-    OUTGROUP3 = []
-    # Make lists of each outgroup
-    for LINE in OUTGROUP_FILE:
-        if LINE.split()[0] == "Outgroup1":
-            for OUT in LINE.split()[2:]:
-                OUTGROUP1.append( OUT )
-        if LINE.split()[0] == "Outgroup2":
-            for OUT in LINE.split()[2:]:
-                OUTGROUP2.append( OUT )
-        if LINE.split()[0] == "Outgroup3":
-            for OUT in LINE.split()[2:]:
-                OUTGROUP3.append( OUT )
+    # Read the outgroups once for every tree
+    OUTGROUP_SETS = READ_OUTGROUPS(OUTGROUPS)
 
 #######################################
 #        COUNT OUTLIERS AND WRITE FILES
 #######################################
     t0 = time()
     print("************************** Writing Output")
-    for GENE, VALUES in GENE_DATA.iteritems():
-        BADSPECIES = {}
-        TOTAL_SPECIES = len(VALUES.keys())
-        # print( '%s' % TOTAL_SPECIES)
-        TOTAL_COMPARISONS = ((TOTAL_SPECIES - 1) * TOTAL_SPECIES ) / 2
-        # print( '%s' % TOTAL_COMPARISONS)
-        for SPECIES, DISTANCES in VALUES.iteritems():
-            SPECIES_COUNT = 0
-            for SPECIES___SPECIES, DATUM in DISTANCES.iteritems():
-                SPECIES_COUNT = float(SPECIES_COUNT) + float(DATUM)
-            # print( '%s' % SPECIES_COUNT )
-            RATIO = float( float(SPECIES_COUNT) / float( TOTAL_COMPARISONS ) ) * 1000
-            # print( '%s' % RATIO )
-            #     if DATUM >= 3:
-            #         SPECIES_COUNT = SPECIES_COUNT + 1
-            # PERCENT_OUTLIERS = float( ( float(SPECIES_COUNT) / float(TOTAL_SPECIES) ) * 100 )
-            # if PERCENT_OUTLIERS > float(SCORE):
-            if RATIO > float(SCORE):
-                if SPECIES not in BADSPECIES.keys():
-                    BADSPECIES[SPECIES] = RATIO
-        for TAXON in BADSPECIES.keys():
-            with open ( '%s/outlier_taxa.%s.txt' % ( OUT_DIR, GENE ), 'a') as OUT_OUT:
-                OUT_OUT.write("%s\n" % TAXON)
-            with open ( '%s/%s_seqids.txt' % ( OUT_DIR, TAXON ), 'a') as OUT_IDS:
-                TAXON_SEQ = SEQ_ARR[GENE][TAXON]
-                OUT_IDS.write("%s\n" % TAXON_SEQ)
+    WRITE_RATIOS(TAXA, GENES, SEQ_ARR, RATIOS, '%s/outlier_ratios.txt' % OUT_DIR)
+    # Every extra score only needs its own outlier files, the ratios are the same
+    for SWEEP_SCORE in SWEEP:
+        SWEEP_DIR = '%s/sweep/score_%g' % ( OUT_DIR, SWEEP_SCORE )
+        if not os.path.isdir(SWEEP_DIR):
+            os.makedirs(SWEEP_DIR)
+        WRITE_OUTLIERS(TAXA, GENES, SEQ_ARR, RATIOS, SWEEP_SCORE, SWEEP_DIR)
+    OUTLIERS = WRITE_OUTLIERS(TAXA, GENES, SEQ_ARR, RATIOS, SCORE, OUT_DIR)
+    # The trees are loaded through their compact sidecars, unless NO_CACHE
+    TREE_CACHE_DIR = None if NO_CACHE else '%s/cache/trees' % OUT_DIR
+    for GENE in GENES:
+        BADSPECIES = OUTLIERS[GENE]
 
     #######################################
     #        GENERATE TREES
     #######################################
-        # Root the tree using the outgroup specified in the text file
-        # Next check if our outgroup taxa are in the tree and create a new list of just species present.
-        TREE_LIST = {}
-        # Make list of all species in tree.
-        T = Tree( "%s/RAxML_result.%s.constrained.tre" % ( TREE, GENE ) )
-        for LEAF in T:
-            SPECIES = LEAF.name.split("___")[0]
-            SEQID = LEAF.name.split("___")[1]
-            TREE_LIST[SPECIES] = SEQID
-        NEW_OUTGROUP = []
-        for SPECIES, SEQID in TREE_LIST.iteritems():
-            if SPECIES in OUTGROUP1:
-                FULL_NAME = "___".join( [ SPECIES, SEQID ] )
-                NEW_OUTGROUP.append( FULL_NAME )
-        # Root tree using the Outgroup taxa that are present, and if no outgroup taxa are present use the midpoint method to root the tree.
-        if len( NEW_OUTGROUP ) > 1:
-            ANCESTOR = T.get_common_ancestor( NEW_OUTGROUP )
-            T.set_outgroup( ANCESTOR )
-        if len( NEW_OUTGROUP ) == 1:
-            T.set_outgroup( NEW_OUTGROUP[0] )
-        if len( NEW_OUTGROUP ) < 1:
-            for SPECIES, SEQID in TREE_LIST.iteritems():
-                if SPECIES in OUTGROUP2:
-                    FULL_NAME = "___".join( [ SPECIES, SEQID ] )
-                    NEW_OUTGROUP.append( FULL_NAME )
-            if len( NEW_OUTGROUP ) > 1:
-                ANCESTOR = T.get_common_ancestor( NEW_OUTGROUP )
-                T.set_outgroup( ANCESTOR )
-            if len( NEW_OUTGROUP ) == 1:
-                T.set_outgroup( NEW_OUTGROUP[0] )
-            if len( NEW_OUTGROUP ) < 1:
-                for SPECIES, SEQID in TREE_LIST.iteritems():
-                    if SPECIES in OUTGROUP3:
-                        FULL_NAME = "___".join( [ SPECIES, SEQID ] )
-                        NEW_OUTGROUP.append( FULL_NAME )
-                if len( NEW_OUTGROUP ) > 1:
-                    ANCESTOR = T.get_common_ancestor( NEW_OUTGROUP )
-                    T.set_outgroup( ANCESTOR )
-                if len( NEW_OUTGROUP ) == 1:
-                    T.set_outgroup( NEW_OUTGROUP[0] )
-                if len( NEW_OUTGROUP ) < 1:
-                    print("%s: No outgroup taxa present. Rooting at midpoint instead. This may break a monophyletic group." % GENE )
-                    R = T.get_midpoint_outgroup()
-                    T.set_outgroup(R)
+        # Root the tree on the outgroup taxa that are present, or at the midpoint if there are none
+        TREE_FILE = "%s/RAxML_result.%s.constrained.tre" % ( TREE, GENE )
+        T = compact_tree.TO_ETE(compact_tree.LOAD_TREE(TREE_FILE, TREE_CACHE_DIR))
+        ROOT_TREE(T, TREE_FILE, OUTGROUP_SETS, GENE, '%s/cache/roots' % OUT_DIR)
         # Write a new tree file with the long branches indicated and their clades indicated
         for CLADE in T.traverse():
             CLADE.set_style(nstyle)
@@ -345,5 +309,7 @@ def MODZ_ALL(DIST_DIR, SCORE, TREE, OUT_DIR, OUTGROUPS):
 #     print('***************************   Writing histograms took %f seconds ***************************' %( t1 - t0 ))
 
 
-#Invoke the function that does all the work
-MODZ_ALL(args.input, args.score, args.tree, args.out, args.outgroups)
+#Invoke the function that does all the work for each input directory
+for DIST_DIR, SCORE, TREE, OUT_DIR in zip(args.input, args.score, args.tree, args.out):
+    print('************************** Analyzing %s' % DIST_DIR)
+    MODZ_ALL(DIST_DIR, SCORE, TREE, OUT_DIR, args.outgroups, args.no_cache, args.max_mem, args.sweep, args.patristic, args.incremental)
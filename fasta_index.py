@@ -0,0 +1,95 @@
+#
+# fasta_index.py
+#
+# Indexed reads of sequences from the large ORF fasta files, in place of one samtools faidx process
+# per list of sequences.
+#
+# The index is the .fai file samtools faidx writes next to the fasta file, with a line for every
+# sequence: name, length, offset of the first base, bases per line and bytes per line. It is built
+# here when it is missing or older than the fasta file. The fasta file is memory mapped, so a
+# sequence is read by slicing the map at its offset, and only the pages of the sequences fetched are
+# read from disk.
+
+import os, sys, mmap
+
+# Bases per line in the fasta files written, as samtools faidx writes them
+LINE_WIDTH = 60
+
+# Build the .fai index of a fasta file. Returns the index as a dictionary of
+# name: (length, offset, bases per line, bytes per line).
+def BUILD_INDEX(FASTA_FILE):
+    INDEX = {}
+    NAMES = []
+    NAME = None
+    OFFSET = 0
+    with open(FASTA_FILE, 'rb') as INPUT:
+        for LINE in INPUT:
+            if LINE.startswith('>'):
+                NAME = LINE[1:].split()[0] if LINE[1:].split() else ''
+                NAMES.append(NAME)
+                INDEX[NAME] = [0, OFFSET + len(LINE), 0, 0]
+            elif NAME is not None:
+                ENTRY = INDEX[NAME]
+                BASES = len(LINE.rstrip('\r\n'))
+                if ENTRY[2] == 0:
+                    ENTRY[2] = BASES
+                    ENTRY[3] = len(LINE)
+                ENTRY[0] += BASES
+            OFFSET += len(LINE)
+    INDEX = dict( ( NAME, tuple(ENTRY) ) for NAME, ENTRY in INDEX.iteritems() )
+    INDEX_FILE = FASTA_FILE + '.fai'
+    TMP_FILE = '%s.%d.tmp' % ( INDEX_FILE, os.getpid() )
+    try:
+        with open(TMP_FILE, 'w') as OUT:
+            for NAME in NAMES:
+                OUT.write('%s\t%d\t%d\t%d\t%d\n' % ( (NAME,) + INDEX[NAME] ))
+        os.rename(TMP_FILE, INDEX_FILE)
+    except (IOError, OSError):
+        print('Could not write fasta index %s' % INDEX_FILE)
+    return INDEX
+
+# Read the .fai index of a fasta file, building it first if needed
+def READ_INDEX(FASTA_FILE):
+    INDEX_FILE = FASTA_FILE + '.fai'
+    if not os.path.isfile(INDEX_FILE) or os.path.getmtime(INDEX_FILE) < os.path.getmtime(FASTA_FILE):
+        return BUILD_INDEX(FASTA_FILE)
+    INDEX = {}
+    with open(INDEX_FILE, 'r') as INPUT:
+        for LINE in INPUT:
+            FIELDS = LINE.rstrip('\n').split('\t')
+            INDEX[FIELDS[0]] = tuple( int(FIELD) for FIELD in FIELDS[1:5] )
+    return INDEX
+
+# Open a fasta file for FETCH. Returns a dictionary with the memory map and the index.
+def OPEN_FASTA(FASTA_FILE):
+    INDEX = READ_INDEX(FASTA_FILE)
+    with open(FASTA_FILE, 'rb') as INPUT:
+        if os.fstat(INPUT.fileno()).st_size == 0:
+            MAP = ''
+        else:
+            MAP = mmap.mmap(INPUT.fileno(), 0, access=mmap.ACCESS_READ)
+    return { 'FILE': FASTA_FILE, 'MAP': MAP, 'INDEX': INDEX }
+
+def CLOSE_FASTA(FASTA):
+    if FASTA['MAP']:
+        FASTA['MAP'].close()
+
+# The sequence of NAME, without line breaks, or None if it is not in the file
+def FETCH(FASTA, NAME):
+    if NAME not in FASTA['INDEX']:
+        return None
+    LENGTH, OFFSET, LINE_BASES, LINE_BYTES = FASTA['INDEX'][NAME]
+    if LENGTH == 0:
+        return ''
+    END = OFFSET + ( LENGTH // LINE_BASES ) * LINE_BYTES + LENGTH % LINE_BASES
+    return FASTA['MAP'][OFFSET:END].replace('\n', '').replace('\r', '')
+
+# The fasta record of NAME as samtools faidx writes it, with the def-line prefixed by PREFIX, or ''
+# with a message if NAME is not in the file
+def RECORD(FASTA, NAME, PREFIX=''):
+    SEQUENCE = FETCH(FASTA, NAME)
+    if SEQUENCE is None:
+        sys.stderr.write('%s not found in %s\n' % ( NAME, FASTA['FILE'] ))
+        return ''
+    LINES = [ SEQUENCE[START:START + LINE_WIDTH] for START in range(0, len(SEQUENCE), LINE_WIDTH) ]
+    return '>%s%s\n%s' % ( PREFIX, NAME, ''.join( LINE + '\n' for LINE in LINES ) )
@@ -79,6 +79,36 @@ export SPECIES_LIST
 #LOAD input files into arrays; We'll have to do the species list later since bash can't export arrays into the environment
 GENES=($(cat $GENE_LIST | sort))
 
+# Compare every gene tree with the supermatrix tree in one run. Genes with inparalogs keep their
+# tree in the inparalogs directory, the others were copied to the alignment trees directory.
+if [ $LOOP_NUMBER -eq 1 ]; then
+    ALI_DIR=$WORKING/cat_mafft_all/CDS
+else
+    ALI_DIR=$WORKING/early_gene_trees
+fi
+CONSTRAINT_TREE=$WORKING/supermatrix/CDS/RAxML_bestTree.loop_"$LOOP_NUMBER"_cds.tre
+# Each loop writes its own table, and a table from an earlier run of this step is never read
+CONCORDANCE_DIR=$WORKING/concordance/loop_"$LOOP_NUMBER"
+# Genes with a lower split concordance are flagged
+MIN_CONCORDANCE=0.5
+export CONCORDANCE_DIR
+export MIN_CONCORDANCE
+rm -f $CONCORDANCE_DIR/concordance.txt
+if [ -f $CONSTRAINT_TREE ]; then
+    GENE_TREES=()
+    for GENE in ${GENES[@]}; do
+        if [ -f $WORKING/inparalogs/$GENE/RAxML_bestTree.$GENE.tre ]; then
+            GENE_TREES+=($WORKING/inparalogs/$GENE/RAxML_bestTree.$GENE.tre)
+        elif [ -f $ALI_DIR/trees/CDS/RAxML_result.$GENE.constrained.tre ]; then
+            GENE_TREES+=($ALI_DIR/trees/CDS/RAxML_result.$GENE.constrained.tre)
+        fi
+    done
+    printf "***************************   Comparing gene trees to the supermatrix tree  ***************************\n"
+    echo "Starting concordance.py run on $(date)" >> $INPUT/log.txt
+    echo "concordance.py --constraint $CONSTRAINT_TREE --trees ... --out $CONCORDANCE_DIR --min_concordance $MIN_CONCORDANCE --threads $THREADS" >> $INPUT/log.txt
+    concordance.py --constraint $CONSTRAINT_TREE --trees ${GENE_TREES[@]} --out $CONCORDANCE_DIR --min_concordance $MIN_CONCORDANCE --threads $THREADS
+fi
+
 function EVAL_GENE {
     # Get a count on the number of species prior to collapse in paralogs
     SPECIES_PRESENT=$(find $WORKING/early_subset_sorted/CDS/$GENE/*.fas | wc -l)
@@ -144,15 +174,31 @@ function EVAL_GENE {
     else
         PERC_REMAINING_CHECK="FAIL"
     fi
-    # Now to report results in html files
-    FINAL_CHECK_TABLE="<table><thead><tr><th>Test</th><th>Value</th><th>Pass/Fail</th></tr></thead><tbody><tr><td>Percent Species Remaining (75%)</td><td>$PERC_REMAINING</td><td>$PERC_REMAINING_CHECK</td></tr><tr><td>Average Number Hits (1.1)</td><td>$PERC_HITS</td><td>$PERC_HITS_CHECK</td></tr><tr><td>Percent Top Hit Paralogous (15%)</td><td>$RATIO_DIST_PARA</td><td>$RATIO_DIST_PARA_CHECK</td></tr></tbody></table>"
-    sed -i "s,\(<\!--SPECIES TABLE-->\),$FINAL_CHECK_TABLE\n\1," $REPORT/genes/$GENE".html"
+    # Now to report results, one line for each row of the gene's table in the report. The lines of a
+    # gene are written together so genes checked at the same time do not mix.
+    ROWS=$(printf "%s\t%s\t%s\t%s\n" "$GENE" "Percent Species Remaining (75%)" "$PERC_REMAINING" "$PERC_REMAINING_CHECK" \
+        "$GENE" "Average Number Hits (1.1)" "$PERC_HITS" "$PERC_HITS_CHECK" \
+        "$GENE" "Percent Top Hit Paralogous (15%)" "$RATIO_DIST_PARA" "$RATIO_DIST_PARA_CHECK")
+    # Split concordance with the supermatrix tree is reported for review but does not change the
+    # revised gene list
+    if [ -f $CONCORDANCE_DIR/concordance.txt ]; then
+        CONCORDANCE=($(awk -v GENE=$GENE '$1 == GENE { print $8, $9 }' $CONCORDANCE_DIR/concordance.txt))
+        if [ ${#CONCORDANCE[@]} == 2 ]; then
+            ROWS="$ROWS"$'\n'$(printf "%s\t%s\t%s\t%s" "$GENE" "Split Concordance with Supermatrix Tree ($MIN_CONCORDANCE)" "${CONCORDANCE[0]}" "${CONCORDANCE[1]}")
+        fi
+    fi
+    printf "%s\n" "$ROWS" >> $WORKING/final_check_report.txt
 }
 export -f EVAL_GENE
 
+rm -f $WORKING/final_check_report.txt
 printf "%s\n" "${GENES[@]}" | xargs -n 1 -P $THREADS -I % bash -c 'GENE=%; \
     EVAL_GENE'
 
+# Add the results to the gene reports and write the report pages
+report.py --report $REPORT --stage loop_"$LOOP_NUMBER"/final_check table --rows $WORKING/final_check_report.txt
+report.py --report $REPORT render
+
 printf "*************************************************************\n\n\t
 \tReview the gene reports and the revised gene list written to\n\t $LOOP_DIR/lists/revised_genes.txt. Make any changes you wish then run\n\t pretree_loop.sh as follows:\n\n
 pretree_loop.sh -i $INPUT -s $LOOP_DIR/lists/species.txt $LOOP_DIR/lists/revised_genes.txt -p $WORKING/dist_m_zscore/CDS -t $THREADS
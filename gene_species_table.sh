@@ -4,10 +4,10 @@
 # with directories for each gene with individual fasta files within each gene directory
 # named for the species the sequence came from. It outputs a table in .csv format that
 # displays 0/1 to indicate the absence or presence of a gene (column) for a species
-# (row). I generally import this into Excel, transpose the table, and add percentage
-# calculations for each row and colum. Based on those data I determine which species and
-# genes should move forward in the pipeline by removing genes and species with a lot of
-# gaps.
+# (row). The table and lists of species and genes with few gaps suggested from it are
+# written by occupancy.py; see that script for how the lists are chosen. Review the
+# suggested lists (suggested_species.txt and suggested_genes.txt) before moving species
+# and genes forward in the pipeline.
 # Example Input:
 # Root:
 #     Gene001:
@@ -25,14 +25,13 @@
 #         Procyon_lotor.fas
 #         Canis_domesticus.fas
 #
-# This script takes two arguments:
+# This script takes two arguments (plus 2 optional ones):
 # 1) -i | --input_dir - The input directory as discussed above.
-# 2) -o | --output_dir - The directory to write the final .csv file and tmp files. WARNING: This directory must not contain files ending in .out.
+# 2) -o | --output_dir - The directory to write the final .csv file and the suggested lists.
+# 3) -go | --gene_occupancy - [OPTIONAL] The fraction of the suggested species each suggested gene must be found in (default 0.8).
+# 4) -so | --species_occupancy - [OPTIONAL] The fraction of the suggested genes each suggested species must have (default 0.8).
 #
 # Example Usage: gene_species_table.sh -i /home/mendezg/crawly_things/all_sorted -o /home/mendezg/crawly_things/gene_coverage_table
-#
-# Some would say this should have been done in python or perl. Some would say I should have used more arrays/hash tables.
-# I find this solution oddly amusing though.
 
 #Code to handle the named variable inputs:
 while [[ $# > 1 ]]
@@ -48,6 +47,14 @@ case $key in
     OUT="$2"
     shift # past argument
     ;;
+    -go|--gene_occupancy)
+    GENE_OCCUPANCY="$2"
+    shift # past argument
+    ;;
+    -so|--species_occupancy)
+    SPECIES_OCCUPANCY="$2"
+    shift # past argument
+    ;;
     *)
          # unknown option
     ;;
@@ -55,29 +62,4 @@ esac
 shift # past argument or value
 done
 
-mkdir -p $OUT
-mkdir -p $OUT/tmp/gene_species_table
-rm $OUT/tmp/gene_species_table/* 2> /dev/null
-rm $OUT/big_fat_table.csv 2> /dev/null
-cd $INPUT
-SPECIES=('Gene ID')
-SPECIES+=( $(find . -name '*.fas' -type f | sed 's#.*/##' | sort | uniq | sed 's,.fas,,') )
-(IFS=",$IFS"; printf '%s\n' "${SPECIES[*]}" >> $OUT/tmp/gene_species_table/species_names.txt)
-for GENE in *
-    do
-        cd $GENE
-        ARRAY=("$GENE")
-        for TAXON in ${SPECIES[@]:1}
-            do
-                if [ -e $TAXON.fas ]
-                    then
-                        ARRAY+=('1')
-                    else
-                        ARRAY+=('0')
-                fi
-            done
-        (IFS=",$IFS"; printf '%s\n' "${ARRAY[*]}" >> $OUT/tmp/gene_species_table/$GENE.out)
-        cd $INPUT
-    done
-cat $OUT/tmp/gene_species_table/species_names.txt $OUT/tmp/gene_species_table/*.out > $OUT/gene_species_table.csv
-rm $OUT/tmp/gene_species_table/*
+occupancy.py --input_dir $INPUT --output_dir $OUT --gene_occupancy ${GENE_OCCUPANCY:-0.8} --species_occupancy ${SPECIES_OCCUPANCY:-0.8}
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+#
+# get_seq.py
+#
+# This script writes the protein fasta file of every gene/species list made by ublast_lists.py, reading
+# the proteome of each species once from start to end instead of looking up every list in it.
+#
+# The sequence ids of all the lists of a species, one per line, go into one set. The proteome
+# SPECIES.fasta is then read in order, and every record whose id (the def-line up to the first space,
+# or the whole def-line) is in the set is kept. The outputs are written as GENE_SPECIES.faa once the
+# proteome has been read, with the sequences in the order of the list and in the format samtools
+# faidx gave: the def-line is the id alone and the sequence has 60 bases per line.
+#
+# This script takes 3 arguments (plus 2 optional ones):
+# 1) --input_dir | The directory with the .list files and the ublast_hits.txt table of ublast_lists.py.
+# 2) --fasta | The directory with the proteome of each species, SPECIES.fasta.
+# 3) --output_dir | The directory to write the fasta files to.
+# 4) --hits | [OPTIONAL] The table of lists (default INPUT_DIR/ublast_hits.txt).
+# 5) --threads | [OPTIONAL] The number of species to read at once (default 1).
+#
+# Usage: get_seq.py --input_dir big_ublast --fasta prot --output_dir get_seq --threads 24
+
+import sys, argparse, os
+from multiprocessing import Pool
+import fasta_index
+
+# Argument Parser
+parser = argparse.ArgumentParser(description = 'This script writes the protein fasta file of every gene/species list made by ublast_lists.py, reading the proteome of each species once.')
+parser.add_argument('--input_dir', required=True, help='The directory with the .list files and the ublast_hits.txt table of ublast_lists.py.')
+parser.add_argument('--fasta', required=True, help='The directory with the proteome of each species, SPECIES.fasta.')
+parser.add_argument('--output_dir', required=True, help='The directory to write the fasta files to.')
+parser.add_argument('--hits', help='[OPTIONAL] The table of lists (default INPUT_DIR/ublast_hits.txt).')
+parser.add_argument('--threads', type=int, default=1, help='[OPTIONAL] The number of species to read at once.')
+args = parser.parse_args()
+
+##### Functions
+def WRITE_FILE(OUT_FILE, TEXT):
+    TMP_FILE = '%s.%d.tmp' % ( OUT_FILE, os.getpid() )
+    with open(TMP_FILE, 'w') as OUT:
+        OUT.write(TEXT)
+    os.rename(TMP_FILE, OUT_FILE)
+
+def FASTA_RECORD(NAME, SEQUENCE):
+    WIDTH = fasta_index.LINE_WIDTH
+    return '>%s\n%s' % ( NAME, ''.join( SEQUENCE[START:START + WIDTH] + '\n' for START in range(0, len(SEQUENCE), WIDTH) ) )
+
+# Route the proteome of one species into the fasta files of all its lists
+def ROUTE_SPECIES(JOB):
+    SPECIES, LISTS = JOB
+    FASTA_FILE = '%s/%s.fasta' % ( args.fasta, SPECIES )
+    if not os.path.isfile(FASTA_FILE):
+        print('%s not found, skipping %s.' % ( FASTA_FILE, SPECIES ))
+        return
+    # The ids of each list in order, read a line at a time so ids may contain spaces
+    GENE_NAMES = []
+    WANTED = set()
+    for GENE, LIST_FILE in LISTS:
+        with open(LIST_FILE, 'r') as INPUT:
+            NAMES = [ LINE.rstrip('\n') for LINE in INPUT if LINE.strip() ]
+        GENE_NAMES.append(( GENE, NAMES ))
+        WANTED.update(NAMES)
+    RECORDS = {}
+    NAME = None
+    SEQUENCE = []
+    with open(FASTA_FILE, 'r') as INPUT:
+        for LINE in INPUT:
+            if LINE.startswith('>'):
+                if NAME is not None:
+                    RECORDS[NAME] = FASTA_RECORD(NAME, ''.join(SEQUENCE))
+                DEFLINE = LINE[1:].rstrip('\r\n')
+                FIELDS = DEFLINE.split(None, 1)
+                NAME = None
+                for ID in ( FIELDS[0] if FIELDS else '', DEFLINE ):
+                    if ID in WANTED and ID not in RECORDS:
+                        NAME = ID
+                        break
+                SEQUENCE = []
+            elif NAME is not None:
+                SEQUENCE.append(LINE.strip())
+    if NAME is not None:
+        RECORDS[NAME] = FASTA_RECORD(NAME, ''.join(SEQUENCE))
+    if len(RECORDS) < len(WANTED):
+        print('%s: %d listed sequences not found in %s' % ( SPECIES, len(WANTED) - len(RECORDS), FASTA_FILE ))
+    for GENE, NAMES in GENE_NAMES:
+        WRITE_FILE('%s/%s_%s.faa' % ( args.output_dir, GENE, SPECIES ), ''.join( RECORDS[NAME] for NAME in NAMES if NAME in RECORDS ))
+
+##### END FUNCTIONS
+
+# Group the lists by species
+HITS_FILE = args.hits if args.hits else '%s/ublast_hits.txt' % args.input_dir
+SPECIES_LISTS = {}
+with open(HITS_FILE, 'r') as INPUT:
+    next(INPUT)
+    for LINE in INPUT:
+        LIST_FILE, GENE, SPECIES, COUNT = LINE.rstrip('\n').split('\t')
+        SPECIES_LISTS.setdefault(SPECIES, []).append(( GENE, '%s/%s' % ( args.input_dir, LIST_FILE ) ))
+
+if not os.path.isdir(args.output_dir):
+    os.makedirs(args.output_dir)
+POOL = Pool(args.threads)
+POOL.map(ROUTE_SPECIES, sorted(SPECIES_LISTS.iteritems()), chunksize=1)
+POOL.close()
+POOL.join()
@@ -3,8 +3,8 @@
 # Author Gregory S Mendez
 #
 # This script quickly fetches sequences based on def-lines from a text file and writes a new fasta file.
-# It uses samtools faidx http://www.htslib.org to do the real work. This script just uses the text file
-# file names to set the input fasta file and output file name, and parallelizes the process using xargs.
+# It uses ublast_lists.py and get_seq.py to do the real work, reading each species proteome once. This
+# script just sets up the inputs and adds the ublast hit counts to the report data (see report.py).
 #
 # The script takes 4 arguments:
 # 1) -i | --input_dir - The directory containing the text files with the def-lines of the sequences to fetch.
@@ -56,55 +56,28 @@ esac
 shift # past argument or value
 done
 
-# Function to parse the input file name and set variables for gene name, species, translation locations, and output file
-function FIND_SPECIES_GENE()
-{
-        SPLIT_FILE=($(echo $1 | tr "\." "\n" | tr "_" "\n"))
-        unset SPLIT_FILE[${#SPLIT_FILE[@]}-1]
-        GENE=${SPLIT_FILE[0]}
-        SPECIES_SPACED=${SPLIT_FILE[@]:1}
-        SPECIES=${SPECIES_SPACED// /_}
-        PEP_FILE=$SPECIES'.fasta'
-        OUT_FILE=$GENE'_'$SPECIES'.faa'
-}
-# We need to export the function and variables so they can be used in the subshell
-export -f FIND_SPECIES_GENE
+# We need to export the variables so they can be used in the subshell
 export OUT
 export FASTA
 export THREADS
 export INPUT
 export REPORT
 cd $INPUT
-# First we need to create index files for each fasta file. faidx will do this on the fly on its own, but when we are doing this in a multithreaded
-# process as we do below then we can encounter times when the index creation is triggered and then another thread accesses that index before it
-# has been completed. This leads to errors where the desired sequence can not be found. So we'll just make the indexes first.
-printf "***********   Building Fasta Indexes on `date` ...\n"
-FASTA_FILES=($(find $FASTA/*.fasta -type f))
-printf "%s\n" "${FASTA_FILES[@]}" | xargs -n 1 -P $THREADS -I % samtools faidx %
 
-# Now we need to convert the output from ublast to a non-redundant list.
+# Now we need to convert the output from ublast to a non-redundant list. This also writes a table of
+# the list file, gene, species and number of hits of every list.
 printf "***********   Creating Non-Redundant Lists on `date` ...\n"
-FILE=($(find -name "*.txt" -type f | sed 's#.*/##' ))
-printf "%s\n" "${FILE[@]}" | xargs -n 1 -P $THREADS -I % bash -c 'IN=%; \
-    if [ -s $IN ]; \
-        then cat $IN | sort -u > $INPUT/${IN/txt/list}; \
-    fi'
+ublast_lists.py --input_dir $INPUT --summary $INPUT/ublast_hits.txt --threads $THREADS
 
-# send all the text files into a bash subshell (run X subshells at a time) and run samtools faidx (a tools to pull fasta sequences
-# out of a fasta file based on the def lines and do it right quick) on the files, feeding each line from the file to samfiles one at a time.
+# Write the protein file of every list. Each proteome is read once from start to end, and every
+# sequence in it goes to the files of all the genes that hit it.
 printf "***********   Writing Protein Files on `date` ...\n"
-FILE=($(find -name "*.list" -type f | sed 's#.*/##' ))
-printf "%s\n" "${FILE[@]}" | xargs -n 1 -P $THREADS -I % bash -c 'FIND_SPECIES_GENE %; sed -e "s/^/\"/g" -e "s/$/\"/g" % | xargs samtools faidx $FASTA/$PEP_FILE > $OUT/$OUT_FILE;\
-ROW=\<\!--ROW_"$SPECIES"--\> ;\
-COUNT=$(wc -l < %);\
-sed -i "s,$ROW,<td class=\"ublast\">$COUNT</td>$ROW," $REPORT/genes/$GENE".html";\
-ROW=\<\!--ROW_"$GENE"--\>;\
-sed -i "s,$ROW,<td class=\"ublast\">$COUNT</td>$ROW," $REPORT/species/$SPECIES".html"'
+get_seq.py --input_dir $INPUT --hits $INPUT/ublast_hits.txt --fasta $FASTA --output_dir $OUT --threads $THREADS
 
-# Add header column to gene report files and fill in zero counts in species and gene tables
-cd $REPORT/genes
-FILE=($(find *.html -type f | sed 's#.*/##'))
-printf "%s\n" "${FILE[@]}" | xargs -n 1 -P $THREADS -I % sed -i "s,\(<\!--THEAD-->\),<th>ublast hits</th>\1,;s,</a></td><\!,</a></td><td class='ublast'>0</td><\!," %
-cd $REPORT/species
-FILE=($(find *.html -type f -exec basename {} \;))
-printf "%s\n" "${FILE[@]}" | xargs -n 1 -P $THREADS -I % sed -i "s,\(<\!--THEAD-->\),<th>ublast hits</th>\1</tr>,;s,</a></td><\!,</a></td><td class='ublast'>0</td><\!," %
+# Add the ublast hit counts to the report. Each row of the hits table gives the list file, gene,
+# species and hit count. The cells go in a report data directory of the loop, not in $INPUT where
+# ublast_lists.py would read them as a ublast output.
+REPORT_DATA=${WORKING:-$(dirname $INPUT)}/report_get_seq
+mkdir -p $REPORT_DATA
+tail -n +2 $INPUT/ublast_hits.txt | cut -f 2-4 > $REPORT_DATA/cells.txt
+report.py --report $REPORT --stage loop_"$LOOP_NUMBER"/get_seq column --pages genes species --header 'ublast hits' --after '</tr>' --class ublast --default 0 --cells $REPORT_DATA/cells.txt
@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+#
+# hmm_cutoffs.py
+#
+# This script builds the HMM of each gene and the hmmsearch bitscore cut off the loop uses for it,
+# for new_score_genes.sh. Each gene is a fasta file of query sequences with description lines of
+# >[species name]___[gene name], and may have several sequences for a species.
+#
+# Each gene is aligned once with mafft --auto, and its HMM is built from that alignment (written to
+# OUTPUT_DIR/hmms as GENE.fasta and GENE.hmm). The cut off is found by leaving out each species in
+# turn: its rows are dropped from the gene alignment along with the columns that are then only gaps,
+# an HMM is built from what is left, and the sequences of the species left out are searched with it.
+# The best full sequence bitscore of each search (0 when nothing is found) is averaged over the
+# species, and half of the average is the cut off. The hmmbuild and hmmsearch runs of all the genes
+# are shared by a pool of workers. The averages are written to average.txt and the cut offs to
+# scores_cutoff.txt in OUTPUT_DIR, one "GENE SCORE" line for each gene, with 3 decimals as bc gave
+# them.
+#
+# This script takes 3 arguments (plus 1 optional one):
+# 1) --input_dir | The directory containing the fasta files to be scored.
+# 2) --extension | The file extension of the fasta input files (without the dot).
+# 3) --output_dir | The directory to write the HMMs and the cut off scores to.
+# 4) --threads | [OPTIONAL] The number of alignments, hmmbuild and hmmsearch runs to do at once (default 1).
+#
+# Usage: hmm_cutoffs.py --input_dir rebuilt_queries/query --extension fas --output_dir rebuilt_queries --threads 24
+
+import argparse, os, shutil, subprocess, sys
+from decimal import Decimal, ROUND_DOWN
+from glob import glob
+from multiprocessing import Pool
+import alignment
+
+# Argument Parser
+parser = argparse.ArgumentParser(description = 'This script builds the HMM of each gene and its hmmsearch bitscore cut off from leave one species out searches.')
+parser.add_argument('--input_dir', required=True, help='The directory containing the fasta files to be scored.')
+parser.add_argument('--extension', required=True, help='The file extension of the fasta input files (without the dot).')
+parser.add_argument('--output_dir', required=True, help='The directory to write the HMMs and the cut off scores to.')
+parser.add_argument('--threads', type=int, default=1, help='[OPTIONAL] The number of alignments, hmmbuild and hmmsearch runs to do at once.')
+args = parser.parse_args()
+
+HMM_DIR = os.path.join(args.output_dir, 'hmms')
+TMP_DIR = os.path.join(args.output_dir, 'tmp')
+
+##### Functions
+# The species of a description line, the first word up to ___
+def SPECIES_OF(HEADER):
+    FIELDS = HEADER[1:].split(None, 1)
+    return FIELDS[0].split('___')[0] if FIELDS else ''
+
+# The description line and sequence lines of every record of a fasta file
+def READ_RECORDS(FASTA_FILE):
+    RECORDS = []
+    with open(FASTA_FILE, 'rU') as INPUT:
+        for LINE in INPUT:
+            LINE = LINE.strip()
+            if LINE.startswith('>'):
+                RECORDS.append(( LINE, [] ))
+            elif LINE and RECORDS:
+                RECORDS[-1][1].append(LINE)
+    return RECORDS
+
+def RUN(COMMAND, OUTPUT=None):
+    with open(OUTPUT if OUTPUT else os.devnull, 'w') as OUT:
+        subprocess.check_call(COMMAND, stdout=OUT)
+
+# Align a gene and build its HMM, then write the alignment and sequences of each species left out.
+# Returns the gene and the leave one out jobs of its species.
+def ALIGN_GENE(FASTA_FILE):
+    GENE = os.path.basename(FASTA_FILE)[:-len(args.extension) - 1]
+    ALIGNED = '%s/%s.fasta' % ( HMM_DIR, GENE )
+    RECORDS = READ_RECORDS(FASTA_FILE)
+    SPECIES = [ SPECIES_OF(HEADER) for HEADER, LINES in RECORDS ]
+    try:
+        RUN([ 'mafft', '--quiet', '--auto', FASTA_FILE ], ALIGNED)
+        RUN([ 'hmmbuild', '--cpu', '1', '%s/%s.hmm' % ( HMM_DIR, GENE ), ALIGNED ])
+    except (OSError, subprocess.CalledProcessError) as ERROR:
+        sys.stderr.write('Could not build the HMM of %s: %s\n' % ( GENE, ERROR ))
+        return GENE, []
+    if len(set(SPECIES)) < 2:
+        sys.stderr.write('%s has sequences from less than 2 species, no cut off can be found for it.\n' % GENE)
+        return GENE, []
+    # mafft keeps the sequences in the order of the input file, so the rows of each species are known
+    ALIGNMENT = alignment.READ_FASTA(ALIGNED)
+    if len(ALIGNMENT['NAMES']) != len(RECORDS):
+        sys.stderr.write('The alignment of %s does not have a row for every sequence.\n' % GENE)
+        return GENE, []
+    GENE_DIR = os.path.join(TMP_DIR, GENE)
+    if not os.path.isdir(GENE_DIR):
+        os.makedirs(GENE_DIR)
+    GAP = ord('-')
+    JOBS = []
+    for LEFT_OUT in sorted(set(SPECIES)):
+        ROWS = [ ROW for ROW, NAME in enumerate(SPECIES) if NAME != LEFT_OUT ]
+        KEEP_COLUMNS = ( ALIGNMENT['MATRIX'][ROWS] != GAP ).any(axis=0)
+        alignment.WRITE_FASTA(alignment.SUBSET(ALIGNMENT, ROWS=ROWS, COLUMNS=KEEP_COLUMNS), '%s/allminus_%s.fa' % ( GENE_DIR, LEFT_OUT ))
+        with open('%s/%s.fsa' % ( GENE_DIR, LEFT_OUT ), 'w') as OUT:
+            for HEADER, LINES in RECORDS:
+                if SPECIES_OF(HEADER) == LEFT_OUT:
+                    OUT.write('%s\n%s\n' % ( HEADER, '\n'.join(LINES) ))
+        JOBS.append(( GENE, LEFT_OUT, GENE_DIR ))
+    return GENE, JOBS
+
+# The best full sequence score of a hmmsearch table, 0 when nothing was found (as bc read the line of
+# hmmsearch's no hits message)
+def BEST_SCORE(TABLE_FILE):
+    with open(TABLE_FILE, 'r') as TABLE:
+        for LINE in TABLE:
+            if not LINE.startswith('#'):
+                return Decimal(LINE.split()[5])
+    return Decimal(0)
+
+# Build the HMM of a gene without one species and search that species with it
+def SCORE_SPECIES(JOB):
+    GENE, LEFT_OUT, GENE_DIR = JOB
+    BASE = '%s/allminus_%s' % ( GENE_DIR, LEFT_OUT )
+    try:
+        RUN([ 'hmmbuild', '--cpu', '1', BASE + '.hmm', BASE + '.fa' ])
+        RUN([ 'hmmsearch', '--cpu', '1', '--tblout', BASE + '.tbl', BASE + '.hmm', '%s/%s.fsa' % ( GENE_DIR, LEFT_OUT ) ])
+        return GENE, BEST_SCORE(BASE + '.tbl')
+    except (OSError, subprocess.CalledProcessError, IndexError) as ERROR:
+        sys.stderr.write('Could not score %s left out of %s: %s\n' % ( LEFT_OUT, GENE, ERROR ))
+        return GENE, None
+
+def WRITE_SCORES(SCORES, OUT_FILE):
+    TMP_FILE = '%s.%d.tmp' % ( OUT_FILE, os.getpid() )
+    with open(TMP_FILE, 'w') as OUT:
+        for GENE, SCORE in SCORES:
+            OUT.write('%s %s\n' % ( GENE, SCORE ))
+    os.rename(TMP_FILE, OUT_FILE)
+
+##### END FUNCTIONS
+
+for DIRECTORY in ( HMM_DIR, TMP_DIR ):
+    if not os.path.isdir(DIRECTORY):
+        os.makedirs(DIRECTORY)
+FILES = sorted(glob('%s/*.%s' % ( args.input_dir, args.extension )))
+
+POOL = Pool(args.threads)
+GENES = POOL.map(ALIGN_GENE, FILES, chunksize=1)
+JOBS = [ JOB for GENE, GENE_JOBS in GENES for JOB in GENE_JOBS ]
+RESULTS = POOL.map(SCORE_SPECIES, JOBS, chunksize=1)
+POOL.close()
+POOL.join()
+
+# Average the scores of each gene and halve the average, both cut to 3 decimals as bc's scale=3
+GENE_SCORES = dict( ( GENE, [] ) for GENE, GENE_JOBS in GENES )
+for GENE, SCORE in RESULTS:
+    if SCORE is not None:
+        GENE_SCORES[GENE].append(SCORE)
+THOUSANDTH = Decimal('0.001')
+AVERAGES = []
+CUTOFFS = []
+for GENE, GENE_JOBS in GENES:
+    if not GENE_SCORES[GENE]:
+        continue
+    AVERAGE = ( sum(GENE_SCORES[GENE]) / len(GENE_SCORES[GENE]) ).quantize(THOUSANDTH, rounding=ROUND_DOWN)
+    AVERAGES.append(( GENE, AVERAGE ))
+    CUTOFFS.append(( GENE, ( AVERAGE / 2 ).quantize(THOUSANDTH, rounding=ROUND_DOWN) ))
+WRITE_SCORES(AVERAGES, os.path.join(args.output_dir, 'average.txt'))
+WRITE_SCORES(CUTOFFS, os.path.join(args.output_dir, 'scores_cutoff.txt'))
+shutil.rmtree(TMP_DIR)
+print('Found cut off scores for %d of %d genes.' % ( len(CUTOFFS), len(FILES) ))
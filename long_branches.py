@@ -9,66 +9,74 @@
 # also output a file with all the branch lengths and a histogram of the branch lengths
 # with the median length and the cutoff score indicated with lines.
 #
-# The script takes 4 arguments.
+# The script takes 4 arguments (plus an optional 5th, and a 6th with --tree_dir).
 # 1) --tree | Tree file in newick format
+# or --tree_dir | A directory of trees. The RAxML_result.GENE.constrained.tre file of every gene in --genes is analyzed
+# in this one process. A tree that can not be analyzed is reported and the other trees are still analyzed.
 # 2) --multi | Branch length cutoff multiplier. I suggest something around 5-10.
 # 3) --outgroups | A text document with your outgroups listed. The line should start
 # with the word Outgroup1 followed by a list of all the species in the outgroup with
 # everything separated by spaces. You can specify Outgroup2 and Outgroup3 on other lines
 # as backup outgroups if no species from your outgroup are present.
 # 4) --out_dir | The directory in which to save all output files.
+# 5) --threads | [OPTIONAL] Number of trees to analyze at once with --tree_dir (default 1).
+# 6) --genes | The genes to analyze with --tree_dir.
 #
 # Usage: long_branches.py --tree ~/constrained_trees/KOG0023.tre --multi 7 --outgroups ~/clades/outgroups.txt --out_dir ~/long_branches
+# Usage: long_branches.py --tree_dir ~/constrained_trees --genes KOG0023 KOG0024 --multi 7 --outgroups ~/clades/outgroups.txt --out_dir ~/long_branches --threads 8
 
-from Bio import Phylo
-import sys, argparse
+import sys, argparse, os
+from multiprocessing import Pool
 import numpy
 from numpy import median, absolute
-from glob import glob
 import matplotlib
 matplotlib.use('Agg')
 import matplotlib.pyplot as plt
-from ete2 import Tree, faces, AttrFace, TreeStyle, NodeStyle
+from ete2 import faces, AttrFace, TreeStyle, NodeStyle
+from rooting import READ_OUTGROUPS, ROOT_TREE
+import compact_tree
 
 # Argument Parser
 parser = argparse.ArgumentParser(description = 'This script analyses a tree file in newick format and generates a list of taxa with unusually long branches based on the median branch length within the tree. It will  also output a file with all the branch lengths and a histogram of the branch lengths with the median length and the cutoff score indicated with lines.')
 
-parser.add_argument('--tree', required=True, help='The Newick formatted tree file you want to analyze.')
+TREE_INPUT = parser.add_mutually_exclusive_group(required=True)
+TREE_INPUT.add_argument('--tree', help='The Newick formatted tree file you want to analyze.')
+TREE_INPUT.add_argument('--tree_dir', help='A directory of trees. The RAxML_result.GENE.constrained.tre file of every gene in --genes is analyzed.')
 parser.add_argument('--multi', required=True, help='The multiplier you want to use to set the cut-off. We recommend 5-10.')
 parser.add_argument('--outgroups', required=True, help='A text document with your outgroups listed. The line should start with the word Outgroup1 followed by a list of all the species in the outgroup with everything separated by spaces. You can specify Outgroup2 and Outgroup3 on other lines as backup outgroups if no species from your outgroup are present.')
 parser.add_argument('--out_dir', required=True, help='The directory in which to save all output files.')
+parser.add_argument('--threads', type=int, default=1, help='[OPTIONAL] Number of trees to analyze at once with --tree_dir.')
+parser.add_argument('--genes', nargs='+', help='The genes to analyze with --tree_dir.')
 args = parser.parse_args()
+if args.tree_dir and not args.genes:
+    parser.error('--tree_dir needs the genes to analyze in --genes.')
 
-#Set tree to the first command line argument (0 is the script itself)
-TREE = Phylo.read(args.tree, "newick")
-T = Tree(args.tree)
-GENE = args.tree.split(".")[1]
 MULTI = float(args.multi)
-OUTGROUP_FILE = open( args.outgroups, 'r' )
 OUT_DIR = args.out_dir
-OUTPUT = '%s/%s.txt' % (OUT_DIR, GENE)
 
 ##### Functions
-#### PHYLO BASED FUNCTIONS:
-# Name all unnamed clades
-def tabulate_names(TREE):
-    names = {}
-    for idx, clade in enumerate(TREE.find_clades()):
+#### TREE FUNCTIONS:
+# Clade names and branch lengths in preorder, read before the tree is rerooted. Unnamed clades are
+# named by their preorder index, so the names match the ones Bio.Phylo's find_clades gave.
+def preorder_branches(T):
+    names = []
+    lengths = []
+    for idx, clade in enumerate(T.traverse("preorder")):
         if clade.name:
-            clade.name = clade.name
+            names.append(clade.name)
         else:
-            clade.name = str(idx)
-        names[clade.name] = clade
-    return names
-# Search tree by clade name
-def lookup_by_names(TREE):
-    names = {}
-    for clade in TREE.find_clades():
-        if clade.name:
-            if clade.name in names:
-                raise ValueError("Duplicate key: %s" % clade.name)
-            names[clade.name] = clade
-    return names
+            names.append(str(idx))
+        lengths.append(clade.dist)
+    return names, lengths
+# Number of leaves below every clade, from a single postorder pass
+def clade_sizes(T):
+    sizes = {}
+    for clade in T.traverse("postorder"):
+        if clade.is_leaf():
+            sizes[clade] = 1
+        else:
+            sizes[clade] = sum(sizes[child] for child in clade.children)
+    return sizes
 #### ETE TOOLKIT BASED FUNCTIONS AND STYLES:
 ts = TreeStyle()
 ts.scale = 200
@@ -91,108 +99,86 @@ def cut(data, axis=None):
 
 ##### END FUNCTIONS
 
-# First name clades, generate list of branches, calculate some statistics
-# Run the name unnamed clades function
-tabulate_names(TREE)
-#Look up info by clade name:
-names = lookup_by_names(TREE)
-#Count species in tree:
-TOTAL_SPECIES = len(names['0'].get_terminals())
+# Read the outgroups once for every tree
+OUTGROUPS = READ_OUTGROUPS(args.outgroups)
+
+# Run the long branch test on one tree
+def LONG_BRANCHES(TREE_FILE):
+    #Read the tree once, through its compact sidecar in OUT/cache/trees
+    T = compact_tree.TO_ETE(compact_tree.LOAD_TREE(TREE_FILE, '%s/cache/trees' % OUT_DIR))
+    GENE = os.path.basename(TREE_FILE).split(".")[1]
+    OUTPUT = '%s/%s.txt' % (OUT_DIR, GENE)
+    # First name clades and generate the list of branches, before rooting changes them
+    clade_names, array_branch_lengths = preorder_branches(T)
+    TERMINALS = T.get_leaves()
+    #Count species in tree:
+    TOTAL_SPECIES = len(TERMINALS)
+
+    # Root the tree on the outgroup taxa that are present, or at the midpoint if there are none
+    ROOT_TREE(T, TREE_FILE, OUTGROUPS, CACHE_DIR='%s/cache/roots' % OUT_DIR)
+    #Print list of clade names and branch lengths and calculate the statistics once
+    MEDIAN = median(array_branch_lengths)
+    CUT_OFF = cut(array_branch_lengths)
+    with open (OUTPUT, 'w') as all_branch_lengths:
+        for name, length in zip(clade_names, array_branch_lengths):
+            all_branch_lengths.write('%s\t%s\n' % (name, length))
+        all_branch_lengths.write('MEDIAN\t%s\n' % (MEDIAN))
+        all_branch_lengths.write('MAD\t%s\n' % (mad(array_branch_lengths)))
+        all_branch_lengths.write('CUT_OFF\t%s\n' % (CUT_OFF))
+    ts.scale = 300 / max(array_branch_lengths)
+    # Generate Histograms of branch lengths with lines for median, and MAD Cut Off
+    X = array_branch_lengths
+    plt.hist(X, bins=20, color='c', label='Branch lengths')
+    plt.axvline(MEDIAN, color='b', linestyle='dashed', linewidth=2, label='Median')
+    plt.axvline(CUT_OFF, color='r', linestyle='dashed', linewidth=2, label='Cut off')
+    plt.xlabel("Value")
+    plt.ylabel("Frequency")
+    plt.legend(bbox_to_anchor=(0., 1.02, 1., .102), loc=3, ncol=3, mode="expand", borderaxespad=0.)
+    plt.savefig('%s/%s.hist.pdf' % (OUT_DIR, GENE))
+    plt.close()
 
-# Root the tree using the outgroup specified in the text file
-# First loop through text file and save the taxa from the Outgroup line to a list
-OUTGROUP1 = []
-OUTGROUP2 = []
-OUTGROUP3 = []
-# Make lists of each outgroup
-for LINE in OUTGROUP_FILE:
-    if LINE.split()[0] == "Outgroup1":
-        for OUT in LINE.split()[2:]:
-            OUTGROUP1.append( OUT )
-    if LINE.split()[0] == "Outgroup2":
-        for OUT in LINE.split()[2:]:
-            OUTGROUP2.append( OUT )
-    if LINE.split()[0] == "Outgroup3":
-        for OUT in LINE.split()[2:]:
-            OUTGROUP3.append( OUT )
-# Next check if our outgroup taxa are in the tree and create a new list of just species present.
-TREE_LIST = {}
-# Make list of all species in tree.
-for TERMINAL in names['0'].get_terminals():
-    SPECIES = TERMINAL.name.split("___")[0]
-    SEQID = TERMINAL.name.split("___")[1]
-    TREE_LIST[SPECIES] = SEQID
+    #Find Species that are the terminal nodes of any long branches and write the species to a text document
+    BadSpecies = []
+    SEEN = set()
+    # Clades inside a long branch clade that was already captured, their leaves are all in BadSpecies
+    CAPTURED = set()
+    SIZES = clade_sizes(T)
 
-NEW_OUTGROUP = []
-for SPECIES, SEQID in TREE_LIST.iteritems():
-    if SPECIES in OUTGROUP1:
-        FULL_NAME = "___".join( [ SPECIES, SEQID ] )
-        NEW_OUTGROUP.append( FULL_NAME )
-# Root tree using the Outgroup taxa that are present, and if no outgroup taxa are present use the midpoint method to root the tree.
-if len( NEW_OUTGROUP ) > 1:
-    ANCESTOR = T.get_common_ancestor( NEW_OUTGROUP )
-    T.set_outgroup( ANCESTOR )
-if len( NEW_OUTGROUP ) == 1:
-    T.set_outgroup( NEW_OUTGROUP[0] )
-if len( NEW_OUTGROUP ) < 1:
-    for SPECIES, SEQID in TREE_LIST.iteritems():
-        if SPECIES in OUTGROUP2:
-            FULL_NAME = "___".join( [ SPECIES, SEQID ] )
-            NEW_OUTGROUP.append( FULL_NAME )
-    if len( NEW_OUTGROUP ) > 1:
-        ANCESTOR = T.get_common_ancestor( NEW_OUTGROUP )
-        T.set_outgroup( ANCESTOR )
-    if len( NEW_OUTGROUP ) == 1:
-        T.set_outgroup( NEW_OUTGROUP[0] )
-    if len( NEW_OUTGROUP ) < 1:
-        for SPECIES, SEQID in TREE_LIST.iteritems():
-            if SPECIES in OUTGROUP3:
-                FULL_NAME = "___".join( [ SPECIES, SEQID ] )
-                NEW_OUTGROUP.append( FULL_NAME )
-        if len( NEW_OUTGROUP ) > 1:
-            ANCESTOR = T.get_common_ancestor( NEW_OUTGROUP )
-            T.set_outgroup( ANCESTOR )
-        if len( NEW_OUTGROUP ) == 1:
-            T.set_outgroup( NEW_OUTGROUP[0] )
-        if len( NEW_OUTGROUP ) < 1:
-            print("%s: No outgroup taxa present. Rooting at midpoint instead. This may break a monophyletic group." % args.tree )
-            R = T.get_midpoint_outgroup()
-            T.set_outgroup(R)
-#Print list of clade names and branch lengths and fill an array with the branch lengths
-array_branch_lengths = []
-with open (OUTPUT, 'w') as all_branch_lengths:
-    for clade in TREE.find_clades():
-        array_branch_lengths.append(clade.branch_length)
-        all_branch_lengths.write('%s\t%s\n' % (clade.name, clade.branch_length))
-    all_branch_lengths.write('MEDIAN\t%s\n' % (median(array_branch_lengths)))
-    all_branch_lengths.write('MAD\t%s\n' % (mad(array_branch_lengths)))
-    all_branch_lengths.write('CUT_OFF\t%s\n' % (cut(array_branch_lengths)))
-ts.scale = 300 / max(array_branch_lengths)
-# Generate Histograms of branch lengths with lines for median, and MAD Cut Off
-X = array_branch_lengths
-plt.hist(X, bins=20, color='c', label='Branch lengths')
-plt.axvline(median(array_branch_lengths), color='b', linestyle='dashed', linewidth=2, label='Median')
-plt.axvline(cut(array_branch_lengths), color='r', linestyle='dashed', linewidth=2, label='Cut off')
-plt.xlabel("Value")
-plt.ylabel("Frequency")
-plt.legend(bbox_to_anchor=(0., 1.02, 1., .102), loc=3, ncol=3, mode="expand", borderaxespad=0.)
-plt.savefig('%s/%s.hist.pdf' % (OUT_DIR, GENE))
-plt.close()
+    # Write a new tree file with the long branches indicated and their clades indicated
+    for CLADE in T.traverse():
+        CLADE.set_style(nstyle)
+        if CLADE.up in CAPTURED:
+            CAPTURED.add(CLADE)
+        if SIZES[CLADE] < TOTAL_SPECIES * .5:
+            if CLADE.dist > CUT_OFF:
+                CLADE.img_style = RED
+                if CLADE not in CAPTURED:
+                    CAPTURED.add(CLADE)
+                    for SPECIES in CLADE.iter_leaves():
+                        if SPECIES.name not in SEEN:
+                            SEEN.add(SPECIES.name)
+                            BadSpecies.append(SPECIES.name)
+    T.render( '%s/%s.tre.pdf' % ( OUT_DIR, GENE ), tree_style=ts)
+    with open ( '%s/longbranch_taxa.%s.txt' % ( OUT_DIR, GENE ), 'w') as LONG_OUT:
+        for OTU in BadSpecies:
+            print>>LONG_OUT, OTU.split("___")[0]
 
-#Find Species that are the terminal nodes of any long branches and write the species to a text document
-BadSpecies = []
+# Pool worker: a tree that fails is reported instead of stopping the other trees
+def LONG_BRANCHES_WORKER(TREE_FILE):
+    try:
+        LONG_BRANCHES(TREE_FILE)
+        return True
+    except Exception as ERROR:
+        sys.stderr.write('Could not analyze %s: %s\n' % ( TREE_FILE, ERROR ))
+        return False
 
-# Write a new tree file with the long branches indicated and their clades indicated
-for CLADE in T.traverse():
-    CLADE.set_style(nstyle)
-    if len(CLADE) < TOTAL_SPECIES * .5:
-        if CLADE.dist > cut(array_branch_lengths):
-            CLADE.img_style = RED
-            CAPTURE = CLADE.get_leaves()
-            for SPECIES in CAPTURE:
-                if SPECIES.name not in BadSpecies:
-                    BadSpecies.append(SPECIES.name)
-T.render( '%s/%s.tre.pdf' % ( OUT_DIR, GENE ), tree_style=ts)
-with open ( '%s/longbranch_taxa.%s.txt' % ( OUT_DIR, GENE ), 'w') as LONG_OUT:
-    for OTU in BadSpecies:
-        print>>LONG_OUT, OTU.split("___")[0]
+# Analyze one tree, or the constrained tree of every gene spread over a pool of workers
+if args.tree:
+    LONG_BRANCHES(args.tree)
+else:
+    TREE_FILES = [ '%s/RAxML_result.%s.constrained.tre' % ( args.tree_dir, GENE ) for GENE in args.genes ]
+    POOL = Pool(args.threads)
+    DONE = POOL.map(LONG_BRANCHES_WORKER, TREE_FILES, chunksize=1)
+    POOL.close()
+    POOL.join()
+    print('Analyzed %d of %d trees.' % ( sum(DONE), len(TREE_FILES) ))
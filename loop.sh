@@ -27,7 +27,7 @@
 # 4) hmm_from_pep.sh - This performs and hmmsearch on each sequence from the blast search to filter the results based on the cutoff scores
 # 5) parse_hmm_search.py - This generates a text file form the hmmsearch output needed to lookup the sequences
 # 6) write_cds_pep.sh - This uses the text file generated by parse_hmm_search.py to write a dna and peptide file for each sequence
-# 7) gene_species_table.sh - This generates a table (in csv format) indicating the presence or absence of genes in the species searched.
+# 7) gene_species_table.sh - This generates a table (in csv format) indicating the presence or absence of genes in the species searched, and suggests species and gene lists with few gaps.
 # 8) degenerate.py - This script converts the 3rd codon position in DNA fasta files to a degenerate base synonymous with the same codon.
 #
 # Named variables. Every run needs the following defined:
@@ -86,6 +86,7 @@ mkdir -p $MASTER_OUT/"loop_"$LOOP_NUMBER"_out/tmp"
 LOOP_DIR=$MASTER_OUT/"loop_"$LOOP_NUMBER"_out"
 WORKING=$MASTER_OUT/"loop_"$LOOP_NUMBER"_out/tmp"
 export WORKING
+export LOOP_NUMBER
 mkdir -p $WORKING/blast_dbs
 DBS=$WORKING/blast_dbs
 export DBS
@@ -123,7 +124,7 @@ if [ $LOOP_NUMBER -eq 1 ]; then
     printf "***********   Starting degenerate.py DNA `date` ...\n"
     cd $DNA
      FILE=($(find $PROT/*.fasta -type f | sed 's#.*/##' | sed 's,.fasta,,' ))
-    printf "%s\n" "${FILE[@]}" | xargs -n 1 -P $THREADS -I % degenerate.py --dna %".fasta"
+    degenerate.py --dna $(printf "%s.fasta " "${FILE[@]}") --threads $THREADS
     mkdir $MASTER_OUT/CDS_degenerate_seqs
     mv *.deg.fas $MASTER_OUT/CDS_degenerate_seqs
     cd $MASTER_OUT/CDS_degenerate_seqs
@@ -147,38 +148,15 @@ if [ $LOOP_NUMBER -eq 1 ]; then
     ### Create initial report files
     ##################################################################
 
-    # Create report directory and index page
+    # Create report directory. The species and genes of the report go in its data file, and the
+    # pages are written from the templates by report.py render at the end of each step.
     mkdir $MASTER_OUT/report
-    cp $TEMPLATE/index.html $REPORT/index.html
     cp $TEMPLATE/styles.css $REPORT/styles.css
-
-    # Generate species list and create report pages for each species
-    mkdir $REPORT/species
     cd $PROT
-    SPECIES=( $(find . -name '*.fasta' -type f | sed 's#.*/##' | sort | uniq | sed 's,.fasta,,') )
-    printf "%s\n" "${SPECIES[@]}" | xargs -n 1 -P 1 -I %x bash -c 'SPECIES=%x;\
-        cp $TEMPLATE/species.html $REPORT/species/$SPECIES".html";\
-        sed -i "s,<\!--SPECIES-->,$SPECIES,g" $REPORT/species/$SPECIES".html";\
-        printf "\t\t\t<tr><td><a href=\"../species/%s.html\">%s</a></td><!--"ROW_$SPECIES"--></tr>\n" "$SPECIES" "$SPECIES" >> $REPORT/species/species_table.txt;\'
-
-    # Generate gene list and create report pages for each gene
-    mkdir $REPORT/genes
+    find . -name '*.fasta' -type f | sed 's#.*/##' | sort | uniq | sed 's,.fasta,,' > $REPORT/species.txt
     cd $QUERY
-    GENES=( $( find . -name "*.fas" -type f | sed 's#.*/##' | sort | sed 's,.fas,,' ) )
-    printf "%s\n" "${GENES[@]}" | xargs -n 1 -P 1 -I %x bash -c 'GENE=%x;\
-        cp $TEMPLATE/gene.html $REPORT/genes/$GENE".html";\
-        sed -i "s,<\!--GENE-->,$GENE,g" $REPORT/genes/$GENE".html";\
-        LINE=21;\
-        sed -i "${LINE}r $REPORT/species/species_table.txt" $REPORT/genes/$GENE".html"
-        printf "\t\t\t<tr><td><a href=\"../genes/%s.html\">%s</a></td><!--ROW_"$GENE"--></tr>\n" "$GENE" "$GENE" >> $REPORT/genes/gene_table.txt'
-    printf "%s\n" "${SPECIES[@]}" | xargs -n 1 -P $THREADS -I % bash -c 'LINE=21;\
-        sed -i "${LINE}r $REPORT/genes/gene_table.txt" $REPORT/species/%".html"'
-    # Now add species and gene tables to the index page.
-    LINE=37
-    sed -i "${LINE}r $REPORT/species/species_table.txt" $REPORT/index.html
-    LINE=24
-    sed -i "${LINE}r $REPORT/genes/gene_table.txt" $REPORT/index.html
-    sed -i "s,href=\"../,href=\"," $REPORT/index.html
+    find . -name "*.fas" -type f | sed 's#.*/##' | sort | sed 's,.fas,,' > $REPORT/genes.txt
+    report.py --report $REPORT pages --template $TEMPLATE --species $REPORT/species.txt --genes $REPORT/genes.txt
 fi
 
 ##################################################################
@@ -223,49 +201,14 @@ hmm_from_pep.sh -hmm $HMM_DIR -c $CUTOFF_FILE -i $WORKING/get_seq -o $WORKING/hm
 
 # Parse the hmmsearch output to generate text files for lookup
 echo "Starting parse_hmm_search.py run on $(date)" >> $MASTER_OUT/log.txt
-echo "parse_hmm_search.py --hmm $WORKING/hmmsearch/ --outdir $WORKING/parse_hmm_search/" >> $MASTER_OUT/log.txt
+echo "parse_hmm_search.py --hmm $WORKING/hmmsearch/ --outdir $WORKING/parse_hmm_search/ --threads $THREADS" >> $MASTER_OUT/log.txt
 printf "***********   Starting parse_hmm_search.py on `date` ...\n"
-parse_hmm_search.py --hmm $WORKING/hmmsearch/ --outdir $WORKING/parse_hmm_search/
-
-# Add Hmmsearch hit counts to report table
-# Function to parse the input file name and set variables for gene name, species
-function FIND_SPECIES_GENE()
-{
-    SPLIT_FILE=($(echo $1 | tr "\." "\n" | tr "_" "\n"))
-    unset SPLIT_FILE[${#SPLIT_FILE[@]}-1]
-    GENE=${SPLIT_FILE[0]}
-    SPECIES_SPACED=${SPLIT_FILE[@]:1}
-    SPECIES=${SPECIES_SPACED// /_}
-}
-function ADD_COLUMN () {
-	FILE=$1
-	FIND_SPECIES_GENE $FILE
-    RPATH=../OtherHits
-	if [ -f $RPATH/$FILE ]
-		then OFILE=$RPATH/$FILE
-		OCOUNT=$(wc -l < $OFILE)
-		else OCOUNT=0
-	fi
-	ONE=1
-	ROW=\<\!--ROW_"$SPECIES"--\>
-	TOTAL=$(($ONE + $OCOUNT))
- 	sed -i "s,$ROW,<td class='hmm'>$TOTAL</td>$ROW," $REPORT/genes/$GENE".html"
-	ROW=\<\!--ROW_"$GENE"--\>
-	sed -i "s,$ROW,<td class='hmm'>$TOTAL</td>$ROW," $REPORT/species/$SPECIES".html"
-}
-export -f ADD_COLUMN
-export -f FIND_SPECIES_GENE
-cd $WORKING/parse_hmm_search/TopHits
-FILE=($(find -name "*.txt" -type f | sed 's#.*/##' ))
-printf "%s\n" "${FILE[@]}" | xargs -n 1 -P $THREADS -I % bash -c 'ADD_COLUMN %'
-
-# Add header column to gene report files and fill in zero counts in species and gene tables
-cd $REPORT/genes
-FILE=($(find *.html -type f | sed 's#.*/##'))
-printf "%s\n" "${FILE[@]}" | xargs -n 1 -P $THREADS -I % sed -i "s,\(<\!--THEAD-->\),<th>hmmsearch hits</th>\1,;s,\(<td class=\"ublast\">[0-9]*</td>\)<\!,\1<td class='hmm'>0</td><\!," %
-cd $REPORT/species
-FILE=($(find *.html -type f -exec basename {} \;))
-printf "%s\n" "${FILE[@]}" | xargs -n 1 -P $THREADS -I % sed -i "s,\(<\!--THEAD-->\),<th>hmmsearch hits</th>\1,;s,\(<td class=\"ublast\">[0-9]*</td>\)<\!,\1<td class='hmm'>0</td><\!," %
+parse_hmm_search.py --hmm $WORKING/hmmsearch/ --outdir $WORKING/parse_hmm_search/ --threads $THREADS
+
+# Add Hmmsearch hit counts to report table. parse_hmm_search.py writes the number of hits of each
+# gene and species to hmm_hits.txt
+tail -n +2 $WORKING/parse_hmm_search/hmm_hits.txt > $WORKING/parse_hmm_search/report_cells.txt
+report.py --report $REPORT --stage loop_"$LOOP_NUMBER"/loop column --pages genes species --header 'hmmsearch hits' --class hmm --default 0 --cells $WORKING/parse_hmm_search/report_cells.txt
 
 # Write final sequence files from text files from parse_hmm_search.py
 echo "Starting write_cds_pep.sh run on $(date)" >> $MASTER_OUT/log.txt
@@ -283,11 +226,16 @@ echo "gene_species_table.sh -i $LOOP_DIR/sequences/TopHits/CDS -o $LOOP_DIR" >>
 printf "***********   Starting gene_species_table.sh on `date` ...\n"
 gene_species_table.sh -i $LOOP_DIR/sequences/TopHits/CDS -o $LOOP_DIR
 
+# Write the report pages
+echo "report.py --report $REPORT render" >> $MASTER_OUT/log.txt
+report.py --report $REPORT render
+
 if [ $LOOP_NUMBER -eq 1 ]; then
 
 printf "*************************************************************\n\n\t
-\tReview the table printed to gene_species_table.csv. Generate species and\n
-\tgene lists\n\tthat include a set of species and genes with very few gaps in\n
+\tReview the table printed to gene_species_table.csv and the species and gene\n
+\tlists suggested from it in suggested_species.txt and suggested_genes.txt.\n
+\tEdit the lists so they include a set of species and genes with very few gaps in\n
 \tthe data. Then run the \n\tpretree_loop.sh script to generate alignments for\n
 \ttree finding. We recoomend placing your species.txt and genes.txt file in loop_1_out/lists. \n\n
 pretree_loop.sh -i $MASTER_OUT -s $LOOP_DIR/lists/species.txt -g $LOOP_DIR/lists/genes.txt -t $THREADS
@@ -297,8 +245,9 @@ pretree_loop.sh -i $MASTER_OUT -s $LOOP_DIR/lists/species.txt -g $LOOP_DIR/lists
 else
 
 printf "*************************************************************\n\n\t
-\tReview the table printed to gene_species_table.csv. Generate species and\n
-\tgene lists\n\tthat include a set of species and genes with very few gaps in\n
+\tReview the table printed to gene_species_table.csv and the species and gene\n
+\tlists suggested from it in suggested_species.txt and suggested_genes.txt.\n
+\tEdit the lists so they include a set of species and genes with very few gaps in\n
 \tthe data. Then run the \n\tfinal_check.sh script to do final analyses and get\n
 \t suggestions on which genes to use. We recoomend placing your species.txt and genes.txt file in loop_1_out/lists and your outgroups file in your main directory. \n\n
 final_check.sh -i $MASTER_OUT -s $LOOP_DIR/lists/species.txt -g $LOOP_DIR/lists/genes.txt -og $MASTER_OUT/outgroups.txt -t $THREADS
@@ -9,7 +9,11 @@
 # Multiple sequences for each gene are required.
 #
 # The output will be a directory containing HMMs (and alignments) for each gene and 2 files:
-# averages.txt and score_cutoffs.txt
+# average.txt and scores_cutoff.txt
+#
+# The HMMs and cut offs are made by hmm_cutoffs.py. Each gene is aligned once, and the cut off is
+# half of the average bitscore of each species searched with an HMM built from the gene alignment
+# without that species; see that script for how.
 #
 # The input files MUST be named as follows:
 # fasta filename = [gene name].[extension]
@@ -22,7 +26,7 @@
 # This script takes 4 named variables:
 # 1) -i | --input_dir - The directory containing the fasta files to be scored.
 # 2) -e | --extension - The file extension of the fasta input files. (Do not include the dot)
-# 3) -t | --threads - The number of threads to use. Each thread will allow for another gene cutoff score to be calculated in parellel.
+# 3) -t | --threads - The number of threads to use. Each thread will allow for another alignment, hmmbuild or hmmsearch to be run in parallel.
 # 4) -o | --output_dir - The directory where you want the cutoff scores written.
 
 #Code to handle the named variable inputs:
@@ -54,92 +58,4 @@ esac
 shift # past argument or value
 done
 
-# Function to find the gene and species names from given description lines
-function FIND_SPECIES()
-{
-    SPLIT_FILE=($(echo $1 | tr " " "\n" | sed 's,___,\n,g' ))
-    SPECIES=$( echo ${SPLIT_FILE[0]} | sed -e 's,>,,' )
-}
-# Function to break multi-fasta file into individual fasta files named as needed
-function SPLIT_MULTI_FASTA() {
-    INPUT=$1
-    OUTPUT=$2/tmp/$GENE
-    while read LINE
-        do
-            if [[ $LINE =~ ^\> ]]
-                then
-                    FIND_SPECIES $LINE
-                    echo $LINE >> $OUTPUT/$SPECIES".fsa"
-                else
-                    if [[ $LINE == *\* ]]
-                        then
-                            NEW_LINE=${LINE/\*/__STOP_CODON__}
-                            echo $NEW_LINE >> $OUTPUT/$SPECIES".fsa"
-                        else
-                            echo $LINE >> $OUTPUT/$SPECIES".fsa"
-                    fi
-            fi
-            sed -i 's,__STOP_CODON__,\*,g' $OUTPUT/$SPECIES".fsa"
-        done < $INPUT
-}
-
-#################################
-# WORK
-#################################
-
-# make a temporary directory
-mkdir -p $OUT/tmp
-mkdir -p $OUT/hmms
-# move into the input directory
-cd $IN
-
-# Inside each subshell we are first breaking each multi-fasta file into individual
-# fasta files for each sequence, then creating a list of all those single sequence
-# files. We then loop through that list and create an alignment for every combination
-# of sequences missing one of the sequences. An hmm is built for each of those alignments
-# and hmmsearch is run with the missing sequences vs the hmm that doesn't contain it.
-# The bitscores from all of these searches is averaged and then divided by 2 to generate
-# a cut off score for that gene. The averages are saved to averages.txt and the cutoff scores
-# are saved to score_cutoffs.txt.
-function CALC_SCORES() {
-    GENE=${FILE/.$EXT/}
-    mkdir $OUT/tmp/$GENE
-    SPLIT_MULTI_FASTA $FILE $OUT
-    cd $OUT/tmp/$GENE
-    ALIGNMENT=(*.fsa)
-    for j in ${ALIGNMENT[@]}
-        do ARRAY_BOB=(${ALIGNMENT[@]/$j})
-            cat ${ARRAY_BOB[@]} > allminus_${j/fsa/fasta}
-            mafft --quiet --auto allminus_${j/fsa/fasta} > allminus_${j/fsa/fa}
-            hmmbuild allminus_${j/fsa/hmm} allminus_${j/fsa/fa}
-            hmmsearch allminus_${j/fsa/hmm} $j > ${j/fsa/out}
-        done
-    MATHS=0
-    for h in *.out
-        do SCORE=($(sed -n "15 p" $h))
-            NUMBER=${SCORE[1]}
-            MATHS=$(echo $NUMBER + $MATHS | bc -l)
-            ITEMS=$(ls *.out | wc -l)
-        done
-    AVERAGE=$(echo "scale=3; $MATHS/$ITEMS" | bc -l)
-    CUTOFF=$(echo "scale=3; $AVERAGE/2" | bc -l)
-    echo $GENE $AVERAGE >> $OUT/average.txt
-    echo $GENE $CUTOFF >> $OUT/scores_cutoff.txt
-}
-# make variables and funtions available to our subshells
-export EXT
-export OUT
-export IN
-export -f SPLIT_MULTI_FASTA
-export -f FIND_SPECIES
-export -f CALC_SCORES
-
-# Feed everything ending in specified extension into its own sub shell to calculate scores.
-# Then create alignments and build HMMs from the alignments.
-find *.$EXT | xargs -n 1 -P $THREADS -I % bash -c 'FILE=% ; \
-    CALC_SCORES ; \
-    cd $IN ; \
-    mafft --quiet --auto $FILE > $OUT/hmms/$GENE.fasta ; \
-    hmmbuild $OUT/hmms/$GENE.hmm $OUT/hmms/$GENE.fasta'
-# delete the tmp directory
-rm -r $OUT/tmp
+hmm_cutoffs.py --input_dir $IN --extension $EXT --output_dir $OUT --threads $THREADS
@@ -3,27 +3,60 @@
 # Author: Gregory S Mendez
 
 # This script will convert a nexus alignment to phylip.
+# With --input_dir it converts every nexus file in a directory in this one process, with a pool of
+# workers, instead of one run of the script for each file.
 
 # Named variables. Every run needs the following defined:
 # 1) --input - The input file in nexus format.
+# or --input_dir - A directory of nexus files. Each FILE.EXTENSION is written to OUT_DIR/FILE.phy.
 # 2) --out - The filename and file path desired for the output phylip file.
+# or --out_dir - The directory for the phylip files of --input_dir.
+# 3) --extension - [OPTIONAL] The extension of the nexus files in --input_dir (default nex).
+# 4) --threads - [OPTIONAL] The number of files to convert at once with --input_dir (default 1).
 
-from Bio import AlignIO
-import argparse
+import argparse, os, sys
+from glob import glob
+from multiprocessing import Pool
+import alignment
 
 # Argument Parser
-parser = argparse.ArgumentParser(description = 'This script will create a super matrix alignment file from input alignments')
-parser.add_argument('--input', required=True, help='The input file in nexus format.')
-parser.add_argument('--out', required=True, help='The filename of the output file.')
-args = parser.parse_args() 
-
-INPUT = args.input
-OUT = args.out
-input_handle = open( INPUT, "rU")
-output_handle = open( OUT, "w")
- 
-ALIGNMENT = AlignIO.parse(input_handle, "nexus")
-AlignIO.write(ALIGNMENT, output_handle, "phylip-relaxed")
- 
-output_handle.close()
-input_handle.close()
\ No newline at end of file
+parser = argparse.ArgumentParser(description = 'This script will convert a nexus alignment to phylip.')
+INPUT_FILES = parser.add_mutually_exclusive_group(required=True)
+INPUT_FILES.add_argument('--input', help='The input file in nexus format.')
+INPUT_FILES.add_argument('--input_dir', help='A directory of nexus files to convert.')
+OUTPUT_FILES = parser.add_mutually_exclusive_group(required=True)
+OUTPUT_FILES.add_argument('--out', help='The filename of the output file.')
+OUTPUT_FILES.add_argument('--out_dir', help='The directory for the phylip files of --input_dir.')
+parser.add_argument('--extension', default='nex', help='[OPTIONAL] The extension of the nexus files in --input_dir.')
+parser.add_argument('--threads', type=int, default=1, help='[OPTIONAL] The number of files to convert at once with --input_dir.')
+args = parser.parse_args()
+
+##### Functions
+def CONVERT(JOB):
+    INPUT, OUT = JOB
+    try:
+        alignment.WRITE_PHYLIP(alignment.READ_NEXUS(INPUT), OUT)
+    except Exception as ERROR:
+        sys.stderr.write('Could not convert %s: %s\n' % ( INPUT, ERROR ))
+        return False
+    return True
+
+##### END FUNCTIONS
+
+if args.input:
+    if not args.out:
+        parser.error('--input needs --out')
+    if not CONVERT(( args.input, args.out )):
+        sys.exit(1)
+else:
+    if not args.out_dir:
+        parser.error('--input_dir needs --out_dir')
+    if not os.path.isdir(args.out_dir):
+        os.makedirs(args.out_dir)
+    JOBS = [ ( INPUT, '%s/%s.phy' % ( args.out_dir, os.path.basename(INPUT)[:-len(args.extension) - 1] ) )
+             for INPUT in sorted(glob('%s/*.%s' % ( args.input_dir, args.extension ))) ]
+    POOL = Pool(args.threads)
+    RESULTS = POOL.map(CONVERT, JOBS, chunksize=1)
+    POOL.close()
+    POOL.join()
+    print('Converted %d of %d nexus files to phylip.' % ( sum(RESULTS), len(JOBS) ))
@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+#
+# occupancy.py
+#
+# This script builds the gene/species occupancy matrix, a boolean array with a row for every gene
+# and a column for every species that is True when the gene was found in the species, and proposes
+# species and gene lists with few gaps for pretree_loop.sh.
+#
+# The matrix is read from a directory like TopHits/CDS, with a directory for each gene holding one
+# SPECIES.fas file for each species it was found in, listing each gene directory once. It can also
+# be read from a hit table with gene, species and hits columns (such as the hmm_hits.txt of
+# parse_hmm_search.py or the ublast_hits.txt of ublast_lists.py), where a gene is present in a
+# species with one hit or more. The matrix is written as gene_species_table.csv, the table
+# gene_species_table.sh wrote: a header of Gene ID and the species, then a row of 0/1 for each gene.
+#
+# The lists are chosen greedily. While some gene is found in less than --gene_occupancy of the kept
+# species or some species has less than --species_occupancy of the kept genes, the gene or species
+# furthest below its target is removed (on ties the one with the fewest sequences, then the last
+# name). The removed genes and species are then added back, the most complete first, when they meet
+# their target without taking any kept gene or species below its own. The suggested lists are
+# written as suggested_species.txt and suggested_genes.txt, with a summary of the occupancy of each
+# gene and species in occupancy.txt.
+#
+# This script takes 2 arguments (plus 3 optional ones):
+# 1) --input_dir | The directory with a directory of SPECIES.fas files for each gene.
+# or --hits | A tab separated table with a header line and gene, species and hits columns.
+# 2) --output_dir | The directory to write the table and the suggested lists to.
+# 3) --gene_occupancy | [OPTIONAL] The fraction of the suggested species each suggested gene must be found in (default 0.8).
+# 4) --species_occupancy | [OPTIONAL] The fraction of the suggested genes each suggested species must have (default 0.8).
+# 5) --keep_species | [OPTIONAL] A file of species, one on each line, to suggest even if they fall below the target.
+#
+# Usage: occupancy.py --input_dir loop_1_out/sequences/TopHits/CDS --output_dir loop_1_out
+# Usage: occupancy.py --hits loop_1_out/tmp/parse_hmm_search/hmm_hits.txt --output_dir loop_1_out --gene_occupancy 0.9
+
+import sys, argparse, os
+import numpy
+
+# Argument Parser
+parser = argparse.ArgumentParser(description = 'This script builds the gene/species occupancy matrix and proposes species and gene lists that meet a target occupancy.')
+MATRIX_INPUT = parser.add_mutually_exclusive_group(required=True)
+MATRIX_INPUT.add_argument('--input_dir', help='The directory with a directory of SPECIES.fas files for each gene.')
+MATRIX_INPUT.add_argument('--hits', help='A tab separated table with a header line and gene, species and hits columns.')
+parser.add_argument('--output_dir', required=True, help='The directory to write the table and the suggested lists to.')
+parser.add_argument('--gene_occupancy', type=float, default=0.8, help='[OPTIONAL] The fraction of the suggested species each suggested gene must be found in.')
+parser.add_argument('--species_occupancy', type=float, default=0.8, help='[OPTIONAL] The fraction of the suggested genes each suggested species must have.')
+parser.add_argument('--keep_species', help='[OPTIONAL] A file of species, one on each line, to suggest even if they fall below the target.')
+args = parser.parse_args()
+
+##### Functions
+# The genes, species and matrix of a directory of gene directories
+def READ_DIR(INPUT_DIR):
+    FOUND = {}
+    for GENE in os.listdir(INPUT_DIR):
+        if os.path.isdir(os.path.join(INPUT_DIR, GENE)):
+            FOUND[GENE] = set( FILE_NAME[:-4] for FILE_NAME in os.listdir(os.path.join(INPUT_DIR, GENE)) if FILE_NAME.endswith('.fas') )
+    return MATRIX(FOUND)
+
+# The genes, species and matrix of a hit table
+def READ_HITS(HITS_FILE):
+    FOUND = {}
+    with open(HITS_FILE, 'r') as INPUT:
+        HEADER = INPUT.readline().rstrip('\n').split('\t')
+        GENE_COLUMN, SPECIES_COLUMN, HITS_COLUMN = HEADER.index('gene'), HEADER.index('species'), HEADER.index('hits')
+        for LINE in INPUT:
+            FIELDS = LINE.rstrip('\n').split('\t')
+            if len(FIELDS) < len(HEADER):
+                continue
+            SPECIES = FOUND.setdefault(FIELDS[GENE_COLUMN], set())
+            if int(FIELDS[HITS_COLUMN]) > 0:
+                SPECIES.add(FIELDS[SPECIES_COLUMN])
+    return MATRIX(FOUND)
+
+def MATRIX(FOUND):
+    GENES = sorted(FOUND)
+    SPECIES = sorted(set().union(*FOUND.values())) if FOUND else []
+    COLUMN = dict( ( NAME, INDEX ) for INDEX, NAME in enumerate(SPECIES) )
+    PRESENT = numpy.zeros(( len(GENES), len(SPECIES) ), dtype=bool)
+    for ROW, GENE in enumerate(GENES):
+        PRESENT[ROW, [ COLUMN[NAME] for NAME in FOUND[GENE] ]] = True
+    return GENES, SPECIES, PRESENT
+
+# Remove the gene or species furthest below its target until all kept ones meet it. Returns the
+# masks of the kept genes and species.
+def REMOVE(PRESENT, KEEP_SPECIES):
+    GENE_KEPT = numpy.ones(PRESENT.shape[0], dtype=bool)
+    SPECIES_KEPT = numpy.ones(PRESENT.shape[1], dtype=bool)
+    # Sequences of each gene in the kept species and of each species in the kept genes
+    GENE_COUNTS = PRESENT.sum(1)
+    SPECIES_COUNTS = PRESENT.sum(0)
+    while GENE_KEPT.any() and SPECIES_KEPT.any():
+        GENE_SCORES = GENE_COUNTS / ( args.gene_occupancy * SPECIES_KEPT.sum() )
+        SPECIES_SCORES = SPECIES_COUNTS / ( args.species_occupancy * GENE_KEPT.sum() )
+        CANDIDATES = [ ( GENE_SCORES[ROW], GENE_COUNTS[ROW], -ROW, 'gene' ) for ROW in numpy.flatnonzero(GENE_KEPT & ( GENE_SCORES < 1 - 1e-9 )) ]
+        CANDIDATES += [ ( SPECIES_SCORES[COLUMN], SPECIES_COUNTS[COLUMN], -COLUMN, 'species' ) for COLUMN in numpy.flatnonzero(SPECIES_KEPT & ~KEEP_SPECIES & ( SPECIES_SCORES < 1 - 1e-9 )) ]
+        if not CANDIDATES:
+            # The species kept on request may still miss genes, so drop the genes they lack
+            FAILING = numpy.flatnonzero(SPECIES_KEPT & ( SPECIES_SCORES < 1 - 1e-9 ))
+            if not len(FAILING):
+                break
+            MISSING = GENE_KEPT & ~PRESENT[:, FAILING].all(1)
+            CANDIDATES = [ ( GENE_SCORES[ROW], GENE_COUNTS[ROW], -ROW, 'gene' ) for ROW in numpy.flatnonzero(MISSING) ]
+        SCORE, COUNT, INDEX, KIND = min(CANDIDATES)
+        if KIND == 'gene':
+            GENE_KEPT[-INDEX] = False
+            SPECIES_COUNTS -= PRESENT[-INDEX]
+        else:
+            SPECIES_KEPT[-INDEX] = False
+            GENE_COUNTS -= PRESENT[:, -INDEX]
+    return GENE_KEPT, SPECIES_KEPT
+
+# Whether the kept genes and species all meet their targets
+def MEETS_TARGETS(PRESENT, GENE_KEPT, SPECIES_KEPT):
+    SUB = PRESENT[GENE_KEPT][:, SPECIES_KEPT]
+    if not SUB.size:
+        return True
+    return ( SUB.sum(1) >= args.gene_occupancy * SUB.shape[1] - 1e-9 ).all() and \
+        ( SUB.sum(0) >= args.species_occupancy * SUB.shape[0] - 1e-9 ).all()
+
+# Add back the removed genes and species that fit, the most complete first, until none do
+def ADD_BACK(PRESENT, GENE_KEPT, SPECIES_KEPT):
+    CHANGED = True
+    while CHANGED:
+        CHANGED = False
+        for KEPT, AXIS in ( ( GENE_KEPT, 1 ), ( SPECIES_KEPT, 0 ) ):
+            OTHER = SPECIES_KEPT if AXIS == 1 else GENE_KEPT
+            COUNTS = PRESENT.compress(OTHER, axis=AXIS).sum(AXIS)
+            for INDEX in sorted(numpy.flatnonzero(~KEPT), key=lambda INDEX: ( -COUNTS[INDEX], INDEX )):
+                KEPT[INDEX] = True
+                if MEETS_TARGETS(PRESENT, GENE_KEPT, SPECIES_KEPT):
+                    CHANGED = True
+                else:
+                    KEPT[INDEX] = False
+    return GENE_KEPT, SPECIES_KEPT
+
+def WRITE_FILE(OUT_FILE, TEXT):
+    TMP_FILE = '%s.%d.tmp' % ( OUT_FILE, os.getpid() )
+    with open(TMP_FILE, 'w') as OUT:
+        OUT.write(TEXT)
+    os.rename(TMP_FILE, OUT_FILE)
+
+##### END FUNCTIONS
+
+if args.input_dir:
+    GENES, SPECIES, PRESENT = READ_DIR(args.input_dir)
+else:
+    GENES, SPECIES, PRESENT = READ_HITS(args.hits)
+if not os.path.isdir(args.output_dir):
+    os.makedirs(args.output_dir)
+
+# The presence/absence table
+TABLE = [ ','.join([ 'Gene ID' ] + SPECIES) ]
+TABLE += [ ','.join([ GENE ] + [ '1' if FOUND else '0' for FOUND in ROW ]) for GENE, ROW in zip(GENES, PRESENT) ]
+WRITE_FILE('%s/gene_species_table.csv' % args.output_dir, '\n'.join(TABLE) + '\n')
+
+# The suggested lists
+KEEP_SPECIES = numpy.zeros(len(SPECIES), dtype=bool)
+if args.keep_species:
+    with open(args.keep_species, 'r') as INPUT:
+        KEEP_NAMES = set(INPUT.read().split())
+    KEEP_SPECIES[[ INDEX for INDEX, NAME in enumerate(SPECIES) if NAME in KEEP_NAMES ]] = True
+GENE_KEPT, SPECIES_KEPT = REMOVE(PRESENT, KEEP_SPECIES)
+GENE_KEPT, SPECIES_KEPT = ADD_BACK(PRESENT, GENE_KEPT, SPECIES_KEPT)
+SUGGESTED_GENES = [ GENE for GENE, KEPT in zip(GENES, GENE_KEPT) if KEPT ]
+SUGGESTED_SPECIES = [ NAME for NAME, KEPT in zip(SPECIES, SPECIES_KEPT) if KEPT ]
+WRITE_FILE('%s/suggested_genes.txt' % args.output_dir, ''.join( GENE + '\n' for GENE in SUGGESTED_GENES ))
+WRITE_FILE('%s/suggested_species.txt' % args.output_dir, ''.join( NAME + '\n' for NAME in SUGGESTED_SPECIES ))
+
+# Occupancy of every gene in the suggested species and of every species in the suggested genes
+SUB = PRESENT[GENE_KEPT][:, SPECIES_KEPT]
+SUMMARY = [ 'type\tname\tsuggested\toccupancy' ]
+GENE_OCCUPANCY = PRESENT[:, SPECIES_KEPT].mean(1) if SPECIES_KEPT.any() else numpy.zeros(len(GENES))
+SPECIES_OCCUPANCY = PRESENT[GENE_KEPT].mean(0) if GENE_KEPT.any() else numpy.zeros(len(SPECIES))
+SUMMARY += [ 'gene\t%s\t%s\t%.3f' % ( GENE, 'yes' if KEPT else 'no', OCCUPANCY ) for GENE, KEPT, OCCUPANCY in zip(GENES, GENE_KEPT, GENE_OCCUPANCY) ]
+SUMMARY += [ 'species\t%s\t%s\t%.3f' % ( NAME, 'yes' if KEPT else 'no', OCCUPANCY ) for NAME, KEPT, OCCUPANCY in zip(SPECIES, SPECIES_KEPT, SPECIES_OCCUPANCY) ]
+WRITE_FILE('%s/occupancy.txt' % args.output_dir, '\n'.join(SUMMARY) + '\n')
+print('Suggested %d of %d species and %d of %d genes, %.1f%% occupied (%d of %d in the full table).' % (
+    len(SUGGESTED_SPECIES), len(SPECIES), len(SUGGESTED_GENES), len(GENES), 100.0 * SUB.mean() if SUB.size else 0.0,
+    PRESENT.sum(), PRESENT.size ))
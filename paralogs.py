@@ -16,25 +16,36 @@
 # marked with high confidence as an out-paralog by another script (probably The
 # distance_matriz_zscore.py script.).
 
-# This script takes 5 arguments:
+# This script takes 5 arguments (plus 1 optional one):
 # 1) --tree | The tree file (in Newick format) to be examined.
-# 2) --others | File with sequence IDS of non-top hits.
+# or --gene_dir | A gene directory. The RAxML_bestTree.SPECIES.tre tree of every SPECIES___labels.txt file in it is examined in this one process.
+# 2) --others | File with sequence IDS of non-top hits. Only used with --tree, with --gene_dir the ___labels.txt files are used.
 # 2) --para | The previously identified paralogs file.
 # 3) --out | The directory where you want output files written.
 # 4) --outgroups | A text file defining the outgroups used to root the tree. If you expect the outgroup taxa not always to be present it is a good idea to provide multiple outgroups.
+# 5) --threads | [OPTIONAL] Number of trees to examine at once with --gene_dir (default 1).
 
 
 from ete2 import Tree, faces, AttrFace, TreeStyle, NodeStyle, TextFace
 import sys, argparse, os
+from multiprocessing import Pool
+from glob import glob
+from rooting import READ_OUTGROUPS, ROOT_TREE
+import compact_tree
 
 # Argument Parser
 parser = argparse.ArgumentParser(description = 'This script takes a gene tree in which a single assembly has had all of its orthologs for a given gene added to the tree and identifies paralogs.')
-parser.add_argument('--tree', required=True, help='File with sequence Ids of non-top hits.')
-parser.add_argument('--others', required=True, help='The tree file (in Newick format) to be examined.')
+TREE_INPUT = parser.add_mutually_exclusive_group(required=True)
+TREE_INPUT.add_argument('--tree', help='The tree file (in Newick format) to be examined.')
+TREE_INPUT.add_argument('--gene_dir', help='A gene directory. The RAxML_bestTree.SPECIES.tre tree of every SPECIES___labels.txt file in it is examined.')
+parser.add_argument('--others', help='File with sequence Ids of non-top hits. Required with --tree.')
 parser.add_argument('--para', required=True, help='The previously identified paralogs file.')
 parser.add_argument('--out', required=True, help='The directory where you want output files written.')
 parser.add_argument('--outgroups', required=True, help='A text document with your outgroups listed. The line should start with the word Outgroup1 followed by a list of all the species in the outgroup with everything separated by spaces. You can specify Outgroup2 and Outgroup3 on other lines as backup outgroups if no species from your outgroup are present.')
+parser.add_argument('--threads', type=int, default=1, help='[OPTIONAL] Number of trees to examine at once with --gene_dir.')
 args = parser.parse_args()
+if args.tree and not args.others:
+    parser.error('--others is required with --tree')
 
 ###############
 ## Functions
@@ -69,244 +80,227 @@ nstyle = NodeStyle()
 nstyle["size"] = 0
 
 # Check if sequence of interest is sister to sequence/s that has already been# identified as a paralog.
-def OUT_PARA(SEQ_CHECK, SIS):
-    # print SIS
-    # print PARA_LIST
+def OUT_PARA(SEQ_CHECK, SIS, PARA_LIST, WRITE_LIST):
     if type(SIS) is list:
-        SIS_SET = set(SIS)
-        if SIS_SET.issubset(PARA_LIST):
+        if set(SIS).issubset(PARA_LIST):
             WRITE_LIST.append(SEQ_CHECK)
-            # print SEQ_CHECK
     else:
         if SIS in PARA_LIST:
             WRITE_LIST.append(SEQ_CHECK)
-            # print('%s is paralog' % SEQ_CHECK)
 
-# Paralog checking loop
-def PARA_LOOP():
-    if len( IDS ) > 0:
-        for ORG in IDS:
-            # print('checking %s:' % ORG)
-            # First we get the names of the sister leaves
-            INT = (T&ORG).get_sisters()
-            INT_NAME = INT[0].name
-            INT_NAMES=T.search_nodes(name=INT_NAME)[0]
-            # Get the node name for the leaf so we can check distances
-            ORG_NODE = T.search_nodes(name=ORG)[0]
+# Take a leaf out of the tree. Its parent is collapsed into the remaining sister if only one is
+# left, adding the parent's branch length to it, which is what T.prune( ..., preserve_branch_length=True )
+# did for the whole tree, but only touches the nodes around the leaf.
+def DETACH(LEAF):
+    PARENT = LEAF.up
+    PARENT.remove_child(LEAF)
+    if PARENT.up is not None and len(PARENT.children) == 1:
+        CHILD = PARENT.children[0]
+        CHILD.dist += PARENT.dist
+        GRANDPARENT = PARENT.up
+        GRANDPARENT.remove_child(PARENT)
+        GRANDPARENT.add_child(CHILD)
+
+# Paralog checking loop. Every sequence from this assembly in IDS is checked against its sister in
+# T, repeating passes over the sequences still left until they have all been fully investigated.
+# Leaves are found through a name index and dropped sequences are detached where they are. Returns
+# the list of paralogs.
+def PARA_LOOP(T, IDS, ORG_ID, BINOM, PARA_LIST):
+    WRITE_LIST = []
+    NODES = dict( ( LEAF.name, LEAF ) for LEAF in T.iter_leaves() )
+    REMAINING = list(IDS)
+    while len( REMAINING ) > 0:
+        # Each pass goes through the sequences left in order. Taking out a sequence at or before the
+        # current one in a pass also steps over the next one, as removing from the list being
+        # looped over did in the recursive version.
+        POSITION = dict( ( ORG, N ) for N, ORG in enumerate(REMAINING) )
+        REMOVED = set()
+        STATE = { 'SKIP': 0, 'CHANGED': False }
+        def REMOVE(NAME, CURRENT):
+            if NAME in POSITION and NAME not in REMOVED:
+                REMOVED.add(NAME)
+                STATE['CHANGED'] = True
+                if POSITION[NAME] <= CURRENT:
+                    STATE['SKIP'] += 1
+        def PRUNE(LEAF):
+            DETACH(LEAF)
+            STATE['CHANGED'] = True
+        for CURRENT, ORG in enumerate(REMAINING):
+            if ORG in REMOVED:
+                continue
+            if STATE['SKIP'] > 0:
+                STATE['SKIP'] -= 1
+                continue
+            ORG_NODE = NODES[ORG]
+            # First we get the sister
+            SISTERS = ORG_NODE.get_sisters()
+            if not SISTERS:
+                # Nothing left to compare this sequence to
+                REMOVE(ORG, CURRENT)
+                continue
+            INT_NAMES = SISTERS[0]
             # Lets take the easiest case first. A single sister taxon
-            if len( INT_NAMES ) == 1:
-                for LEAF in INT_NAMES.iter_leaves():
-                    # get the species name of the sister taxon
-                    SISTER_BINOM = "_".join( [ LEAF.name.split('_')[0], LEAF.name.split('_')[1] ] )
-                    SISTER_ASSEMBLY = LEAF.name.split('___')[0]
-                    # if its the same then we have an inparalog
-                    if BINOM == SISTER_BINOM:
-                        # Now check if it is the same assembly
-                        if SISTER_ASSEMBLY == ORG_ID:
-                            # Mark the longer branch as an inparalog
-                            DISTANCES = ( LEAF.dist, ORG_NODE.dist) # put distance in list
-                            SORT_DIST=(sorted(DISTANCES)) # sort the list
-                            LONGEST = SORT_DIST[1] # mark second in list as longest
-                            if LONGEST == LEAF.dist:
-                                LONG_NODE = LEAF
-                                PRUNE_LIST.remove(LONG_NODE.name) # remove the inparalog from list
-                                T.prune( PRUNE_LIST, preserve_branch_length=True ) # remove the long inparalog from the tree
-                                # Remove this sequence from our loop since its fully investigated.
-                                WRITE_LIST.append(LONG_NODE.name)
-                                IDS.remove(LONG_NODE.name) # take the pruned sequence out of the list we are looping through.
-                                ##### write long inparalog to text file of inparalogs
-                                # print('single sister. long = %s' % LONG_NODE.name)
-                                # print('%s removed from IDS' % ORG)
-                            else:
-                                LONG_NODE = ORG_NODE
-                                PRUNE_LIST.remove(LONG_NODE.name) # remove the inparalog from list
-                                T.prune( PRUNE_LIST, preserve_branch_length=True ) # remove the long inparalog from the tree
-                                # Remove this sequence from our loop since its fully investigated.
-                                WRITE_LIST.append(LONG_NODE.name)
-                                IDS.remove(LONG_NODE.name) # take the pruned sequence out of the list we are looping through.
-                                ##### write long inparalog to text file of inparalogs
-                                # print('single sister. long = %s' % LONG_NODE.name)
-                                # print('%s removed from IDS' % ORG)
+            if INT_NAMES.is_leaf():
+                LEAF = INT_NAMES
+                # get the species name of the sister taxon
+                SISTER_BINOM = "_".join( [ LEAF.name.split('_')[0], LEAF.name.split('_')[1] ] )
+                SISTER_ASSEMBLY = LEAF.name.split('___')[0]
+                # if its the same then we have an inparalog
+                if BINOM == SISTER_BINOM:
+                    # Now check if it is the same assembly
+                    if SISTER_ASSEMBLY == ORG_ID:
+                        # Mark the longer branch as an inparalog, the sister on a tie
+                        if LEAF.dist >= ORG_NODE.dist:
+                            LONG_NODE = LEAF
                         else:
-                            # So its an inparalog, but the other sequence is from another assembly of the same species. Let's prune the other assembly just so its easier to consider whether this is the best sequence from this assembly to keep.
-                            PRUNE_LIST.remove(LEAF.name) # remove the inparalog from list
-                            T.prune( PRUNE_LIST, preserve_branch_length=True ) # remove the inparaog from the tree
-                            # print('trimming other assembly')
+                            LONG_NODE = ORG_NODE
+                        # remove the long inparalog from the tree and from our loop since its fully investigated.
+                        PRUNE(LONG_NODE)
+                        WRITE_LIST.append(LONG_NODE.name)
+                        REMOVE(LONG_NODE.name, CURRENT)
                     else:
-                        # its not an inparalog, but lets still check if this sister has already been flagged as an outparalog, because then we want to flag this the same way.
-
-                        OUT_PARA(ORG, LEAF.name)
-                        # print('single out paralog. sister: %s' % LEAF.name)
-                        # Remove this sequence from our loop since its fully investigated.
-                        # print('%s removed from IDS' % ORG)
-                        IDS.remove(ORG) # take the pruned sequence out of the list we are looping through.
+                        # So its an inparalog, but the other sequence is from another assembly of the same species. Let's prune the other assembly just so its easier to consider whether this is the best sequence from this assembly to keep.
+                        PRUNE(LEAF)
+                else:
+                    # its not an inparalog, but lets still check if this sister has already been flagged as an outparalog, because then we want to flag this the same way.
+                    OUT_PARA(ORG, LEAF.name, PARA_LIST, WRITE_LIST)
+                    REMOVE(ORG, CURRENT)
             # Now we handle what happens when the sister is a clade
             else:
                 # first we need to see if any leaves are from this assembly, if not then we're done with this sequence.
-                SISTER_LEAVES = []
-                for LEAF in INT_NAMES.iter_leaves():
-                    SISTER_LEAVES.append(LEAF.name)
+                SISTER_LEAVES = [ LEAF.name for LEAF in INT_NAMES.iter_leaves() ]
+                SAME_SPECIES = [ BINOM in "_".join( [ S.split('_')[0], S.split('_')[1] ] ) for S in SISTER_LEAVES ]
                 # Are any of the sister species from the same species?
-                if any( BINOM in "_".join( [ s.split('_')[0], s.split('_')[1] ] ) for s in SISTER_LEAVES ):
+                if any( SAME_SPECIES ):
                     # if these are all the same species we have in paralogs, if not then not an inparalog
-                    if all( BINOM in "_".join( [ s.split('_')[0], s.split('_')[1] ] ) for s in SISTER_LEAVES ):
+                    if all( SAME_SPECIES ):
                         # if all of these are from different assemblies then trim them all out of the tree so we can reevaluate.
-                        if all( ORG_ID != s.split('___')[0] for s in SISTER_LEAVES ):
+                        if all( ORG_ID != S.split('___')[0] for S in SISTER_LEAVES ):
                             for SISTER in SISTER_LEAVES:
-                                PRUNE_LIST.remove(SISTER)
-                                T.prune( PRUNE_LIST, preserve_branch_length=True ) # remove the long inparalog from the tree
-                            # print('all sisters are from another assmebly')
+                                PRUNE(NODES[SISTER])
                     else:
                         # its not an inparalog, but lets still check if this sister has already been flagged as an outparalog, because then we want to flag this the same way.
-                        # print('sister clade includes some other taxa.')
-                        # print SISTER_LEAVES
-                        SUB_SISTERS = []
-                        for CLADE_SEQ in SISTER_LEAVES:
-                            # print('%s' % CLADE_SEQ)
-                            # print ORG_ID
-                            if ORG_ID != CLADE_SEQ.split('___')[0]:
-                                SUB_SISTERS.append(CLADE_SEQ)
-                        IDS.remove(ORG) # take the pruned sequence out of the list we are looping through.
-                        # print('removing %s from IDS' % ORG)
-                        OUT_PARA(ORG, SUB_SISTERS)
+                        SUB_SISTERS = [ CLADE_SEQ for CLADE_SEQ in SISTER_LEAVES if ORG_ID != CLADE_SEQ.split('___')[0] ]
+                        REMOVE(ORG, CURRENT)
+                        OUT_PARA(ORG, SUB_SISTERS, PARA_LIST, WRITE_LIST)
                 else:
                     # its not an inparalog, but lets still check if this sister has already been flagged as an outparalog, because then we want to flag this the same way.
-                    OUT_PARA(ORG, SISTER_LEAVES)
-                    IDS.remove(ORG) # take the pruned sequence out of the list we are looping through.
-                    # print('sister clade includes no same taxa')
-        PARA_LOOP()
+                    OUT_PARA(ORG, SISTER_LEAVES, PARA_LIST, WRITE_LIST)
+                    REMOVE(ORG, CURRENT)
+        # A pass that changed nothing would repeat forever, the remaining sequences can not be resolved
+        if not STATE['CHANGED']:
+            print("%s: %s sequences could not be resolved." % ( ORG_ID, len( REMAINING ) - len( REMOVED ) ))
+            break
+        REMAINING = [ ORG for ORG in REMAINING if ORG not in REMOVED ]
+    return WRITE_LIST
 
-# Print tree to stdout
-# print T.get_ascii(show_internal=True)
+# Find the paralogs of one assembly in its gene tree. OTHERS_FILE lists the non-top hits of the
+# assembly. Writes ORG_ID___paralogs.txt and ORG_ID.paralog_tree.pdf to OUT_DIR.
+def PARALOGS(TREE, OTHERS_FILE, OUT_DIR):
+    # Load Newick tree file, through its compact sidecar in OUT_DIR/cache/trees
+    TREE_DATA = compact_tree.LOAD_TREE(TREE, '%s/cache/trees' % OUT_DIR)
+    T = compact_tree.TO_ETE(TREE_DATA)
+    # Get assembly name
+    ORG_ID = os.path.basename(TREE).split('.')[1]
+    BINOM = "_".join( [ ORG_ID.split('_')[0], ORG_ID.split('_')[1] ] )
+    # Get Species list
+    SPECIES_LIST = []
+    SPECIES_SEEN = set()
+    for LEAF in T:
+        SPECIES = LEAF.name
+        if SPECIES not in SPECIES_SEEN:
+            SPECIES_SEEN.add(SPECIES)
+            SPECIES_LIST.append(SPECIES)
 
-TREE = args.tree
-# Load Newick tree file
-T = Tree(TREE)
-# Get assembly name
-ORG_ID = TREE.split('.')[1]
-BINOM = "_".join( [ ORG_ID.split('_')[0], ORG_ID.split('_')[1] ] )
-# Get Species list
-SPECIES_LIST = []
-for LEAF in T:
-    SPECIES = LEAF.name
-    if SPECIES not in SPECIES_LIST:
-        SPECIES_LIST.append(SPECIES)
+    # Get a list of all the sequence names
+    IDS = [ S for S in SPECIES_LIST if ORG_ID == S.split('___')[0] ]
+    OTHERS = set( LINE.strip() for LINE in open(OTHERS_FILE) )
+    TOP = [ x for x in IDS if x not in OTHERS ]
 
-PRUNE_LIST = list( SPECIES_LIST ) # copy the species list
+    # Root the tree on the outgroup taxa that are present, or at the midpoint if there are none
+    ROOT_TREE(T, TREE, OUTGROUPS)
 
-# Get a list of all the sequence names
-IDS = [ S for S in SPECIES_LIST if ORG_ID == S.split('___')[0] ]
-OTHERS = [ LINE.strip() for LINE in open(args.others) ]
-TOP = [ x for x in IDS if x not in OTHERS ]
+    # Name unnamed nodes
+    NUMBER = 0
+    for NODE in T.traverse():
+        if NODE.name == '':
+            NODE.name = NUMBER
+            NUMBER += 1
 
-# Root the tree
-# First loop through text file and save the taxa from the Outgroup line to a list
-OUTGROUP1 = []
-OUTGROUP2 = []
-OUTGROUP3 = []
-# Make lists of each outgroup
-OUTGROUP_FILE = open( args.outgroups, 'r' )
-for LINE in OUTGROUP_FILE:
-    if LINE.split()[0] == "Outgroup1":
-        for OUT in LINE.split()[2:]:
-            OUTGROUP1.append( OUT )
-    if LINE.split()[0] == "Outgroup2":
-        for OUT in LINE.split()[2:]:
-            OUTGROUP2.append( OUT )
-    if LINE.split()[0] == "Outgroup3":
-        for OUT in LINE.split()[2:]:
-            OUTGROUP3.append( OUT )
-# Root the tree using the outgroup specified in the text file
-# Next check if our outgroup taxa are in the tree and create a new list of just species present.
-TREE_LIST = {}
-# Make list of all species in tree.
-for LEAF in T:
-    SPECIES = LEAF.name.split("___")[0]
-    SEQID = LEAF.name.split("___")[1]
-    TREE_LIST[SPECIES] = SEQID
-NEW_OUTGROUP = []
-for SPECIES, SEQID in TREE_LIST.iteritems():
-    if SPECIES in OUTGROUP1:
-        FULL_NAME = "___".join( [ SPECIES, SEQID ] )
-        NEW_OUTGROUP.append( FULL_NAME )
-# Root tree using the Outgroup taxa that are present, and if no outgroup taxa are present use the midpoint method to root the tree.
-def ROOT():
-    if len( NEW_OUTGROUP ) > 1:
-        ANCESTOR = T.get_common_ancestor( NEW_OUTGROUP )
-        T.set_outgroup( ANCESTOR )
-    if len( NEW_OUTGROUP ) == 1:
-        T.set_outgroup( NEW_OUTGROUP[0] )
-    if len( NEW_OUTGROUP ) < 1:
-        for SPECIES, SEQID in TREE_LIST.iteritems():
-            if SPECIES in OUTGROUP2:
-                FULL_NAME = "___".join( [ SPECIES, SEQID ] )
-                NEW_OUTGROUP.append( FULL_NAME )
-        if len( NEW_OUTGROUP ) > 1:
-            ANCESTOR = T.get_common_ancestor( NEW_OUTGROUP )
-            T.set_outgroup( ANCESTOR )
-        if len( NEW_OUTGROUP ) == 1:
-            T.set_outgroup( NEW_OUTGROUP[0] )
-        if len( NEW_OUTGROUP ) < 1:
-            for SPECIES, SEQID in TREE_LIST.iteritems():
-                if SPECIES in OUTGROUP3:
-                    FULL_NAME = "___".join( [ SPECIES, SEQID ] )
-                    NEW_OUTGROUP.append( FULL_NAME )
-            if len( NEW_OUTGROUP ) > 1:
-                ANCESTOR = T.get_common_ancestor( NEW_OUTGROUP )
-                T.set_outgroup( ANCESTOR )
-            if len( NEW_OUTGROUP ) == 1:
-                T.set_outgroup( NEW_OUTGROUP[0] )
-            if len( NEW_OUTGROUP ) < 1:
-                print("%s: No outgroup taxa present. Rooting at midpoint instead. This may break a monophyletic group." % TREE )
-                R = T.get_midpoint_outgroup()
-                T.set_outgroup(R)
-ROOT()
+    # Pick out the sequences of previously identified paralogs
+    PARA_LIST = set()
+    if FILE_LIST is not None:
+        ID_SET = set(IDS)
+        for ITEM in SPECIES_LIST:
+            if ITEM not in ID_SET:
+                ITEM_BINOM = ITEM.split('___')[0]
+                if ITEM_BINOM in FILE_LIST:
+                    PARA_LIST.add(ITEM)
+        if BINOM in FILE_LIST:
+            PARA_LIST.add(TOP[0])
 
-# Name unnamed nodes
-NUMBER = 0
-for NODE in T.traverse():
-    if NODE.name == '':
-        NODE.name = NUMBER
-        NUMBER += 1
+    # Then we start our loop. It will continue looping until every ortholog has been investigated.
+    WRITE_LIST = PARA_LOOP(T, IDS, ORG_ID, BINOM, PARA_LIST)
 
-# Load the contents of the Paralog files
-try:
-    FILE_LIST = [ LINE.strip() for LINE in open(args.para) ]
-    PARA_LIST = set()
-    for ITEM in SPECIES_LIST:
-        if ITEM not in IDS:
-            ITEM_BINOM = ITEM.split('___')[0]
-            if ITEM_BINOM in FILE_LIST:
-                PARA_LIST.add(ITEM)
-    if BINOM in FILE_LIST:
-        PARA_LIST.add(TOP[0])
-except IOError:
-    PARA_LIST = set()
+    # Now we write out our paralogs file, replacing the one of an earlier run
+    PARALOGS_FILE = '%s/%s___paralogs.txt' % ( OUT_DIR, ORG_ID )
+    TMP_FILE = '%s.%d.tmp' % ( PARALOGS_FILE, os.getpid() )
+    with open ( TMP_FILE, 'w') as PARALOGS:
+        for WRITE in WRITE_LIST:
+            PARALOGS.write("%s\n" % WRITE.split('___')[1])
+    os.rename(TMP_FILE, PARALOGS_FILE)
+
+    # Rebuild the tree from the arrays already loaded
+    T = compact_tree.TO_ETE(TREE_DATA)
+    ROOT_TREE(T, TREE, OUTGROUPS)
+    IDS = set(IDS)
+    WRITE_SET = set(WRITE_LIST)
+    # Write a new tree file with the paralogs indicated and their clades indicated
+    for CLADE in T.traverse():
+        CLADE.set_style(nstyle)
+    for LEAF in T:
+        if LEAF.name in IDS:
+            LEAF.img_style = YELLOW
+        if LEAF.name in WRITE_SET:
+            LEAF.img_style = RED
+        if LEAF.name in PARA_LIST:
+            LEAF.img_style = BLUE
+
+    T.render( '%s/%s.paralog_tree.pdf' % ( OUT_DIR, ORG_ID ), tree_style=ts)
 
-WRITE_LIST = []
+# Pool workers only get a single argument. A tree that fails is reported instead of stopping the
+# other trees.
+def PARALOGS_WORKER(JOB):
+    try:
+        PARALOGS(JOB[0], JOB[1], JOB[2])
+        return True
+    except Exception as ERROR:
+        sys.stderr.write('Could not find the paralogs in %s: %s\n' % ( JOB[0], ERROR ))
+        return False
 
-# Then we start our loop. This calls itself so it will continue looping until
-# every ortholog has been investigated.
-PARA_LOOP()
+# Print tree to stdout
+# print T.get_ascii(show_internal=True)
 
-# Now we write out our paralogs file
-# with open ( '%s/%s___paralogs.txt' % ( args.out, ORG_ID ), 'a') as PARALOGS:
-#     for WRITE in WRITE_LIST:
-#         PARALOGS.write("%s\n" % WRITE.split('___')[1])
+# Read the outgroups once for every tree
+OUTGROUPS = READ_OUTGROUPS(args.outgroups)
 
-# Re-Load Newick tree file
-T = Tree(TREE)
-ROOT()
-IDS = [ S for S in SPECIES_LIST if ORG_ID == S.split('___')[0] ]
-# Write a new tree file with the paralogs indicated and their clades indicated
-for CLADE in T.traverse():
-    CLADE.set_style(nstyle)
-for LEAF in T:
-    if LEAF.name in IDS:
-        LEAF.img_style = YELLOW
-    if LEAF.name in WRITE_LIST:
-        LEAF.img_style = RED
-    if LEAF.name in PARA_LIST:
-        LEAF.img_style = BLUE
+# Load the contents of the Paralog files
+try:
+    FILE_LIST = set( LINE.strip() for LINE in open(args.para) )
+except IOError:
+    FILE_LIST = None
 
-T.render( '%s/%s.paralog_tree.pdf' % ( args.out, ORG_ID ), tree_style=ts)
+# Examine one tree, or the tree of every assembly added to the gene spread over a pool of workers.
+# Each assembly has a SPECIES___labels.txt file with its non-top hits and a RAxML_bestTree.SPECIES.tre tree.
+if args.tree:
+    PARALOGS(args.tree, args.others, args.out)
+else:
+    JOBS = []
+    for LABELS in sorted(glob('%s/*___labels.txt' % args.gene_dir)):
+        SPECIES = os.path.basename(LABELS)[:-len('___labels.txt')]
+        JOBS.append( ( '%s/RAxML_bestTree.%s.tre' % ( args.gene_dir, SPECIES ), LABELS, args.out ) )
+    POOL = Pool(args.threads)
+    DONE = POOL.map(PARALOGS_WORKER, JOBS, chunksize=1)
+    POOL.close()
+    POOL.join()
+    print('Examined %d of %d trees.' % ( sum(DONE), len(JOBS) ))
@@ -7,81 +7,102 @@
 # with the full length sequences using the def-lines listed in the hmmsearch results and the
 # large fasta file used to generate the hmmsearch output file.
 #
-# This script takes 2 arguments:
+# This script takes 2 arguments (plus 1 optional one):
 # 1) --hmm - The directory containing the hmmsearch output files
 # 2) --outdir - The directory to write the text files to
+# 3) --threads - [OPTIONAL] The number of species to parse at once (default 1)
 #
-# Usage: parse_hmm_search.py --hmm ~/GreenAlgae/hmmsearch_out/ --outdir ~/GreenAlgae/parse_hmm_txt/
+# Usage: parse_hmm_search.py --hmm ~/GreenAlgae/hmmsearch_out/ --outdir ~/GreenAlgae/parse_hmm_txt/ --threads 24
+#
+# For each gene and species the best scoring sequence is written to TopHits, and the other sequences
+# scoring above 80% of it to OtherHits. The lists of an earlier run are removed first, so genes and
+# species without hits in this run have no list.
+# The number of hits of each gene and species is written to hmm_hits.txt for the report.
 #
 # The script write_cds_pep.sh should be used after this script to write the fasta files using the text
 # files generated by this script. 
 
 from glob import glob
+from multiprocessing import Pool
 from Bio import SeqIO, Seq
 import sys, argparse
 import os
 
-def ParseHMM(HMMs, OUT_DIR):
-	SPECIES_DICT_TOP_HITS = {}
-	SPECIES_DICT_OTHER_HITS = {}
-	for HMMout in glob('%s/*.out' % HMMs):
+# Share of the best score a hit needs to be kept as another hit
+OTHER_FRACTION = 0.8
+
+# Write a list of def-lines through a temporary file, so it is either complete or missing
+def WriteList(OUT_TXT, ORF_IDS):
+	TMP_FILE = '%s.%d.tmp' % (OUT_TXT, os.getpid())
+	with open(TMP_FILE, 'w') as OUT:
+		for VALUE in ORF_IDS:
+			OUT.write('%s\n' % VALUE)
+	os.rename(TMP_FILE, OUT_TXT)
+
+# Read the hmmsearch --tblout files of one species and write its TopHits and OtherHits lists. For
+# each gene only the best score and the hits within OTHER_FRACTION of it are kept while reading, so
+# the result does not depend on the order of the lines or files: the top hit is the highest scoring
+# sequence (the first by name on a tie) and the other hits are the rest scoring above 80% of it.
+def ParseSpecies(JOB):
+	SPECIES, HMM_FILES, OUT_DIR = JOB
+	BEST = {}
+	HITS = {}
+	for HMMout in HMM_FILES:
 		with open(HMMout, 'r') as HMMhits:
-			HMM_SCORE = float(0)
 			for Line in HMMhits:
-				if '#' not in Line:
-#					SPECIES = '-'.join(Line.split()[0].split('-')[:-1])
-					SPECIES = '_'.join(HMMout.split('/')[-1].split('.')[0].split('_')[1:])
-					GENE = Line.split()[2]
-					NEW_HMM_SCORE = float(Line.split()[5])
-					ORF_ID = Line.split()[0]
-					if HMM_SCORE < NEW_HMM_SCORE:
-						HMM_SCORE = NEW_HMM_SCORE
-						try:
-							SPECIES_DICT_TOP_HITS[SPECIES][GENE].add(ORF_ID)
-						except KeyError:
-							try:
-								SPECIES_DICT_TOP_HITS[SPECIES]
-								SPECIES_DICT_TOP_HITS[SPECIES][GENE] = set()
-								SPECIES_DICT_TOP_HITS[SPECIES][GENE].add(ORF_ID)
-							except KeyError:
-								SPECIES_DICT_TOP_HITS[SPECIES] = {}
-								SPECIES_DICT_TOP_HITS[SPECIES][GENE] = set()
-								SPECIES_DICT_TOP_HITS[SPECIES][GENE].add(ORF_ID)
-					elif HMM_SCORE * 0.8 < NEW_HMM_SCORE:
-						try:
-							SPECIES_DICT_OTHER_HITS[SPECIES][GENE].add(ORF_ID)
-						except KeyError:
-							try:
-								SPECIES_DICT_OTHER_HITS[SPECIES]
-								SPECIES_DICT_OTHER_HITS[SPECIES][GENE] = set()
-								SPECIES_DICT_OTHER_HITS[SPECIES][GENE].add(ORF_ID)
-							except KeyError:
-								SPECIES_DICT_OTHER_HITS[SPECIES] = {}
-								SPECIES_DICT_OTHER_HITS[SPECIES][GENE] = set()
-								SPECIES_DICT_OTHER_HITS[SPECIES][GENE].add(ORF_ID)
-					else:
-						continue
+				if Line.startswith('#'):
+					continue
+				FIELDS = Line.split(None, 6)
+				if len(FIELDS) < 6:
+					continue
+				ORF_ID = FIELDS[0]
+				GENE = FIELDS[2]
+				SCORE = float(FIELDS[5])
+				if SCORE <= 0:
+					continue
+				if GENE not in BEST:
+					BEST[GENE] = SCORE
+					HITS[GENE] = {}
+				elif SCORE > BEST[GENE]:
+					# Drop the hits the new best score leaves below the cut off
+					BEST[GENE] = SCORE
+					HITS[GENE] = dict( (ID, OLD) for ID, OLD in HITS[GENE].iteritems() if OLD > SCORE * OTHER_FRACTION )
+				elif SCORE <= BEST[GENE] * OTHER_FRACTION:
+					continue
+				if SCORE > HITS[GENE].get(ORF_ID, 0):
+					HITS[GENE][ORF_ID] = SCORE
+	COUNTS = []
+	for GENE, GENE_HITS in HITS.iteritems():
+		TOP = min( ID for ID, SCORE in GENE_HITS.iteritems() if SCORE == BEST[GENE] )
+		WriteList('%s/TopHits/%s_%s.txt' % (OUT_DIR, GENE, SPECIES), [TOP])
+		OTHERS = sorted( ID for ID in GENE_HITS if ID != TOP )
+		if OTHERS:
+			WriteList('%s/OtherHits/%s_%s.txt' % (OUT_DIR, GENE, SPECIES), OTHERS)
+		COUNTS.append('%s\t%s\t%d\n' % (GENE, SPECIES, 1 + len(OTHERS)))
+	return COUNTS
 
-# Output text files of def-lines
-# First check if output subdirectories exist
-	if not os.path.exists('%s/TopHits' % OUT_DIR):
-		os.makedirs('%s/TopHits' % OUT_DIR)
-	if not os.path.exists('%s/OtherHits' % OUT_DIR):
-		os.makedirs('%s/OtherHits' % OUT_DIR)
-# Top Hits
-	for SPECIES, GENE_ORFS in SPECIES_DICT_TOP_HITS.iteritems():
-		for KOG, GENE_ORF in GENE_ORFS.iteritems():
-			OUT_TXT = '%s/TopHits/%s_%s.txt' % (OUT_DIR, KOG, SPECIES)
-			with open(OUT_TXT, 'a') as OUT_TOP:
-				for VALUE in list(GENE_ORF):
-					OUT_TOP.write('%s\n' % VALUE)
-# Other Hits
-	for SPECIES, GENE_ORFS in SPECIES_DICT_OTHER_HITS.iteritems():
-		for KOG, GENE_ORF in GENE_ORFS.iteritems():
-			OUT_OTHER_TXT = '%s/OtherHits/%s_%s.txt' % (OUT_DIR, KOG, SPECIES)
-			with open(OUT_OTHER_TXT, 'a') as OUT_OTHER:
-				for VALUE in list(GENE_ORF):
-					OUT_OTHER.write('%s\n' % VALUE)
+def ParseHMM(HMMs, OUT_DIR, THREADS=1):
+# First check if output subdirectories exist, and clear the lists of an earlier run
+	for LIST_DIR in ('%s/TopHits' % OUT_DIR, '%s/OtherHits' % OUT_DIR):
+		if not os.path.exists(LIST_DIR):
+			os.makedirs(LIST_DIR)
+		for OLD_LIST in glob('%s/*.txt' % LIST_DIR):
+			os.remove(OLD_LIST)
+# Group the hmmsearch files by species, so each list is built by a single worker
+	SPECIES_FILES = {}
+	for HMMout in glob('%s/*.out' % HMMs):
+		SPECIES = '_'.join(HMMout.split('/')[-1].split('.')[0].split('_')[1:])
+		SPECIES_FILES.setdefault(SPECIES, []).append(HMMout)
+	JOBS = [ (SPECIES, sorted(HMM_FILES), OUT_DIR) for SPECIES, HMM_FILES in sorted(SPECIES_FILES.iteritems()) ]
+	POOL = Pool(THREADS)
+	COUNTS = POOL.map(ParseSpecies, JOBS, chunksize=1)
+	POOL.close()
+	POOL.join()
+# Number of hits (top and other) of every gene and species, for the report
+	with open('%s/hmm_hits.txt' % OUT_DIR, 'w') as OUT:
+		OUT.write('gene\tspecies\thits\n')
+		for SPECIES_COUNTS in COUNTS:
+			OUT.write(''.join(sorted(SPECIES_COUNTS)))
 
 
 # Biopython Method
@@ -124,7 +145,8 @@ parser.add_argument('--hmm', required=True, help='HMMsearch output dir')
 # Only needed for the pure python method. This method is slow.
 #parser.add_argument('--TransDecoder', required=True, help='Transdecoder files') 
 parser.add_argument('--outdir', required=True, help='output gets written here') 
+parser.add_argument('--threads', type=int, default=1, help='[OPTIONAL] Number of species to parse at once') 
 
 args = parser.parse_args() 
 
-ParseHMM(args.hmm, args.outdir)
+ParseHMM(args.hmm, args.outdir, args.threads)
@@ -0,0 +1,62 @@
+#
+# patristic.py
+#
+# Pairwise tip to tip (patristic) distances straight from the branch lengths of a newick tree,
+# used by distance_matrix_zscore.py --patristic in place of a raxmlHPC -f x run for every gene.
+#
+# The tree is loaded as flat arrays with the nodes in preorder (see compact_tree.py): PARENT[N] is
+# the index of the parent of node N (-1 for the root) and LENGTH[N] the length of the branch above
+# it, with missing lengths read as 0. Every clade is then a contiguous run of the preorder, so the
+# leaves below a node are a contiguous block of the leaf order and the common ancestor of two
+# leaves is found by filling the blocks between the children of each internal node. That is O(n^2)
+# numpy slice assignments rather than a tree walk for every pair.
+
+import numpy as np
+import compact_tree
+
+# Distance of every node from the root. Parents always come before their children in preorder.
+def ROOT_DEPTHS(PARENT, LENGTH):
+    DEPTH = np.zeros(len(PARENT))
+    for NODE in range(1, len(PARENT)):
+        DEPTH[NODE] = DEPTH[PARENT[NODE]] + LENGTH[NODE]
+    return DEPTH
+
+# Leaf x leaf matrix of patristic distances, with the leaves in preorder.
+def DISTANCE_MATRIX(PARENT, LENGTH, LEAF):
+    TOTAL_NODES = len(PARENT)
+    DEPTH = ROOT_DEPTHS(PARENT, LENGTH)
+    # Leaf order index of every leaf and the block of leaves below every node
+    ORDER = np.cumsum(LEAF) - 1
+    FIRST = np.where(LEAF, ORDER, 0)
+    COUNT = LEAF.astype(np.int64)
+    for NODE in range(TOTAL_NODES - 1, 0, -1):
+        COUNT[PARENT[NODE]] += COUNT[NODE]
+    for NODE in range(TOTAL_NODES):
+        if not LEAF[NODE]:
+            FIRST[NODE] = ORDER[NODE] + 1
+    LEAF_DEPTH = DEPTH[LEAF]
+    # Depth of the common ancestor of every pair: the children of a node hold consecutive blocks,
+    # so every leaf in one child against every leaf after it within the node meets at the node.
+    ANCESTOR_DEPTH = np.diag(LEAF_DEPTH)
+    CHILDREN = [[] for NODE in range(TOTAL_NODES)]
+    for NODE in range(1, TOTAL_NODES):
+        CHILDREN[PARENT[NODE]].append(NODE)
+    for NODE in range(TOTAL_NODES):
+        if LEAF[NODE]:
+            continue
+        STOP = FIRST[NODE] + COUNT[NODE]
+        for CHILD in CHILDREN[NODE][:-1]:
+            CHILD_STOP = FIRST[CHILD] + COUNT[CHILD]
+            ANCESTOR_DEPTH[FIRST[CHILD]:CHILD_STOP, CHILD_STOP:STOP] = DEPTH[NODE]
+    ANCESTOR_DEPTH += np.triu(ANCESTOR_DEPTH, 1).T
+    return LEAF_DEPTH[:, None] + LEAF_DEPTH[None, :] - 2 * ANCESTOR_DEPTH
+
+# Read a tree and return its pairwise leaf distances in the same form as
+# zscore_engine.READ_DISTANCES: the leaf names and the I, J, DISTANCES arrays of every pair.
+def READ_PATRISTIC(TREE_FILE):
+    TREE = compact_tree.READ_NEWICK(TREE_FILE)
+    LABELS = compact_tree.LEAF_NAMES(TREE)
+    LENGTH = np.where(np.isnan(TREE['LENGTH']), 0.0, TREE['LENGTH'])
+    MATRIX = DISTANCE_MATRIX(TREE['PARENT'], LENGTH, compact_tree.LEAVES(TREE))
+    I, J = np.triu_indices(len(LABELS), 1)
+    return LABELS, I.astype(np.int32), J.astype(np.int32), MATRIX[I, J]
@@ -24,7 +24,6 @@
 # subset_sorted.sh
 # cat_mafft_all.sh
 # supermatrix.py
-# nexus_to_phylip.py
 #
 # Named variables. Every run needs the following defined:
 # 1) -i | --input_dir - The directory containing the Working directory from loop.sh.
@@ -172,16 +171,9 @@ find *.fas | sed 's,.fas,,' | xargs -n 1 -P $THREADS -I % trimal -nexus -in %'.f
 # Merge alignments into a single supermatrix alignment and save as Nexus and Phylip
 printf "***********   Making supermatrix for CDS sequences on `date` ...\n"
 echo "Starting supermatrix.py CDS run on $(date)" >> $INPUT/log.txt
-echo "supermatrix.py --in_dir $TRIMAL_OUT/CDS/ --out $WORKING/supermatrix/CDS/supermatrix_cds.nex" >> $INPUT/log.txt
-supermatrix.py --in_dir $WORKING/supermatrix/CDS/tmp/ --out $WORKING/supermatrix/CDS/supermatrix_cds.nex
-
-# Remove file paths from nexus file gene names
-cd $WORKING/supermatrix/CDS/
-sed -i "s,$WORKING/supermatrix/CDS/tmp/,,g" supermatrix_cds.nex
-# Convert nexus file to phylip
-echo "Starting nexus_to_phylip.py CDS run on $(date)" >> $INPUT/log.txt
-echo "nexus_to_phylip.py --input supermatrix_cds.nex --out supermatrix_cds.phylip" >> $INPUT/log.txt
-nexus_to_phylip.py --input supermatrix_cds.nex --out supermatrix_cds.phylip
+echo "supermatrix.py --in_dir $WORKING/supermatrix/CDS/tmp --out $WORKING/supermatrix/CDS/supermatrix_cds.nex" >> $INPUT/log.txt
+# This also writes supermatrix_cds.phylip and the RAxML partition file supermatrix_cds.partitions
+supermatrix.py --in_dir $WORKING/supermatrix/CDS/tmp --out $WORKING/supermatrix/CDS/supermatrix_cds.nex
 
 # Repeat Trimal and supermatrix steps now with the PEP files
 # cd $CAT_MAFFT_ALL_OUT/PEP
@@ -194,15 +186,6 @@ nexus_to_phylip.py --input supermatrix_cds.nex --out supermatrix_cds.phylip
 
 printf "***********   Making supermatrix for PEP sequences on `date` ...\n"
 echo "Starting supermatrix.py PEP run on $(date)" >> $INPUT/log.txt
-echo "supermatrix.py --in_dir $WORKING/supermatrix/PEP/tmp/ --out $WORKING/supermatrix/PEP/supermatrix_pep.nex" >> $INPUT/log.txt
-supermatrix.py --in_dir $WORKING/supermatrix/PEP/tmp/ --out $WORKING/supermatrix/PEP/supermatrix_pep.nex
-
-# remove file paths from nexus file gene names
-cd $WORKING/supermatrix/PEP/
-sed -i "s,$WORKING/supermatrix/PEP/tmp/,,g" supermatrix_pep.nex
-
-# Convert nexus to phylip
-printf "***********   Converting supermatrix PEP nexus file to phylip on `date` ...\n"
-echo "Starting nexus_to_phylip.py PEP run on $(date)" >> $INPUT/log.txt
-echo "nexus_to_phylip.py --input supermatrix_pep.nex --out supermatrix_pep.phylip" >> $INPUT/log.txt
-nexus_to_phylip.py --input supermatrix_pep.nex --out supermatrix_pep.phylip
+echo "supermatrix.py --in_dir $WORKING/supermatrix/PEP/tmp --out $WORKING/supermatrix/PEP/supermatrix_pep.nex" >> $INPUT/log.txt
+# This also writes supermatrix_pep.phylip and the RAxML partition file supermatrix_pep.partitions
+supermatrix.py --in_dir $WORKING/supermatrix/PEP/tmp --out $WORKING/supermatrix/PEP/supermatrix_pep.nex
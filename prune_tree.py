@@ -9,97 +9,178 @@
 #
 # This script takes 2 arguments:
 # This first argument must be the newick formatted tree file.
-# The second argument must be the fasta or phylip alignment.
+# The second argument must be the fasta or phylip alignment. More alignments can follow, the tree
+# is only read once for all of them.
+#
+# Or, to prune the constraint trees of whole directories at once:
+# --dirs | Directories holding a constraint tree and the .phy alignment of every gene.
+# --tree_name | [OPTIONAL] The name of the constraint tree in each directory (default constraint.tre).
+#
+# Each GENE.phy (or GENE.fasta) gets a GENE.constraint.tre, with the tip names of the tree
+# extended to SPECIES___SEQID from the alignment. The output matches what Bio.Phylo's prune()
+# and newick writer gave: collapsed nodes add their branch length to the remaining child, unnamed
+# clades are named by their index in the full tree and lengths are written with 5 decimals.
 #
 # Example usage:
 # prune_tree.py constraint.tre big_alignment.fasta
+# prune_tree.py --dirs gene_trees/CDS gene_trees/PEP
 
-from Bio import Phylo
-import sys, re
-
+import sys, re, os, argparse
+from glob import glob
+import compact_tree
 
-#Set tree to the first command line argument (0 is the script itself)
-tree = Phylo.read(sys.argv[1], "newick")
-INPUT = sys.argv[2]
-SPECIES_LIST = []
-TREE_LIST = []
-GENE = sys.argv[2].split(".")[0]
-OUTPUT = '%s.%s' % (GENE, sys.argv[1])
+# Argument Parser
+parser = argparse.ArgumentParser(description = 'This script will compare an alignment file (in Fasta or Phylip format) to a newick tree file, and create a new tree file containing only species also in the alignment file.')
+parser.add_argument('tree', nargs='?', help='The newick formatted tree file.')
+parser.add_argument('alignments', nargs='*', help='The fasta or phylip alignments.')
+parser.add_argument('--dirs', nargs='+', help='Directories holding a constraint tree and the .phy alignment of every gene.')
+parser.add_argument('--tree_name', default='constraint.tre', help='[OPTIONAL] The name of the constraint tree in each directory.')
+args = parser.parse_args()
+if args.dirs is None and ( args.tree is None or not args.alignments ):
+    parser.error('give a tree and at least one alignment, or --dirs')
 
-#Check if input alignment is a fasta or phylip file
-with open(INPUT, 'r') as FILE_CHECK:
-	for LINE in FILE_CHECK:
-		if ">" in LINE:
-			FORMAT = str("FASTA")
-			break
-		else:
-			FORMAT = str("PHYLIP")
-			break
+# Names quoted by the newick writer
+UNQUOTED = re.compile(r"[^\s\(\)\[\]\'\:\;\,]+")
 
 #FUNCTIONS
-# Search tree by clade name
-def lookup_by_names(tree):
-    names = {}
-    for clade in tree.find_clades():
-        if clade.name:
-            if clade.name in names:
-                raise ValueError("Duplicate key: %s" % clade.name)
-            names[clade.name] = clade
-    return names
+# Species in an alignment that are also in the tree, and the sequence id of each of them
+def READ_TAXA(INPUT, TREE_SPECIES):
+    SPECIES_SET = set()
+    SEQIDS = {}
+    #Check if input alignment is a fasta or phylip file
+    FORMAT = str("PHYLIP")
+    with open(INPUT, 'r') as FILE_CHECK:
+        for LINE in FILE_CHECK:
+            if ">" in LINE:
+                FORMAT = str("FASTA")
+            break
+    with open(INPUT, 'r') as ALIGNMENT:
+        for LINE in ALIGNMENT:
+            if FORMAT is str("FASTA"):
+                if ">" in LINE:
+                    SPECIES = re.sub(r'>([0-9A-Za-z_]+)___\n', r'\1', LINE)
+                    SEQID = re.sub(r'>[0-9A-Za-z_]+___([0-9A-Za-z_|.]+)\n', r'\1', LINE)
+                    if SPECIES in TREE_SPECIES:
+                        SPECIES_SET.add(SPECIES)
+                        SEQIDS[SPECIES] = SEQID
+            else:
+                if re.match(r'\w', LINE):
+                    SPECIES = LINE.split()[0].split("___")[0]
+                    SEQID = LINE.split()[0].split("___")[1]
+                    if SPECIES in TREE_SPECIES:
+                        SPECIES_SET.add(SPECIES)
+                        SEQIDS[SPECIES] = SEQID
+    return SPECIES_SET, SEQIDS
 
-# Name all unnamed clades
-def tabulate_names(tree):
-    names = {}
-    for idx, clade in enumerate(tree.find_clades()):
-        if clade.name:
-            clade.name = clade.name
-        else:
-            clade.name = str(idx)
-        names[clade.name] = clade
-    return names
-# Name all the clades in the tree
-tabulate_names(tree)
-# Fill Dictionary with clade names
-names = lookup_by_names(tree)
-
-# Make list of all species in tree.
-for TERMINAL in names['0'].get_terminals():
-	TREE_LIST.append(TERMINAL.name)
-#Make list of all species in alignment
-SEQIDS = {}
-with open(INPUT, 'r') as ALIGNMENT:
-	for LINE in ALIGNMENT:
-		if FORMAT is str("FASTA"):
-			if ">" in LINE:
-				SPECIES = re.sub(r'>([0-9A-Za-z_]+)___\n', r'\1', LINE)
-				SEQID = re.sub(r'>[0-9A-Za-z_]+___([0-9A-Za-z_|.]+)\n', r'\1', LINE)
-				if SPECIES in TREE_LIST:
-					SPECIES_LIST.append(SPECIES)
-					SEQIDS[SPECIES] = SEQID
-		else:
-			if FORMAT is str("PHYLIP"):
-			    if re.match(r'\w', LINE):
-				    SPECIES = LINE.split()[0].split("___")[0]
-				    SEQID = LINE.split()[0].split("___")[1]
-				    if SPECIES in TREE_LIST:
-					    SPECIES_LIST.append(SPECIES)
-					    SEQIDS[SPECIES] = SEQID
-			
-# Make list of species in tree that aren't in alignment
-MISSING_LIST = []
-for ITEM in TREE_LIST:
-	if ITEM	not in SPECIES_LIST:
-		MISSING_LIST.append(ITEM)
+# Read the constraint tree once. Returns the tree with the clade names and support values
+# Bio.Phylo gave it: numeric internal labels are support values, and every unnamed clade is named
+# by its preorder index.
+def READ_CONSTRAINT(TREE_FILE):
+    TREE = compact_tree.READ_NEWICK(TREE_FILE)
+    LABELS = TREE['LABELS']
+    NAMES = []
+    CONFIDENCE = []
+    for NODE, ( LABEL, FIRST_CHILD ) in enumerate(zip(TREE['LABEL'].tolist(), TREE['FIRST_CHILD'].tolist())):
+        NAME = LABELS[LABEL] if LABEL >= 0 else ''
+        SUPPORT = None
+        if NAME and FIRST_CHILD != -1:
+            try:
+                SUPPORT = float(NAME)
+                NAME = ''
+            except ValueError:
+                pass
+        NAMES.append(NAME if NAME else str(NODE))
+        CONFIDENCE.append(SUPPORT)
+    TREE['NAMES'] = NAMES
+    TREE['CONFIDENCE'] = CONFIDENCE
+    TREE['LEAF_ORDER'] = compact_tree.LEAVES(TREE).nonzero()[0].tolist()
+    TREE['TERMINALS'] = set( NAMES[NODE] for NODE in TREE['LEAF_ORDER'] )
+    TREE['CHILDREN'] = [ [] for NODE in NAMES ]
+    for NODE, PARENT in enumerate(TREE['PARENT'].tolist()):
+        if PARENT != -1:
+            TREE['CHILDREN'][PARENT].append(NODE)
+    return TREE
 
-# Remove missing species from tree and write this edited tree out to a new file
-for PRUNE in MISSING_LIST:
-	tree.prune(PRUNE)
+# The newick string of the tree with every leaf not named in KEEP pruned, renamed with SEQIDS. The
+# leaves are taken out in preorder as tree.prune() did, on lists of children instead of clade
+# objects, so there is no search for each leaf and the branch lengths are summed in the same order:
+# a node left with a single child is replaced by it, adding its branch length to the child, and a
+# root left with a single child moves down to it, losing the child's branch length.
+def PRUNED_NEWICK(TREE, KEEP, SEQIDS):
+    UP = TREE['PARENT'].tolist()
+    LENGTH = TREE['LENGTH'].tolist()
+    NAMES = TREE['NAMES']
+    CONFIDENCE = TREE['CONFIDENCE']
+    CHILDREN = [ list(KIDS) for KIDS in TREE['CHILDREN'] ]
+    ROOT = 0
+    for LEAF in TREE['LEAF_ORDER']:
+        if NAMES[LEAF] in KEEP:
+            continue
+        PARENT = UP[LEAF]
+        CHILDREN[PARENT].remove(LEAF)
+        if len(CHILDREN[PARENT]) == 1:
+            CHILD = CHILDREN[PARENT][0]
+            if PARENT == ROOT:
+                # NaN is a missing length
+                LENGTH[CHILD] = float('nan')
+                UP[CHILD] = -1
+                ROOT = CHILD
+            else:
+                if LENGTH[CHILD] == LENGTH[CHILD]:
+                    LENGTH[CHILD] += LENGTH[PARENT] if LENGTH[PARENT] == LENGTH[PARENT] else 0.0
+                GRANDPARENT = UP[PARENT]
+                SIBLINGS = CHILDREN[GRANDPARENT]
+                SIBLINGS[SIBLINGS.index(PARENT)] = CHILD
+                UP[CHILD] = GRANDPARENT
+    def LABEL(NODE):
+        NAME = NAMES[NODE]
+        if NAME in SEQIDS:
+            NAME = '___'.join([NAME, SEQIDS[NAME]])
+        MATCH = UNQUOTED.match(NAME)
+        if not MATCH or MATCH.end() < len(NAME):
+            NAME = "'%s'" % NAME.replace("\\", "\\\\").replace("'", "\\'")
+        BRANCH = LENGTH[NODE] if LENGTH[NODE] == LENGTH[NODE] else 0.0
+        if CHILDREN[NODE] and CONFIDENCE[NODE] is not None:
+            return '%s%1.2f:%1.5f' % ( NAME, CONFIDENCE[NODE], BRANCH )
+        return '%s:%1.5f' % ( NAME, BRANCH )
+    # Write the newick with a stack of the children still to write in every open clade
+    PARTS = []
+    STACK = [ [ROOT] ]
+    while True:
+        SIBLINGS = STACK[-1]
+        if not SIBLINGS:
+            # Every child is written, close the clade
+            STACK.pop()
+            PARTS.append(')' + LABEL(STACK[-1].pop(0)))
+        elif CHILDREN[SIBLINGS[0]]:
+            PARTS.append('(')
+            STACK.append(list(CHILDREN[SIBLINGS[0]]))
+            continue
+        else:
+            PARTS.append(LABEL(SIBLINGS.pop(0)))
+        if len(STACK) == 1:
+            break
+        if STACK[-1]:
+            PARTS.append(',')
+    return ''.join(PARTS) + ';'
 
-# Edit names in tree to include the sequence id from the alignment file
-for idx, clade in enumerate(tree.find_clades()):
-    for KEY, VALUE in SEQIDS.iteritems():
-        if (clade.name == KEY):
-            clade.name = '___'.join([KEY, VALUE])
+# Prune the tree down to the species of one alignment and write GENE.TREE_NAME next to it
+def PRUNE(TREE, TREE_NAME, INPUT):
+    GENE = os.path.basename(INPUT).split(".")[0]
+    OUTPUT = os.path.join(os.path.dirname(INPUT), '%s.%s' % (GENE, TREE_NAME))
+    SPECIES_SET, SEQIDS = READ_TAXA(INPUT, TREE['TERMINALS'])
+    if not SPECIES_SET:
+        print('%s: no species of the tree are in the alignment.' % INPUT)
+        return
+    with open(OUTPUT, 'w') as OUT:
+        OUT.write(PRUNED_NEWICK(TREE, SPECIES_SET, SEQIDS) + '\n')
 
-Phylo.write(tree, OUTPUT, 'newick')
-            
\ No newline at end of file
+if args.dirs is None:
+    TREE = READ_CONSTRAINT(args.tree)
+    for INPUT in args.alignments:
+        PRUNE(TREE, os.path.basename(args.tree), INPUT)
+else:
+    for DIR in args.dirs:
+        TREE = READ_CONSTRAINT('%s/%s' % ( DIR, args.tree_name ))
+        for INPUT in sorted(glob('%s/*.phy' % DIR)):
+            PRUNE(TREE, args.tree_name, INPUT)
@@ -0,0 +1,263 @@
+#!/usr/bin/env python
+#
+# report.py
+#
+# This script keeps the results shown in the html report in one data file, REPORT/report.jsonl, and
+# renders all the report pages from it in a single step, instead of every pipeline stage editing the
+# pages in place.
+#
+# Each stage appends its results to the data file with one of these commands:
+#   pages   The species and genes of the report and the template directory (loop.sh, first loop).
+#   column  A column of the species table of the gene pages and/or of the gene table of the species
+#           pages, such as the ublast and hmmsearch hit counts or the long branch and distance
+#           PASS/FAIL results.
+#   figures Figures added to the bottom of the gene pages.
+#   table   Tables of test results added above the species table of the gene pages (final_check.sh).
+# and render then writes every page from the templates and the data, once. Columns, figures and
+# tables are shown in the order they were added, so each loop adds its own after the earlier ones.
+#
+# The data file has one JSON record on each line. The records of a command are keyed by its --stage
+# (the loop and the script, e.g. loop_2/search_optimiztion), its type and, for a column, its header,
+# so a stage that is run again replaces the records it added before, in their place, instead of adding
+# them a second time. The pages record is always replaced. Records added without a stage are kept.
+#
+# Usage:
+# report.py --report REPORT pages --template ~/bin/templates --species species.txt --genes genes.txt
+# report.py --report REPORT --stage loop_1/get_seq column --pages genes species --header 'ublast hits' --class ublast --default 0 --cells cells.txt
+# report.py --report REPORT --stage loop_2/search_optimiztion column --pages genes --header 'Long Branch CDS' --class long_cds --default ' ' --fail_lists 'long_branches/CDS/longbranch_taxa.*.txt'
+# report.py --report REPORT --stage loop_2/search_optimiztion figures --figures figures.txt
+# report.py --report REPORT --stage loop_2/final_check table --rows rows.txt
+# report.py --report REPORT render
+
+import sys, argparse, os, json, fcntl
+from glob import glob
+
+# Argument Parser
+parser = argparse.ArgumentParser(description = 'This script keeps the results shown in the html report in one data file and renders all the report pages from it.')
+parser.add_argument('--report', required=True, help='The report directory.')
+parser.add_argument('--stage', help='[OPTIONAL] The loop and script adding the records. They replace the records of an earlier run of the same stage.')
+COMMANDS = parser.add_subparsers(dest='command')
+PAGES = COMMANDS.add_parser('pages', help='Set the species and genes of the report.')
+PAGES.add_argument('--template', required=True, help='The directory with the index.html, gene.html and species.html templates.')
+PAGES.add_argument('--species', required=True, help='A file with one species on each line.')
+PAGES.add_argument('--genes', required=True, help='A file with one gene on each line.')
+COLUMN = COMMANDS.add_parser('column', help='Add a column to the tables of the gene and/or species pages.')
+COLUMN.add_argument('--pages', nargs='+', choices=['genes', 'species'], default=['genes'], help='The pages the column is added to.')
+COLUMN.add_argument('--header', required=True, help='The column header.')
+COLUMN.add_argument('--after', default='', help='[OPTIONAL] Html added after the header of the species pages.')
+COLUMN.add_argument('--class', dest='css_class', required=True, help='The css class of the cells.')
+COLUMN.add_argument('--default', default='', help='The value of the cells with no other value.')
+COLUMN.add_argument('--cells', help='[OPTIONAL] A tab separated file of gene, species and value.')
+COLUMN.add_argument('--fills', help='[OPTIONAL] A tab separated file of gene and the value of its cells with no other value.')
+COLUMN.add_argument('--fail_lists', help='[OPTIONAL] Pattern of files named PREFIX.GENE.txt listing the species that FAIL for each gene. The other species of those genes PASS.')
+FIGURES = COMMANDS.add_parser('figures', help='Add figures to the gene pages.')
+FIGURES.add_argument('--figures', required=True, help='A tab separated file of gene, heading level, title and image path (the image is optional).')
+TABLE = COMMANDS.add_parser('table', help='Add a table of test results to the gene pages.')
+TABLE.add_argument('--rows', required=True, help='A tab separated file of gene, test, value and pass/fail. The rows of each gene make one table.')
+COMMANDS.add_parser('render', help='Write all the report pages.')
+args = parser.parse_args()
+
+# Lines of the templates the tables are inserted after
+TABLE_LINE = 21
+INDEX_SPECIES_LINE = 37
+INDEX_GENES_LINE = 24
+
+##### Functions
+def DATA_FILE():
+    return '%s/report.jsonl' % args.report
+
+def READ_TSV(TSV_FILE):
+    with open(TSV_FILE, 'r') as INPUT:
+        return [ LINE.rstrip('\n').split('\t') for LINE in INPUT if LINE.strip() ]
+
+def READ_NAMES(NAMES_FILE):
+    with open(NAMES_FILE, 'r') as INPUT:
+        return [ LINE.strip() for LINE in INPUT if LINE.strip() ]
+
+# The key of a record, records with the same key replace each other. None for records without a stage.
+def RECORD_KEY(RECORD):
+    if RECORD['type'] == 'pages':
+        return 'pages'
+    if RECORD.get('stage') is None:
+        return None
+    return json.dumps([ RECORD['stage'], RECORD['type'], RECORD.get('header', '') ])
+
+def READ_DATA():
+    if not os.path.isfile(DATA_FILE()):
+        return []
+    with open(DATA_FILE(), 'r') as INPUT:
+        return [ json.loads(LINE) for LINE in INPUT if LINE.strip() ]
+
+# Add records to the data file. The records they replace are dropped and the new records go where the
+# first of those was, so a rerun keeps the order of the columns. The data file is rewritten through a
+# temporary file while holding a lock on REPORT/report.lock, so stages running at once do not lose
+# each other's records.
+def ADD_RECORDS(RECORDS):
+    for RECORD in RECORDS:
+        RECORD['stage'] = args.stage
+    KEYS = []
+    NEW = {}
+    for RECORD in RECORDS:
+        KEY = RECORD_KEY(RECORD)
+        if KEY not in NEW:
+            KEYS.append(KEY)
+            NEW[KEY] = []
+        NEW[KEY].append(RECORD)
+    with open('%s/report.lock' % args.report, 'a') as LOCK:
+        fcntl.flock(LOCK, fcntl.LOCK_EX)
+        try:
+            KEPT = []
+            for RECORD in READ_DATA():
+                KEY = RECORD_KEY(RECORD)
+                if KEY is None or KEY not in NEW:
+                    KEPT.append(RECORD)
+                elif NEW[KEY]:
+                    KEPT.extend(NEW[KEY])
+                    NEW[KEY] = []
+            for KEY in KEYS:
+                KEPT.extend(NEW[KEY])
+            WRITE_FILE(DATA_FILE(), ''.join( json.dumps(RECORD, sort_keys=True) + '\n' for RECORD in KEPT ))
+        finally:
+            fcntl.flock(LOCK, fcntl.LOCK_UN)
+
+def COLUMN_RECORD():
+    CELLS = []
+    FILLS = {}
+    if args.cells:
+        for FIELDS in READ_TSV(args.cells):
+            CELLS.append([ FIELDS[0], FIELDS[1], FIELDS[2], False ])
+    if args.fills:
+        for FIELDS in READ_TSV(args.fills):
+            FILLS[FIELDS[0]] = FIELDS[1]
+    if args.fail_lists:
+        for FAIL_LIST in sorted(glob(args.fail_lists)):
+            GENE = os.path.basename(FAIL_LIST).split('.')[1]
+            FILLS[GENE] = 'PASS'
+            for SPECIES in READ_NAMES(FAIL_LIST):
+                CELLS.append([ GENE, SPECIES, 'FAIL', True ])
+    return { 'type': 'column', 'pages': args.pages, 'header': args.header, 'after': args.after, 'class': args.css_class,
+             'default': args.default, 'cells': CELLS, 'fills': FILLS }
+
+def CELL(CSS_CLASS, VALUE, FAIL):
+    return "<td class='%s%s'>%s</td>" % ( 'fail ' if FAIL else '', CSS_CLASS, VALUE )
+
+def WRITE_FILE(OUT_FILE, TEXT):
+    TMP_FILE = '%s.%d.tmp' % ( OUT_FILE, os.getpid() )
+    with open(TMP_FILE, 'w') as OUT:
+        OUT.write(TEXT)
+    os.rename(TMP_FILE, OUT_FILE)
+
+def READ_TEMPLATE(TEMPLATE_FILE):
+    with open(TEMPLATE_FILE, 'r') as INPUT:
+        return INPUT.read().splitlines(True)
+
+# Insert blocks of lines after line numbers of a template, as sed's r command does. The later lines
+# go first so the earlier line numbers still hold.
+def INSERT_LINES(LINES, INSERTS):
+    LINES = list(LINES)
+    for LINE, BLOCK in sorted(INSERTS, reverse=True):
+        LINES[LINE:LINE] = BLOCK
+    return ''.join(LINES)
+
+# A row of the species or gene table, linking to the page of its species or gene
+def ROW(PAGE, NAME, CELLS):
+    return '\t\t\t<tr><td><a href="../%s/%s.html">%s</a></td>%s<!--ROW_%s--></tr>\n' % ( PAGE, NAME, NAME, ''.join(CELLS), NAME )
+
+# Write every page from the records
+def RENDER(RECORDS):
+    SETUP = None
+    COLUMNS = []
+    FIGURES = {}
+    TABLES = {}
+    for RECORD in RECORDS:
+        if RECORD['type'] == 'pages':
+            SETUP = RECORD
+        elif RECORD['type'] == 'column':
+            # Cells by page, then page name, then row name
+            CELLS = { 'genes': {}, 'species': {} }
+            for GENE, SPECIES, VALUE, FAIL in RECORD['cells']:
+                CELLS['genes'].setdefault(GENE, {})[SPECIES] = ( VALUE, FAIL )
+                CELLS['species'].setdefault(SPECIES, {})[GENE] = ( VALUE, FAIL )
+            RECORD['by_page'] = CELLS
+            COLUMNS.append(RECORD)
+        elif RECORD['type'] == 'figure':
+            FIGURES.setdefault(RECORD['gene'], []).append(RECORD)
+        elif RECORD['type'] == 'table':
+            TABLES.setdefault(RECORD['gene'], []).append(RECORD)
+    if SETUP is None:
+        print('No pages in %s, run report.py pages first.' % DATA_FILE())
+        return
+    TEMPLATE = SETUP['template']
+    for PAGE in ( 'genes', 'species' ):
+        if not os.path.isdir('%s/%s' % ( args.report, PAGE )):
+            os.makedirs('%s/%s' % ( args.report, PAGE ))
+
+    # Gene pages, with a row for every species
+    GENE_TEMPLATE = READ_TEMPLATE('%s/gene.html' % TEMPLATE)
+    GENE_COLUMNS = [ COLUMN for COLUMN in COLUMNS if 'genes' in COLUMN['pages'] ]
+    GENE_HEADER = ''.join( '<th>%s</th>' % COLUMN['header'] for COLUMN in GENE_COLUMNS ) + '<!--THEAD-->'
+    for GENE in SETUP['genes']:
+        ROWS = []
+        for SPECIES in SETUP['species']:
+            CELLS = []
+            for COLUMN in GENE_COLUMNS:
+                VALUE, FAIL = COLUMN['by_page']['genes'].get(GENE, {}).get(SPECIES, ( COLUMN['fills'].get(GENE, COLUMN['default']), False ))
+                CELLS.append(CELL(COLUMN['class'], VALUE, FAIL))
+            ROWS.append(ROW('species', SPECIES, CELLS))
+        TEXT = INSERT_LINES(GENE_TEMPLATE, [ ( TABLE_LINE, ROWS ) ])
+        TEXT = TEXT.replace('<!--GENE-->', GENE).replace('<!--THEAD-->', GENE_HEADER)
+        FIGURE_HTML = ''
+        for FIGURE in FIGURES.get(GENE, []):
+            FIGURE_HTML += '<h%d>%s</h%d>\n\t' % ( FIGURE['level'], FIGURE['title'], FIGURE['level'] )
+            if FIGURE['src']:
+                FIGURE_HTML += '<img src="%s" />\n\t' % FIGURE['src']
+        TEXT = TEXT.replace('<!--FIGURES-->', FIGURE_HTML + '<!--FIGURES-->')
+        TABLE_HTML = ''
+        for TABLE in TABLES.get(GENE, []):
+            TABLE_HTML += '<table><thead><tr><th>Test</th><th>Value</th><th>Pass/Fail</th></tr></thead><tbody>%s</tbody></table>\n' % ''.join( '<tr><td>%s</td><td>%s</td><td>%s</td></tr>' % tuple(TABLE_ROW) for TABLE_ROW in TABLE['rows'] )
+        TEXT = TEXT.replace('<!--SPECIES TABLE-->', TABLE_HTML + '<!--SPECIES TABLE-->')
+        WRITE_FILE('%s/genes/%s.html' % ( args.report, GENE ), TEXT)
+
+    # Species pages, with a row for every gene
+    SPECIES_TEMPLATE = READ_TEMPLATE('%s/species.html' % TEMPLATE)
+    SPECIES_COLUMNS = [ COLUMN for COLUMN in COLUMNS if 'species' in COLUMN['pages'] ]
+    SPECIES_HEADER = ''.join( '<th>%s</th>' % COLUMN['header'] for COLUMN in SPECIES_COLUMNS ) + '<!--THEAD-->' + ''.join( COLUMN['after'] for COLUMN in SPECIES_COLUMNS )
+    for SPECIES in SETUP['species']:
+        ROWS = []
+        for GENE in SETUP['genes']:
+            CELLS = []
+            for COLUMN in SPECIES_COLUMNS:
+                VALUE, FAIL = COLUMN['by_page']['species'].get(SPECIES, {}).get(GENE, ( COLUMN['default'], False ))
+                CELLS.append(CELL(COLUMN['class'], VALUE, FAIL))
+            ROWS.append(ROW('genes', GENE, CELLS))
+        TEXT = INSERT_LINES(SPECIES_TEMPLATE, [ ( TABLE_LINE, ROWS ) ])
+        TEXT = TEXT.replace('<!--SPECIES-->', SPECIES).replace('<!--THEAD-->', SPECIES_HEADER)
+        WRITE_FILE('%s/species/%s.html' % ( args.report, SPECIES ), TEXT)
+
+    # Index page, linking to every species and gene page
+    SPECIES_ROWS = [ ROW('species', SPECIES, []).replace('href="../', 'href="') for SPECIES in SETUP['species'] ]
+    GENE_ROWS = [ ROW('genes', GENE, []).replace('href="../', 'href="') for GENE in SETUP['genes'] ]
+    TEXT = INSERT_LINES(READ_TEMPLATE('%s/index.html' % TEMPLATE), [ ( INDEX_SPECIES_LINE, SPECIES_ROWS ), ( INDEX_GENES_LINE, GENE_ROWS ) ])
+    WRITE_FILE('%s/index.html' % args.report, TEXT)
+
+##### END FUNCTIONS
+
+if not os.path.isdir(args.report):
+    os.makedirs(args.report)
+if args.command == 'pages':
+    ADD_RECORDS([ { 'type': 'pages', 'template': os.path.abspath(args.template), 'species': READ_NAMES(args.species), 'genes': READ_NAMES(args.genes) } ])
+elif args.command == 'column':
+    ADD_RECORDS([ COLUMN_RECORD() ])
+elif args.command == 'figures':
+    ADD_RECORDS([ { 'type': 'figure', 'gene': FIELDS[0], 'level': int(FIELDS[1]), 'title': FIELDS[2], 'src': FIELDS[3] if len(FIELDS) > 3 else '' } for FIELDS in READ_TSV(args.figures) ])
+elif args.command == 'table':
+    ROWS = {}
+    GENES = []
+    for FIELDS in READ_TSV(args.rows):
+        if FIELDS[0] not in ROWS:
+            GENES.append(FIELDS[0])
+            ROWS[FIELDS[0]] = []
+        ROWS[FIELDS[0]].append(FIELDS[1:4])
+    ADD_RECORDS([ { 'type': 'table', 'gene': GENE, 'rows': ROWS[GENE] } for GENE in GENES ])
+elif args.command == 'render':
+    RENDER(READ_DATA())
@@ -0,0 +1,120 @@
+#
+# rooting.py
+#
+# Outgroup rooting shared by distance_matrix_zscore.py, long_branches.py and paralogs.py.
+#
+# The outgroup file has an Outgroup1 line followed by the species of the outgroup, all separated by
+# spaces, and optional Outgroup2 and Outgroup3 lines as backups. A tree is rooted on the first
+# outgroup with any species present in it, using one sequence per species (the last one in the
+# tree), and at the midpoint when none of them are present.
+#
+# The chosen root is kept in memory, keyed on the size and modification time of the tree and on the
+# outgroups, so rooting the same tree again in a process only reads the outgroup sequences back.
+# With a CACHE_DIR, normally in the output directory of the script, it is also kept there in a small
+# sidecar file for the next run.
+
+import os, hashlib
+
+TIERS = { 'Outgroup1': 0, 'Outgroup2': 1, 'Outgroup3': 2 }
+
+# Roots already chosen in this process, by tree file
+ROOTS = {}
+
+# Read the outgroup file into a list of three sets of species, one for each outgroup line.
+def READ_OUTGROUPS(OUTGROUP_FILE):
+    OUTGROUPS = [ set(), set(), set() ]
+    with open(OUTGROUP_FILE, 'r') as INPUT:
+        for LINE in INPUT:
+            FIELDS = LINE.split()
+            if FIELDS and FIELDS[0] in TIERS:
+                OUTGROUPS[TIERS[FIELDS[0]]].update(FIELDS[2:])
+    return OUTGROUPS
+
+# Pick the outgroup sequences from the leaf names of a tree in a single pass. Returns the
+# sequences of the first outgroup with species in the tree, or an empty list if there are none.
+def FIND_OUTGROUP(LEAF_NAMES, OUTGROUPS):
+    FOUND = [ {}, {}, {} ]
+    for NAME in LEAF_NAMES:
+        SPECIES = NAME.split('___')[0]
+        for TIER, OUTGROUP in enumerate(OUTGROUPS):
+            if SPECIES in OUTGROUP:
+                FOUND[TIER][SPECIES] = NAME
+    for SEQUENCES in FOUND:
+        if SEQUENCES:
+            return sorted(SEQUENCES.values())
+    return []
+
+# Identifies the outgroups in the cache key
+def OUTGROUP_KEY(OUTGROUPS):
+    TEXT = '\n'.join( ' '.join(sorted(OUTGROUP)) for OUTGROUP in OUTGROUPS )
+    return hashlib.md5(TEXT.encode('utf-8')).hexdigest()
+
+def CACHE_FILE(TREE_FILE, CACHE_DIR):
+    return '%s/%s.root' % ( CACHE_DIR, os.path.basename(TREE_FILE) )
+
+# The tree file as of its current size and modification time, with the outgroups
+def ROOT_STAMP(TREE_FILE, KEY):
+    STAT = os.stat(TREE_FILE)
+    return '%s\t%d\t%r\t%s' % ( os.path.abspath(TREE_FILE), STAT.st_size, STAT.st_mtime, KEY )
+
+# Read the cached root of a tree file. Returns MIDPOINT, SEQUENCES or None if there is no
+# current root for this version of the file and these outgroups.
+def LOAD_ROOT(TREE_FILE, KEY, CACHE_DIR=None):
+    STAMP = ROOT_STAMP(TREE_FILE, KEY)
+    if TREE_FILE in ROOTS and ROOTS[TREE_FILE][0] == STAMP:
+        return ROOTS[TREE_FILE][1:]
+    if CACHE_DIR is None:
+        return None
+    try:
+        with open(CACHE_FILE(TREE_FILE, CACHE_DIR), 'r') as INPUT:
+            LINES = INPUT.read().splitlines()
+    except IOError:
+        return None
+    if len(LINES) < 2 or LINES[0] != STAMP:
+        return None
+    ROOTS[TREE_FILE] = ( STAMP, LINES[1] == 'midpoint', LINES[2:] )
+    return ROOTS[TREE_FILE][1:]
+
+def SAVE_ROOT(TREE_FILE, KEY, MIDPOINT, SEQUENCES, CACHE_DIR=None):
+    STAMP = ROOT_STAMP(TREE_FILE, KEY)
+    ROOTS[TREE_FILE] = ( STAMP, MIDPOINT, SEQUENCES )
+    if CACHE_DIR is None:
+        return
+    OUT_FILE = CACHE_FILE(TREE_FILE, CACHE_DIR)
+    TMP_FILE = '%s.%d.tmp' % ( OUT_FILE, os.getpid() )
+    try:
+        # Another worker may make the directory at the same time
+        try:
+            os.makedirs(os.path.dirname(OUT_FILE))
+        except OSError:
+            if not os.path.isdir(os.path.dirname(OUT_FILE)):
+                raise
+        with open(TMP_FILE, 'w') as OUT:
+            OUT.write('%s\n%s\n' % ( STAMP, 'midpoint' if MIDPOINT else 'outgroup' ))
+            for SEQUENCE in SEQUENCES:
+                OUT.write('%s\n' % SEQUENCE)
+        os.rename(TMP_FILE, OUT_FILE)
+    except (IOError, OSError):
+        print('Could not write root cache %s' % OUT_FILE)
+
+# Root T, read from TREE_FILE and not yet rerooted, on its outgroup. OUTGROUPS comes from
+# READ_OUTGROUPS and NAME is used in the midpoint rooting message (the tree file by default).
+# The root is also cached in CACHE_DIR when one is given. A midpoint root is cached as the leaves
+# of the midpoint outgroup, whose common ancestor in the tree as read is that same node.
+def ROOT_TREE(T, TREE_FILE, OUTGROUPS, NAME=None, CACHE_DIR=None):
+    KEY = OUTGROUP_KEY(OUTGROUPS)
+    CACHED = LOAD_ROOT(TREE_FILE, KEY, CACHE_DIR)
+    if CACHED is None:
+        SEQUENCES = FIND_OUTGROUP(T.get_leaf_names(), OUTGROUPS)
+        MIDPOINT = len( SEQUENCES ) < 1
+        if MIDPOINT:
+            SEQUENCES = T.get_midpoint_outgroup().get_leaf_names()
+        SAVE_ROOT(TREE_FILE, KEY, MIDPOINT, SEQUENCES, CACHE_DIR)
+    else:
+        MIDPOINT, SEQUENCES = CACHED
+    if MIDPOINT:
+        print("%s: No outgroup taxa present. Rooting at midpoint instead. This may break a monophyletic group." % ( TREE_FILE if NAME is None else NAME ))
+    if len( SEQUENCES ) > 1:
+        T.set_outgroup( T.get_common_ancestor( SEQUENCES ) )
+    else:
+        T.set_outgroup( SEQUENCES[0] )
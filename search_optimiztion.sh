@@ -124,10 +124,9 @@ cp $WORKING/supermatrix/CDS/RAxML_bestTree.loop_"$LOOP_NUMBER"_cds.tre $WORKING/
 cd $WORKING/gene_trees/CDS/
 echo "FILE=($(find $WORKING/gene_trees/CDS/*.phy -type f -exec basename {} \; | sed 's,.phy,,' ))" >> $INPUT/log.txt
 FILE=($(find $WORKING/gene_trees/CDS/*.phy -type f | sed 's#.*/##' | sed 's,.phy,,' ))
-printf "%s\n" "${FILE[@]}" | xargs -n 1 -P $THREADS -I % prune_tree.py constraint.tre %".phy"
 cp $WORKING/supermatrix/PEP/RAxML_bestTree.loop_"$LOOP_NUMBER"_pep.tre $WORKING/gene_trees/PEP/constraint.tre
-cd $WORKING/gene_trees/PEP/
-printf "%s\n" "${FILE[@]}" | xargs -n 1 -P $THREADS -I % prune_tree.py constraint.tre %".phy"
+# Each constraint tree is read once and pruned for every gene in its directory
+prune_tree.py --dirs $WORKING/gene_trees/CDS $WORKING/gene_trees/PEP
 
 # run raxml
 # since raxml insists on at least 2 threads we need to set a variable that is 1/2 of our total threads rounding down
@@ -150,158 +149,66 @@ mkdir -p $WORKING/long_branches/CDS
 mkdir -p $WORKING/long_branches/PEP
 printf "***************************   Running long branch analysis on each gene tree ***************************\n"
 echo "Starting long_branch.py analysis on $(date)" >> $INPUT/log.txt
-printf "%s\n" "${FILE[@]}" | xargs -n 1 -P $THREADS -I % long_branches.py --tree $WORKING/gene_trees/CDS/RAxML_result.%.constrained.tre --multi 7 --out_dir $WORKING/long_branches/CDS --outgroups $OUTGROUPS
-printf "%s\n" "${FILE[@]}" | xargs -n 1 -P $THREADS -I % long_branches.py --tree $WORKING/gene_trees/PEP/RAxML_result.%.constrained.tre --multi 7 --out_dir $WORKING/long_branches/PEP --outgroups $OUTGROUPS
+long_branches.py --tree_dir $WORKING/gene_trees/CDS --genes "${FILE[@]}" --multi 7 --out_dir $WORKING/long_branches/CDS --outgroups $OUTGROUPS --threads $THREADS
+long_branches.py --tree_dir $WORKING/gene_trees/PEP --genes "${FILE[@]}" --multi 7 --out_dir $WORKING/long_branches/PEP --outgroups $OUTGROUPS --threads $THREADS
 
-# Generate Report for Long Branch Analysis
-RFILE=($(find $REPORT/genes/*.html -type f | sed 's#.*/##'))
-function REPORT_LONG {
-    HTML_FILE=$1
-    FILE_PATH=$INPUT/report/genes/$HTML_FILE
-    GENE=${HTML_FILE/.html/}
-    LONG_CDS=$WORKING/long_branches/CDS/"longbranch_taxa."$GENE".txt"
-    LONG_PEP=$WORKING/long_branches/PEP/"longbranch_taxa."$GENE".txt"
-    if [ -f $LONG_CDS ]
-        then
-            readarray SPECIES_LIST < $LONG_CDS
-            for SPECIES in ${SPECIES_LIST[@]}
-                do
-                    ROW=\<\!--ROW_"$SPECIES"--\>
-                    sed -i "s,$ROW,<td class='fail long_cds'>FAIL</td>$ROW," $FILE_PATH
-                done
-            sed -i "s,\(<td class='hmm'>[0-9]*</td>\)<\!--,\1<td class='long_cds'>PASS</td><\!--,g" $FILE_PATH
-        else
-            sed -i "s,<\!--ROW,<td class='long_cds'> </td><\!--ROW,g" $FILE_PATH
-    fi
-    if [ -f $LONG_PEP ]
-        then
-            readarray SPECIES_LIST < $LONG_PEP
-            for SPECIES in ${SPECIES_LIST[@]}
-                do
-                    ROW=\<\!--ROW_"$SPECIES"--\>
-                    sed -i "s,$ROW,<td class='fail long_pep'>FAIL</td>$ROW," $FILE_PATH
-                done
-            sed -i "s,\(long_cds'>[ A-Z]*</td>\)<\!--,\1<td class='long_pep'>PASS</td><\!--,g" $FILE_PATH
-        else
-            sed -i "s,<\!--ROW,<td class='long_pep'> </td><\!--ROW,g" $FILE_PATH
-    fi
-}
-export -f REPORT_LONG
-printf "%s\n" "${RFILE[@]}" | xargs -n 1 -P $THREADS -I % bash -c 'REPORT_LONG %'
-
-# Add header column to gene report files and fill in zero counts in species and gene tables
-cd $REPORT/genes
-printf "%s\n" "${RFILE[@]}" | xargs -n 1 -P $THREADS -I % sed -i "s,\(<\!--THEAD-->\),<th>Long Branch CDS</th><th>Long branch PEP</th>\1," %
+# Generate Report for Long Branch Analysis. Species listed for a gene FAIL and its other species PASS.
+report.py --report $REPORT --stage loop_"$LOOP_NUMBER"/search_optimiztion column --pages genes --header 'Long Branch CDS' --class long_cds --default ' ' --fail_lists "$WORKING/long_branches/CDS/longbranch_taxa.*.txt"
+report.py --report $REPORT --stage loop_"$LOOP_NUMBER"/search_optimiztion column --pages genes --header 'Long branch PEP' --class long_pep --default ' ' --fail_lists "$WORKING/long_branches/PEP/longbranch_taxa.*.txt"
 
 # Add Long Branch Analysis Figures
-function LONG_FIGS {
-    HTML_FILE=$1
-    GENE=${HTML_FILE/.html/}
-    RPATH=../figures/"loop_"$LOOP_NUMBER/long_branches
-    HIST=$GENE".hist.pdf"
-    TREE=$GENE".tre.pdf"
-    if [ -f $LONG_FIG_PEP/$TREE ]
-        then sed -i "s,\(<\!--FIGURES-->\),<h2>Loop $LOOP_NUMBER</h2>\n\t\1,
-            s,\(<\!--FIGURES-->\),<h3>Long Branch CDS Histogram</h3>\n\t<img src=\"$RPATH/CDS/$HIST\" />\n\t\1,
-            s,\(<\!--FIGURES-->\),<h3>Long Branch PEP Histogram</h3>\n\t<img src=\"$RPATH/PEP/$HIST\" />\n\t\1,
-            s,\(<\!--FIGURES-->\),<h3>Long Branch CDS Tree</h3>\n\t<img src=\"$RPATH/CDS/$TREE\" />\n\t\1,
-            s,\(<\!--FIGURES-->\),<h3>Long Branch PEP Tree</h3>\n\t<img src=\"$RPATH/PEP/$TREE\" />\n\t\1," $HTML_FILE
-    fi
-}
-export -f LONG_FIGS
 LONG_FIG_CDS=$REPORT/figures/"loop_"$LOOP_NUMBER/long_branches/CDS
 LONG_FIG_PEP=$REPORT/figures/"loop_"$LOOP_NUMBER/long_branches/PEP
-export LONG_FIG_PEP
 mkdir -p $LONG_FIG_CDS $LONG_FIG_PEP
 cp $WORKING/long_branches/CDS/*.pdf $LONG_FIG_CDS
 cp $WORKING/long_branches/PEP/*.pdf $LONG_FIG_PEP
-RFILE=($(find $REPORT/genes/*.html -type f | sed 's#.*/##'))
-cd $REPORT/genes
-printf "%s\n" "${RFILE[@]}" | xargs -n 1 -P $THREADS -I % bash -c 'LONG_FIGS %'
+RPATH=../figures/"loop_"$LOOP_NUMBER/long_branches
+for GENE in $(cat $REPORT/genes.txt); do
+    HIST=$GENE".hist.pdf"
+    TREE=$GENE".tre.pdf"
+    if [ -f $LONG_FIG_PEP/$TREE ]; then
+        printf "%s\t2\tLoop %s\n" $GENE $LOOP_NUMBER
+        printf "%s\t3\tLong Branch CDS Histogram\t%s\n" $GENE $RPATH/CDS/$HIST
+        printf "%s\t3\tLong Branch PEP Histogram\t%s\n" $GENE $RPATH/PEP/$HIST
+        printf "%s\t3\tLong Branch CDS Tree\t%s\n" $GENE $RPATH/CDS/$TREE
+        printf "%s\t3\tLong Branch PEP Tree\t%s\n" $GENE $RPATH/PEP/$TREE
+    fi
+done > $WORKING/long_branches/report_figures.txt
+report.py --report $REPORT --stage loop_"$LOOP_NUMBER"/search_optimiztion figures --figures $WORKING/long_branches/report_figures.txt
 
 # Distance Matrix Analysis
 
-# Generate raxml pairwise distance matrixes for each gene
-printf "***************************   Generating distance matrixes for constrained trees ***************************\n"
-echo "Starting RAxML distance matrix calculation on $(date)" >> $INPUT/log.txt
-cd $WORKING/gene_trees/CDS
-printf "%s\n" "${FILE[@]}" | xargs -n 1 -P $RUNS -I % raxmlHPC-PTHREADS-SSE3 -T 2 -f x -p 258755 -s %".phy" -n %".txt" -m GTRGAMMA -t %".constraint.tre"
-cd $WORKING/gene_trees/PEP
-printf "%s\n" "${FILE[@]}" | xargs -n 1 -P $RUNS -I % raxmlHPC-PTHREADS-SSE3 -T 2 -f x -p 258755 -s %".phy" -n %".txt" -m PROTGAMMAAUTO -t %".constraint.tre"
+# The pairwise distances are taken from the branch lengths of the constrained trees (--patristic),
+# so there is no separate raxml distance matrix run.
 # Run analysis of distances to flag outliers for each sequence
 printf "***************************   Running distance matrix analysis  ***************************\n"
 echo "Starting distance_matrix_zscore.py on $(date)" >> $INPUT/log.txt
 mkdir -p $WORKING/dist_m_zscore/CDS
 mkdir -p $WORKING/dist_m_zscore/PEP
-printf "***************************   CDS Files  ***************************\n"
-echo "distance_matrix_zscore.py --input $WORKING/gene_trees/CDS/ --score 85 --tree $WORKING/gene_trees/CDS/ --out $WORKING/dist_m_zscore/CDS/ --outgroups $OUTGROUPS" >> $INPUT/log.txt
-distance_matrix_zscore.py --input $WORKING/gene_trees/CDS/ --score 85 --tree $WORKING/gene_trees/CDS/ --out $WORKING/dist_m_zscore/CDS/ --outgroups $OUTGROUPS
-printf "***************************   PEP Files  ***************************\n"
-echo "distance_matrix_zscore.py --input $WORKING/gene_trees/PEP/ --score 90 --tree $WORKING/gene_trees/PEP/ --out $WORKING/dist_m_zscore/PEP/ --outgroups $OUTGROUPS" >> $INPUT/log.txt
-distance_matrix_zscore.py --input $WORKING/gene_trees/PEP/ --score 90 --tree $WORKING/gene_trees/PEP/ --out $WORKING/dist_m_zscore/PEP/ --outgroups $OUTGROUPS
+# CDS and PEP are analyzed in one run. The ratio of every species in every gene is kept in outlier_ratios.txt in each output directory.
+printf "***************************   CDS and PEP Files  ***************************\n"
+echo "distance_matrix_zscore.py --input $WORKING/gene_trees/CDS/ $WORKING/gene_trees/PEP/ --score 85 90 --tree $WORKING/gene_trees/CDS/ $WORKING/gene_trees/PEP/ --out $WORKING/dist_m_zscore/CDS/ $WORKING/dist_m_zscore/PEP/ --outgroups $OUTGROUPS --patristic" >> $INPUT/log.txt
+distance_matrix_zscore.py --input $WORKING/gene_trees/CDS/ $WORKING/gene_trees/PEP/ --score 85 90 --tree $WORKING/gene_trees/CDS/ $WORKING/gene_trees/PEP/ --out $WORKING/dist_m_zscore/CDS/ $WORKING/dist_m_zscore/PEP/ --outgroups $OUTGROUPS --patristic
 
-# Generate Report for Distance Matrix Analysis
-RFILE=($(find $REPORT/genes/*.html -type f | sed 's#.*/##'))
-function REPORT_DIST {
-    HTML_FILE=$1
-    FILE_PATH=$INPUT/report/genes/$HTML_FILE
-    GENE=${HTML_FILE/.html/}
-    DIST_CDS=$WORKING/dist_m_zscore/CDS/"outlier_taxa."$GENE".txt"
-    DIST_PEP=$WORKING/dist_m_zscore/PEP/"outlier_taxa."$GENE".txt"
-    if [ -f $DIST_CDS ]
-        then
-            readarray BAD_SPECIES_LIST < $DIST_CDS
-            for SPECIES in ${BAD_SPECIES_LIST[@]}
-                do
-                    ROW=\<\!--ROW_"$SPECIES"--\>
-                    sed -i "s,$ROW,<td class='fail dist_cds'>FAIL</td>$ROW," $FILE_PATH
-                done
-            sed -i "s,\(long_pep'>[ A-Z]*</td>\)<\!--,\1<td class='dist_cds'>PASS</td><\!--,g" $FILE_PATH
-        else
-            sed -i "s,<\!--ROW,<td class='dist_cds'>N/A</td><\!--ROW,g" $FILE_PATH
-    fi
-    if [ -f $DIST_PEP ]
-        then
-            readarray BAD_SPECIES_LIST < $DIST_PEP
-            for SPECIES in ${BAD_SPECIES_LIST[@]}
-                do
-                    ROW=\<\!--ROW_"$SPECIES"--\>
-                    sed -i "s,$ROW,<td class='fail dist_pep'>FAIL</td>$ROW," $FILE_PATH
-                done
-            sed -i "s,\(dist_cds'>[ A-Z]*</td>\)<\!--,\1<td class='dist_pep'>PASS</td><\!--,g" $FILE_PATH
-        else
-            sed -i "s,<\!--ROW,<td class='dist_pep'>N/A</td><\!--ROW,g" $FILE_PATH
-    fi
-}
-export -f REPORT_DIST
-printf "%s\n" "${RFILE[@]}" | xargs -n 1 -P $THREADS -I % bash -c 'REPORT_DIST %'
-
-# Add header column to gene report files and fill in zero counts in species and gene tables
-cd $REPORT/genes
-printf "%s\n" "${RFILE[@]}" | xargs -n 1 -P $THREADS -I % sed -i "s,\(<\!--THEAD-->\),<th>Distance CDS</th><th>Distance PEP</th>\1," %
+# Generate Report for Distance Matrix Analysis. Species listed for a gene FAIL and its other species PASS.
+report.py --report $REPORT --stage loop_"$LOOP_NUMBER"/search_optimiztion column --pages genes --header 'Distance CDS' --class dist_cds --default 'N/A' --fail_lists "$WORKING/dist_m_zscore/CDS/outlier_taxa.*.txt"
+report.py --report $REPORT --stage loop_"$LOOP_NUMBER"/search_optimiztion column --pages genes --header 'Distance PEP' --class dist_pep --default 'N/A' --fail_lists "$WORKING/dist_m_zscore/PEP/outlier_taxa.*.txt"
 
 # Add Distance Matrix Figures
-function DIST_FIGS {
-    HTML_FILE=$1
-    GENE=${HTML_FILE/.html/}
-    RPATH=../figures/"loop_"$LOOP_NUMBER/dist_m_zscore
-    HIST=$GENE".hist.pdf"
-    TREE=$GENE".tre.pdf"
-    if [ -f $DIST_FIG_PEP/$TREE ]
-        then sed -i "s,\(<\!--FIGURES-->\),<h3>Distance Matrix CDS Tree</h3>\n\t<img src=\"$RPATH/CDS/$TREE\" />\n\t\1,
-            s,\(<\!--FIGURES-->\),<h3>Distance Matrix PEP Tree</h3>\n\t<img src=\"$RPATH/PEP/$TREE\" />\n\t\1," $HTML_FILE
-    fi
-}
-export -f DIST_FIGS
 DIST_FIG_CDS=$REPORT/figures/"loop_"$LOOP_NUMBER/dist_m_zscore/CDS
 DIST_FIG_PEP=$REPORT/figures/"loop_"$LOOP_NUMBER/dist_m_zscore/PEP
-export DIST_FIG_PEP
 mkdir -p $DIST_FIG_CDS $DIST_FIG_PEP
 cp $WORKING/dist_m_zscore/CDS/*.pdf $DIST_FIG_CDS
 cp $WORKING/dist_m_zscore/PEP/*.pdf $DIST_FIG_PEP
-RFILE=($(find $REPORT/genes/*.html -type f | sed 's#.*/##'))
-cd $REPORT/genes
-printf "%s\n" "${RFILE[@]}" | xargs -n 1 -P $THREADS -I % bash -c 'DIST_FIGS %'
+RPATH=../figures/"loop_"$LOOP_NUMBER/dist_m_zscore
+for GENE in $(cat $REPORT/genes.txt); do
+    TREE=$GENE".tre.pdf"
+    if [ -f $DIST_FIG_PEP/$TREE ]; then
+        printf "%s\t3\tDistance Matrix CDS Tree\t%s\n" $GENE $RPATH/CDS/$TREE
+        printf "%s\t3\tDistance Matrix PEP Tree\t%s\n" $GENE $RPATH/PEP/$TREE
+    fi
+done > $WORKING/dist_m_zscore/report_figures.txt
+report.py --report $REPORT --stage loop_"$LOOP_NUMBER"/search_optimiztion figures --figures $WORKING/dist_m_zscore/report_figures.txt
 
 ############
 # inparalog Analysis
@@ -2,24 +2,121 @@
 
 # Author: Gregory S Mendez
 
-# This script will create a super matrix alignment file in nexus format from input alignments in nexus format
+# This script will create a super matrix alignment file in nexus format from input alignments in nexus format.
+# It also writes the super matrix in relaxed phylip format, with the taxon names cleaned by alignment.PHYLIP_NAME,
+# and a RAxML partition file with one partition for each gene, so the nexus file does not have to be converted
+# afterwards.
+
+# Each alignment is read once and its sequences are written to a temporary file next to the output, so
+# only one gene and the index of where each taxon's sequences are kept in memory. The matrix is then
+# written one taxon at a time from the temporary file. Taxa missing from a gene are filled with the
+# missing character, and taxa are written in the order they are first found in the alignments, sorted
+# by file name. The genes are named by their file name without .nex in the charsets and partitions.
 
 # Named variables. Every run needs the following defined:
 # 1) --in_dir - The directory containing the nexus alignments that need to be merged.
 # 2) --out - The full filepath and name you want for the output file.
+# 3) --phylip - [OPTIONAL] The relaxed phylip output file (default OUT with .phylip in place of .nex).
+# 4) --partitions - [OPTIONAL] The RAxML partition file (default OUT with .partitions in place of .nex).
+# 5) --protein_model - [OPTIONAL] The RAxML model of the protein partitions (default AUTO).
 
-from Bio.Nexus import Nexus
-import argparse, glob
+import argparse, glob, os, mmap
+import numpy
+import alignment
 
 # Argument Parser
 parser = argparse.ArgumentParser(description = 'This script will create a super matrix alignment file from input alignments')
 parser.add_argument('--in_dir', required=True, help='The input directory containing alignment files.')
 parser.add_argument('--out', required=True, help='The filepath and filename of the output file.')
-args = parser.parse_args() 
+parser.add_argument('--phylip', help='[OPTIONAL] The relaxed phylip output file (default OUT with .phylip in place of .nex).')
+parser.add_argument('--partitions', help='[OPTIONAL] The RAxML partition file (default OUT with .partitions in place of .nex).')
+parser.add_argument('--protein_model', default='AUTO', help='[OPTIONAL] The RAxML model of the protein partitions.')
+args = parser.parse_args()
 
 IN_DIR = args.in_dir
 OUT = args.out
-FILE_LIST = glob.glob('%s/*.nex' % IN_DIR)
-NEXI =  [(FNAME, Nexus.Nexus(FNAME)) for FNAME in FILE_LIST]
-COMBINED = Nexus.combine(NEXI)
-COMBINED.write_nexus_data(filename=open('%s' % OUT, 'w'))
\ No newline at end of file
+OUT_BASE = OUT[:-4] if OUT.endswith('.nex') else OUT
+PHYLIP = args.phylip if args.phylip else OUT_BASE + '.phylip'
+PARTITIONS = args.partitions if args.partitions else OUT_BASE + '.partitions'
+FILE_LIST = sorted(glob.glob('%s/*.nex' % IN_DIR))
+SCRATCH_FILE = '%s.%d.tmp' % ( OUT, os.getpid() )
+
+# The scratch file is removed even when reading the alignments or writing the matrix fails
+try:
+    # Read every alignment once, keeping its sequences in the scratch file. The gap and missing characters of
+    # the first alignment are used for all of them, as Bio's Nexus.combine did.
+    GENES = []
+    TAXA = []
+    TAXA_SEEN = set()
+    GAP = MISSING = None
+    with open(SCRATCH_FILE, 'wb') as SCRATCH:
+        for FNAME in FILE_LIST:
+            GENE = alignment.READ_NEXUS(FNAME)
+            GENE_NCHAR = alignment.NCHAR(GENE)
+            if not GENE_NCHAR:
+                print('%s has no characters, skipping it.' % FNAME)
+                continue
+            if GAP is None:
+                GAP, MISSING, DATATYPE = GENE['GAP'], GENE['MISSING'], GENE['DATATYPE']
+            elif GENE['DATATYPE'] != DATATYPE:
+                DATATYPE = 'None'
+            MATRIX = GENE['MATRIX']
+            if GENE['GAP'] != GAP:
+                MATRIX = numpy.where(MATRIX == ord(GENE['GAP']), numpy.uint8(ord(GAP)), MATRIX)
+            if GENE['MISSING'] != MISSING:
+                MATRIX = numpy.where(MATRIX == ord(GENE['MISSING']), numpy.uint8(ord(MISSING)), MATRIX)
+            START = SCRATCH.tell()
+            SCRATCH.write(numpy.ascontiguousarray(MATRIX).tobytes())
+            ROWS = dict( ( TAXON, START + ROW * GENE_NCHAR ) for ROW, TAXON in enumerate(GENE['NAMES']) )
+            for TAXON in GENE['NAMES']:
+                if TAXON not in TAXA_SEEN:
+                    TAXA_SEEN.add(TAXON)
+                    TAXA.append(TAXON)
+            GENES.append(( os.path.basename(FNAME)[:-4], GENE_NCHAR, GENE['DATATYPE'], ROWS ))
+            del GENE, MATRIX
+
+    if not TAXA:
+        raise SystemExit('No alignments found in %s' % IN_DIR)
+
+    NCHAR = sum( GENE[1] for GENE in GENES )
+    NEXUS_WIDTH = max( len(alignment.NEXUS_NAME(TAXON)) for TAXON in TAXA ) + 1
+    PHYLIP_WIDTH = max( len(alignment.PHYLIP_NAME(TAXON)) for TAXON in TAXA ) + 1
+
+    # Write the matrix one taxon at a time, to the nexus and phylip files together
+    with open(SCRATCH_FILE, 'rb') as SCRATCH, open(OUT, 'w') as NEX_OUT, open(PHYLIP, 'w') as PHY_OUT:
+        SEQUENCES = mmap.mmap(SCRATCH.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(SCRATCH.fileno()).st_size else ''
+        NEX_OUT.write('#NEXUS\nbegin data;\n\tdimensions ntax=%d nchar=%d;\n\tformat datatype=%s missing=%s gap=%s;\nmatrix\n' % ( len(TAXA), NCHAR, DATATYPE, MISSING, GAP ))
+        PHY_OUT.write(' %d %d\n' % ( len(TAXA), NCHAR ))
+        for TAXON in TAXA:
+            NEX_OUT.write(alignment.NEXUS_NAME(TAXON).ljust(NEXUS_WIDTH))
+            PHY_OUT.write(alignment.PHYLIP_NAME(TAXON).ljust(PHYLIP_WIDTH))
+            for NAME, GENE_NCHAR, GENE_DATATYPE, ROWS in GENES:
+                if TAXON in ROWS:
+                    PIECE = SEQUENCES[ROWS[TAXON]:ROWS[TAXON] + GENE_NCHAR]
+                else:
+                    PIECE = MISSING * GENE_NCHAR
+                NEX_OUT.write(PIECE)
+                PHY_OUT.write(PIECE)
+            NEX_OUT.write('\n')
+            PHY_OUT.write('\n')
+        if SEQUENCES:
+            SEQUENCES.close()
+finally:
+    if os.path.exists(SCRATCH_FILE):
+        os.remove(SCRATCH_FILE)
+
+# The sets block of the nexus file and the RAxML partitions
+CHARSETS = []
+PARTITION_LINES = []
+START = 1
+for NAME, GENE_NCHAR, GENE_DATATYPE, ROWS in GENES:
+    CHARSETS.append(( alignment.NEXUS_NAME(NAME), '%d-%d' % ( START, START + GENE_NCHAR - 1 ) ))
+    MODEL = 'DNA' if GENE_DATATYPE in ( 'dna', 'rna', 'nucleotide' ) else args.protein_model
+    PARTITION_LINES.append('%s, %s = %d-%d\n' % ( MODEL, NAME, START, START + GENE_NCHAR - 1 ))
+    START += GENE_NCHAR
+with open(OUT, 'a') as NEX_OUT:
+    NEX_OUT.write(';\nend;\n\nbegin sets;\n')
+    NEX_OUT.write(''.join( 'charset %s = %s;\n' % CHARSET for CHARSET in CHARSETS ))
+    NEX_OUT.write('charpartition combined = %s;\nend;\n' % ', '.join( '%s: %s' % CHARSET for CHARSET in CHARSETS ))
+with open(PARTITIONS, 'w') as PART_OUT:
+    PART_OUT.write(''.join(PARTITION_LINES))
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+#
+# ublast_lists.py
+#
+# This script reads the ublast -userout files written by big_ublast.sh (one target sequence id per
+# line, named GENE_SPECIES.txt) and writes the non-redundant list of targets of each one next to it
+# as GENE_SPECIES.list, sorted as sort -u gave them, for get_seq.sh to fetch. Empty files get no list.
+#
+# It also writes a summary table with a row for every list: the list file, the gene, the species and
+# the number of distinct hits, which get_seq.sh uses to fill in the ublast hit counts of the report.
+# The gene and species are split from the file name as get_seq.sh does: the gene is the part before
+# the first period or underscore, the species is the rest without the file extension.
+#
+# This script takes 1 argument (plus 2 optional ones):
+# 1) --input_dir | The directory with the ublast -userout files.
+# 2) --summary | [OPTIONAL] The summary table to write (default INPUT_DIR/ublast_hits.txt).
+# 3) --threads | [OPTIONAL] The number of files to read at once (default 1).
+#
+# Usage: ublast_lists.py --input_dir big_ublast --threads 24
+
+import sys, argparse, os, re
+from glob import glob
+from multiprocessing import Pool
+
+# Argument Parser
+parser = argparse.ArgumentParser(description = 'This script writes the non-redundant list of target sequences of every ublast -userout file, and a table of the number of hits of each gene and species.')
+parser.add_argument('--input_dir', required=True, help='The directory with the ublast -userout files.')
+parser.add_argument('--summary', help='[OPTIONAL] The summary table to write (default INPUT_DIR/ublast_hits.txt).')
+parser.add_argument('--threads', type=int, default=1, help='[OPTIONAL] The number of files to read at once.')
+args = parser.parse_args()
+
+##### Functions
+# Gene and species of a GENE_SPECIES.txt file name
+def GENE_SPECIES(FILE_NAME):
+    PARTS = [ PART for PART in re.split(r'[._]', FILE_NAME) if PART ][:-1]
+    return PARTS[0], '_'.join(PARTS[1:])
+
+# Read the targets of one userout file into a set and write the sorted list through a temporary
+# file. Returns the summary row, or None for an empty file.
+def WRITE_LIST(USEROUT):
+    TARGETS = set()
+    with open(USEROUT, 'r') as INPUT:
+        for LINE in INPUT:
+            TARGET = LINE.rstrip('\n')
+            if TARGET:
+                TARGETS.add(TARGET)
+    if not TARGETS:
+        return None
+    LIST_FILE = USEROUT[:-len('.txt')] + '.list'
+    TMP_FILE = '%s.%d.tmp' % ( LIST_FILE, os.getpid() )
+    with open(TMP_FILE, 'w') as OUT:
+        for TARGET in sorted(TARGETS):
+            OUT.write('%s\n' % TARGET)
+    os.rename(TMP_FILE, LIST_FILE)
+    GENE, SPECIES = GENE_SPECIES(os.path.basename(LIST_FILE))
+    return '%s\t%s\t%s\t%d\n' % ( os.path.basename(LIST_FILE), GENE, SPECIES, len(TARGETS) )
+
+##### END FUNCTIONS
+
+SUMMARY = args.summary if args.summary else '%s/ublast_hits.txt' % args.input_dir
+USEROUTS = [ USEROUT for USEROUT in sorted(glob('%s/*.txt' % args.input_dir)) if os.path.abspath(USEROUT) != os.path.abspath(SUMMARY) ]
+POOL = Pool(args.threads)
+ROWS = POOL.map(WRITE_LIST, USEROUTS, chunksize=64)
+POOL.close()
+POOL.join()
+with open(SUMMARY, 'w') as OUT:
+    OUT.write('list\tgene\tspecies\thits\n')
+    for ROW in ROWS:
+        if ROW is not None:
+            OUT.write(ROW)
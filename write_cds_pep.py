@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+#
+# write_cds_pep.py
+#
+# This script writes the peptide and cds fasta files of the sequences listed by parse_hmm_search.py,
+# reading them from the large ORF fasta files of each species through their .fai index (see
+# fasta_index.py) instead of with samtools faidx.
+#
+# The lists are named GENE_SPECIES.txt in the TopHits and OtherHits directories of the input. The
+# def-lines of the sequences written are prefixed with SPECIES___. The top hits of each gene go to
+# TopHits/PEP/GENE/SPECIES.fas and TopHits/CDS/GENE/SPECIES.fas, and the other hits of all the
+# species are gathered in OtherHits/PEP/GENE.fasta and OtherHits/CDS/GENE.fasta.
+#
+# Each worker handles all the lists of one species, so the two fasta files of a species are only
+# opened once. The TopHits and OtherHits fasta directories of an earlier run are cleared first, so
+# genes and species without hits in this run have no files.
+#
+# This script takes 4 arguments (plus 1 optional one):
+# 1) --input_dir | The directory with the TopHits and OtherHits lists.
+# 2) --output_dir | The directory to write the fasta files to.
+# 3) --dna_dir | The directory with the open reading frames (DNA sequences), SPECIES.fasta.
+# 4) --protein_dir | The directory with the translated open reading frames (protein sequences), SPECIES.fasta.
+# 5) --threads | [OPTIONAL] The number of species to write at once (default 1).
+#
+# Usage: write_cds_pep.py --input_dir parse_hmm_search --output_dir sequences --dna_dir dna --protein_dir prot --threads 24
+
+import sys, argparse, os, re, fcntl, shutil
+from glob import glob
+from multiprocessing import Pool
+import fasta_index
+
+# Argument Parser
+parser = argparse.ArgumentParser(description = 'This script writes the peptide and cds fasta files of the sequences listed by parse_hmm_search.py.')
+parser.add_argument('--input_dir', required=True, help='The directory with the TopHits and OtherHits lists.')
+parser.add_argument('--output_dir', required=True, help='The directory to write the fasta files to.')
+parser.add_argument('--dna_dir', required=True, help='The directory with the open reading frames (DNA sequences).')
+parser.add_argument('--protein_dir', required=True, help='The directory with the translated open reading frames (protein sequences).')
+parser.add_argument('--threads', type=int, default=1, help='[OPTIONAL] The number of species to write at once.')
+args = parser.parse_args()
+
+##### Functions
+# Gene and species of a GENE_SPECIES.txt file name, split as the shell scripts do
+def GENE_SPECIES(FILE_NAME):
+    PARTS = [ PART for PART in re.split(r'[._]', FILE_NAME) if PART ][:-1]
+    return PARTS[0], '_'.join(PARTS[1:])
+
+# Another worker may make the directory at the same time
+def MAKE_DIR(DIR):
+    try:
+        os.makedirs(DIR)
+    except OSError:
+        if not os.path.isdir(DIR):
+            raise
+
+def READ_LIST(LIST_FILE):
+    with open(LIST_FILE, 'r') as INPUT:
+        return INPUT.read().split()
+
+def WRITE_FILE(OUT_FILE, TEXT):
+    TMP_FILE = '%s.%d.tmp' % ( OUT_FILE, os.getpid() )
+    with open(TMP_FILE, 'w') as OUT:
+        OUT.write(TEXT)
+    os.rename(TMP_FILE, OUT_FILE)
+
+# Add a block of sequences to a gene file other species are also adding to
+def APPEND_FILE(OUT_FILE, TEXT):
+    with open(OUT_FILE, 'a') as OUT:
+        fcntl.flock(OUT, fcntl.LOCK_EX)
+        try:
+            OUT.write(TEXT)
+            OUT.flush()
+        finally:
+            fcntl.flock(OUT, fcntl.LOCK_UN)
+
+# Write every list of one species
+def WRITE_SPECIES(JOB):
+    SPECIES, LISTS = JOB
+    FASTA_FILES = { 'PEP': '%s/%s.fasta' % ( args.protein_dir, SPECIES ), 'CDS': '%s/%s.fasta' % ( args.dna_dir, SPECIES ) }
+    for FASTA_FILE in FASTA_FILES.values():
+        if not os.path.isfile(FASTA_FILE):
+            print('%s not found, skipping %s.' % ( FASTA_FILE, SPECIES ))
+            return
+    SOURCES = dict( ( TYPE, fasta_index.OPEN_FASTA(FASTA_FILE) ) for TYPE, FASTA_FILE in FASTA_FILES.iteritems() )
+    PREFIX = '%s___' % SPECIES
+    for HITS, GENE, LIST_FILE in LISTS:
+        NAMES = READ_LIST(LIST_FILE)
+        for TYPE in ( 'PEP', 'CDS' ):
+            TEXT = ''.join( fasta_index.RECORD(SOURCES[TYPE], NAME, PREFIX) for NAME in NAMES )
+            if HITS == 'TopHits':
+                MAKE_DIR('%s/TopHits/%s/%s' % ( args.output_dir, TYPE, GENE ))
+                WRITE_FILE('%s/TopHits/%s/%s/%s.fas' % ( args.output_dir, TYPE, GENE, SPECIES ), TEXT)
+            elif TEXT:
+                APPEND_FILE('%s/OtherHits/%s/%s.fasta' % ( args.output_dir, TYPE, GENE ), TEXT)
+    for SOURCE in SOURCES.values():
+        fasta_index.CLOSE_FASTA(SOURCE)
+
+##### END FUNCTIONS
+
+# Group the lists by species
+SPECIES_LISTS = {}
+for HITS in ( 'TopHits', 'OtherHits' ):
+    for LIST_FILE in sorted(glob('%s/%s/*.txt' % ( args.input_dir, HITS ))):
+        GENE, SPECIES = GENE_SPECIES(os.path.basename(LIST_FILE))
+        SPECIES_LISTS.setdefault(SPECIES, []).append(( HITS, GENE, LIST_FILE ))
+
+# Start from empty directories. This also starts the other hits files, which every species appends
+# to, empty.
+for HITS in ( 'TopHits', 'OtherHits' ):
+    for TYPE in ( 'PEP', 'CDS' ):
+        OUT_DIR = '%s/%s/%s' % ( args.output_dir, HITS, TYPE )
+        if os.path.isdir(OUT_DIR):
+            shutil.rmtree(OUT_DIR)
+        MAKE_DIR(OUT_DIR)
+
+POOL = Pool(args.threads)
+POOL.map(WRITE_SPECIES, sorted(SPECIES_LISTS.iteritems()), chunksize=1)
+POOL.close()
+POOL.join()
@@ -0,0 +1,215 @@
+#
+# zscore_engine.py
+#
+# Array based engine used by distance_matrix_zscore.py.
+#
+# Every gene's pairwise distances are held in one dense matrix with a row for each species pair
+# and a column for each gene (NaN where a pair is missing from a gene). Species and pairs are
+# integer indexes: SPECIES[PAIR_I[ROW]] and SPECIES[PAIR_J[ROW]] are the two species for a row,
+# with PAIR_I <= PAIR_J and rows sorted by (PAIR_I, PAIR_J). Normalizing the ratios, the per pair
+# median/MAD, the modified z-scores and the per gene, per species outlier sums are then whole
+# array numpy calls rather than loops over nested dictionaries.
+#
+# For taxon sets where that matrix does not fit in memory, BUILD_MEMMAP writes it to a memory-mapped
+# file one gene at a time and CHUNKED_SPECIES_SUMS works through it in blocks of pairs. Every pair
+# is normalized by its own median alone, so the blocks give the same sums as the whole matrix.
+
+import os, warnings, zipfile
+import numpy as np
+
+# Read a RAxML distance file in a single pass. Lines look like:
+# "Species_one___seqid Species_two___seqid \t 0.123456"
+# Every sequence name is stored once in LABELS and the pairs are returned as integer indexes into
+# LABELS along with the distances.
+def READ_DISTANCES(DIST_FILE):
+    INDEX = {}
+    LABELS = []
+    I = []
+    J = []
+    DISTANCES = []
+    with open(DIST_FILE, 'r') as INPUT:
+        for LINE in INPUT:
+            FIELDS = LINE.split(' \t ')
+            if len(FIELDS) < 2:
+                continue
+            NAMES = FIELDS[0].split(' ')
+            for NAME, SIDE in ( ( NAMES[0], I ), ( NAMES[1], J ) ):
+                try:
+                    SIDE.append(INDEX[NAME])
+                except KeyError:
+                    INDEX[NAME] = len(LABELS)
+                    LABELS.append(NAME)
+                    SIDE.append(INDEX[NAME])
+            DISTANCES.append(float(FIELDS[-1]))
+    return LABELS, np.array(I, dtype=np.int32), np.array(J, dtype=np.int32), np.array(DISTANCES, dtype=np.float64)
+
+# Load a distance file through its binary sidecar in CACHE_DIR. The sidecar is keyed on the size
+# and modification time of the distance file, so it is only re-parsed when it has changed. With no
+# CACHE_DIR the file is always parsed. A sidecar that can not be read, e.g. one truncated by a
+# killed run, is parsed again and replaced. READER parses the file, e.g. patristic.READ_PATRISTIC
+# to take the distances from a tree instead.
+def LOAD_DISTANCES(DIST_FILE, CACHE_DIR=None, READER=READ_DISTANCES):
+    if CACHE_DIR is None:
+        return READER(DIST_FILE)
+    STAT = os.stat(DIST_FILE)
+    CACHE_FILE = '%s/%s.npz' % ( CACHE_DIR, os.path.basename(DIST_FILE) )
+    try:
+        with np.load(CACHE_FILE) as CACHE:
+            if CACHE['SIZE'] == STAT.st_size and CACHE['MTIME'] == STAT.st_mtime:
+                return CACHE['LABELS'].tolist(), CACHE['I'], CACHE['J'], CACHE['DISTANCES']
+    except (IOError, OSError, EOFError, KeyError, ValueError, zipfile.BadZipfile):
+        pass
+    LABELS, I, J, DISTANCES = READER(DIST_FILE)
+    # Write to a temporary file and rename it so parallel runs never see half written caches
+    TMP_FILE = '%s.%d.tmp' % ( CACHE_FILE, os.getpid() )
+    try:
+        if not os.path.isdir(CACHE_DIR):
+            os.makedirs(CACHE_DIR)
+        with open(TMP_FILE, 'wb') as OUT:
+            np.savez(OUT, LABELS=np.array(LABELS), I=I, J=J, DISTANCES=DISTANCES, SIZE=STAT.st_size, MTIME=STAT.st_mtime)
+        os.rename(TMP_FILE, CACHE_FILE)
+    except (IOError, OSError):
+        print('Could not write distance cache %s' % CACHE_FILE)
+    return LABELS, I, J, DISTANCES
+
+# Species of every sequence label (the part before the "___")
+def LABEL_SPECIES(LABELS):
+    return [LABEL.split('___')[0] for LABEL in LABELS]
+
+# Turn one gene's distances into pairs of species indexes (smaller index first) and the ratio of
+# each distance to the median distance of the gene.
+def GENE_PAIRS(LABELS, I, J, DISTANCES, SPECIES_INDEX):
+    if not len(DISTANCES):
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0)
+    LABEL_INDEX = np.array([SPECIES_INDEX[S] for S in LABEL_SPECIES(LABELS)], dtype=np.int64)
+    I = LABEL_INDEX[I]
+    J = LABEL_INDEX[J]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        RATIOS = DISTANCES / np.median(DISTANCES)
+    return np.minimum(I, J), np.maximum(I, J), RATIOS
+
+# Build the pair x gene ratio matrix in memory. GENE_DATA is a list of (GENE, LABELS, I, J,
+# DISTANCES) with one entry per gene, as returned by LOAD_DISTANCES. Only pairs seen in at least
+# one gene get a row.
+def BUILD_MATRIX(GENE_DATA):
+    SPECIES = sorted(set(S for ENTRY in GENE_DATA for S in LABEL_SPECIES(ENTRY[1])))
+    SPECIES_INDEX = dict((S, N) for N, S in enumerate(SPECIES))
+    TOTAL_SPECIES = max(len(SPECIES), 1)
+    GENES = []
+    GENE_KEYS = []
+    GENE_RATIOS = []
+    for GENE, LABELS, I, J, DISTANCES in GENE_DATA:
+        LOW, HIGH, RATIOS = GENE_PAIRS(LABELS, I, J, DISTANCES, SPECIES_INDEX)
+        GENES.append(GENE)
+        GENE_KEYS.append(LOW * TOTAL_SPECIES + HIGH)
+        GENE_RATIOS.append(RATIOS)
+    if GENE_KEYS:
+        KEYS = np.unique(np.concatenate(GENE_KEYS))
+    else:
+        KEYS = np.zeros(0, dtype=np.int64)
+    MATRIX = np.full((len(KEYS), len(GENES)), np.nan)
+    for COLUMN in range(len(GENES)):
+        MATRIX[np.searchsorted(KEYS, GENE_KEYS[COLUMN]), COLUMN] = GENE_RATIOS[COLUMN]
+    return SPECIES, GENES, KEYS // TOTAL_SPECIES, KEYS % TOTAL_SPECIES, MATRIX
+
+# Build the ratio table out of core for taxon sets too big to hold in memory. GENE_FILES is a list
+# of (GENE, DIST_FILE) and SPECIES the sorted species across all of them. Genes are loaded one at
+# a time and written to a memory-mapped file in MEMMAP_FILE, stored transposed (one row per gene)
+# so that every gene is a single contiguous write. Every pair of species gets a column, in
+# (PAIR_I, PAIR_J) order, whether or not it is seen in any gene. Each gene's ratios are scattered
+# straight into its row of the file, so besides the pair indexes only the arrays of the one gene
+# being loaded are held in memory.
+def BUILD_MEMMAP(GENE_FILES, SPECIES, MEMMAP_FILE, CACHE_DIR=None, READER=READ_DISTANCES):
+    SPECIES_INDEX = dict((S, N) for N, S in enumerate(SPECIES))
+    TOTAL_SPECIES = len(SPECIES)
+    PAIR_I, PAIR_J = np.triu_indices(TOTAL_SPECIES)
+    MEMMAP = np.memmap(MEMMAP_FILE, dtype=np.float64, mode='w+', shape=(max(len(GENE_FILES), 1), max(len(PAIR_I), 1)))
+    for ROW, ( GENE, DIST_FILE ) in enumerate(GENE_FILES):
+        LABELS, I, J, DISTANCES = LOAD_DISTANCES(DIST_FILE, CACHE_DIR, READER)
+        LOW, HIGH, RATIOS = GENE_PAIRS(LABELS, I, J, DISTANCES, SPECIES_INDEX)
+        MEMMAP[ROW] = np.nan
+        MEMMAP[ROW, LOW * TOTAL_SPECIES - (LOW * (LOW - 1)) // 2 + HIGH - LOW] = RATIOS
+    MEMMAP.flush()
+    return [GENE for GENE, DIST_FILE in GENE_FILES], PAIR_I, PAIR_J, MEMMAP
+
+# Species x gene sums of the normalized ratios from a memory-mapped table made by BUILD_MEMMAP.
+# The pairs are worked through in blocks small enough to keep the working set under MAX_MEM
+# megabytes: each block is read once, normalized by its own pair medians and added to the sums.
+def CHUNKED_SPECIES_SUMS(MEMMAP, PAIR_I, PAIR_J, TOTAL_SPECIES, TOTAL_GENES, MAX_MEM):
+    SUMS = np.zeros((TOTAL_SPECIES, TOTAL_GENES))
+    COUNTS = np.zeros((TOTAL_SPECIES, TOTAL_GENES), dtype=np.int64)
+    # Roughly eight block sized copies are alive at once: the block, the nanmedian scratch copy,
+    # the normalized values, the filled values and the reordered copies made by SPECIES_SUMS. The
+    # tables built while loading are freed by now, the pair indexes are the only ones left.
+    FREE = MAX_MEM * 2**20 - SUMS.nbytes - COUNTS.nbytes - PAIR_I.nbytes - PAIR_J.nbytes
+    BLOCK = int(max(FREE // (8 * 8 * max(TOTAL_GENES, 1)), 1))
+    for START in range(0, len(PAIR_I), BLOCK):
+        STOP = min(START + BLOCK, len(PAIR_I))
+        RATIOS = np.array(MEMMAP[:TOTAL_GENES, START:STOP].T)
+        PRESENT = ~np.isnan(RATIOS)
+        # Pairs never seen together in any gene are all NaN and add nothing
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            NORMALIZED = NORMALIZE(RATIOS)
+        SPECIES_SUMS(NORMALIZED, PRESENT, PAIR_I[START:STOP], PAIR_J[START:STOP], TOTAL_SPECIES, SUMS, COUNTS)
+    return SUMS, COUNTS
+
+# Divide every ratio by 0.1 * the median ratio for its species pair and take the log. This centers
+# every pair's distribution on log(10), keeping it positive for the z-score and outlier sums.
+def NORMALIZE(RATIOS):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        DEMON = 0.1 * np.nanmedian(RATIOS, axis=1)
+        return np.log(RATIOS / DEMON[:, None])
+
+# Median and median absolute deviation of every row, ignoring missing genes
+def PAIR_STATS(VALUES):
+    with np.errstate(invalid='ignore'):
+        MEDIAN = np.nanmedian(VALUES, axis=1)
+        MAD = np.nanmedian(np.absolute(VALUES - MEDIAN[:, None]), axis=1)
+    return MEDIAN, MAD
+
+# Modified z-score of every cell against its row. Rows with a MAD of zero can not be scaled, so
+# values at or above 2.31 are shifted up by 1.2 instead and the rest are left as they are.
+def MODZ(VALUES, MEDIAN, MAD):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        SCORES = (0.6745 * (VALUES - MEDIAN[:, None])) / MAD[:, None]
+        FLAT = np.where(VALUES >= 2.31, VALUES + 1.2, VALUES)
+    return np.where((MAD == 0)[:, None], FLAT, SCORES)
+
+# Sum VALUES over every pair a species belongs to, separately for each gene. Returns the species x
+# gene sums and the number of present pairs behind each sum. Rows must be sorted by PAIR_I. Pass
+# SUMS and COUNTS to add to existing totals, e.g. when the rows come in blocks.
+def SPECIES_SUMS(VALUES, PRESENT, PAIR_I, PAIR_J, TOTAL_SPECIES, SUMS=None, COUNTS=None):
+    if SUMS is None:
+        SUMS = np.zeros((TOTAL_SPECIES, VALUES.shape[1]))
+    if COUNTS is None:
+        COUNTS = np.zeros((TOTAL_SPECIES, VALUES.shape[1]), dtype=np.int64)
+    if not len(PAIR_I):
+        return SUMS, COUNTS
+    FILLED = np.where(PRESENT, VALUES, 0.0)
+    HITS = PRESENT.astype(np.int64)
+    # First species of each pair: rows are already grouped by PAIR_I
+    STARTS = np.flatnonzero(np.r_[True, PAIR_I[1:] != PAIR_I[:-1]])
+    SUMS[PAIR_I[STARTS]] += np.add.reduceat(FILLED, STARTS, axis=0)
+    COUNTS[PAIR_I[STARTS]] += np.add.reduceat(HITS, STARTS, axis=0)
+    # Second species of each pair. A pair of a species with itself only counts once.
+    ROWS = np.flatnonzero(PAIR_J != PAIR_I)
+    if len(ROWS):
+        ROWS = ROWS[np.argsort(PAIR_J[ROWS], kind='mergesort')]
+        SECOND = PAIR_J[ROWS]
+        STARTS = np.flatnonzero(np.r_[True, SECOND[1:] != SECOND[:-1]])
+        SUMS[SECOND[STARTS]] += np.add.reduceat(FILLED[ROWS], STARTS, axis=0)
+        COUNTS[SECOND[STARTS]] += np.add.reduceat(HITS[ROWS], STARTS, axis=0)
+    return SUMS, COUNTS
+
+# Outlier ratio for every species in every gene: the sum of the species' normalized distances
+# divided by the number of pairwise comparisons in that gene, times 1000. NaN where the species is
+# absent from the gene.
+def OUTLIER_RATIOS(SUMS, COUNTS):
+    PRESENT = COUNTS > 0
+    TOTAL_SPECIES = PRESENT.sum(axis=0)
+    TOTAL_COMPARISONS = ((TOTAL_SPECIES - 1) * TOTAL_SPECIES) // 2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        RATIO = (SUMS / TOTAL_COMPARISONS.astype(np.float64)) * 1000
+    RATIO[~PRESENT] = np.nan
+    return RATIO
@@ -0,0 +1,383 @@
+#
+# zscore_state.py
+#
+# Persistent scoring state for distance_matrix_zscore.py --incremental.
+#
+# Between loops only a few genes change, so the state keeps the ratios of every gene together with
+# the order statistics of every species pair and is updated one gene at a time. It lives in its own
+# directory:
+#   ratios.dat   gene x pair distance / median distance ratios (NaN where a pair is missing), one
+#                contiguous row for each gene
+#   low.dat      for every pair, a max-heap of the genes holding the lower half of its ratios
+#   high.dat     for every pair, a min-heap of the genes holding the upper half of its ratios
+#   where.dat    pair x gene position of every gene in its heap, +(P + 1) in low, -(P + 1) in high,
+#                0 when the pair is missing from the gene
+#   state.npz    the species, the genes of every column, heap sizes and run counter
+#   genes/       the sequence names of every gene, one GENE.txt file each
+# The .dat files are memory-mapped and changed in place, so a run only writes the pages of the genes
+# and pairs it touches. Adding or removing a gene is an insert or delete in the two heaps of each of
+# its pairs, a sift of log2(genes) steps, and the median of a pair is read from the tops of its two
+# heaps. The normalized sums behind the outlier ratios are rebuilt from the stored ratios and those
+# medians on every run rather than carried over, so there is nothing to drift. Every VERIFY_EVERY
+# runs the heap medians are also checked against a full np.nanmedian of the ratios and the heaps are
+# rebuilt if they do not match.
+#
+# Species get a permanent index the first time they are seen and pairs are the lower triangle in
+# column order, ROW = J * (J + 1) / 2 + I with I <= J, so adding species only appends pairs. Genes
+# are columns; the column of a removed gene is reused by the next gene added. The files are marked
+# as being updated until SAVE_STATE, and a state left marked by a killed run is thrown away and
+# built again from the distance files.
+
+import os, shutil, warnings, zipfile
+import numpy as np
+import zscore_engine
+
+VERIFY_EVERY = 10
+# Pairs worked through at once when the heaps or sums are built from the whole ratio table
+BLOCK_BYTES = 2**27
+# Layout of the memory-mapped arrays: dtype, shape for PAIRS pairs and COLUMNS gene columns, fill
+MAPS = {
+    'RATIOS': ( np.float64, lambda PAIRS, COLUMNS: ( COLUMNS, PAIRS ), np.nan ),
+    'LOW': ( np.int32, lambda PAIRS, COLUMNS: ( PAIRS, COLUMNS // 2 + 1 ), 0 ),
+    'HIGH': ( np.int32, lambda PAIRS, COLUMNS: ( PAIRS, COLUMNS // 2 + 1 ), 0 ),
+    'WHERE': ( np.int32, lambda PAIRS, COLUMNS: ( PAIRS, COLUMNS ), 0 ) }
+# The size array, the sign that puts the largest key on top and the WHERE tag of each heap
+HEAPS = { 'LOW': ( 'NLOW', 1.0, 1 ), 'HIGH': ( 'NHIGH', -1.0, -1 ) }
+
+def MAP_FILE(STATE, NAME):
+    return '%s/%s.dat' % ( STATE['DIR'], NAME.lower() )
+
+def OPEN_MAP(STATE, NAME, MODE='r+'):
+    DTYPE, SHAPE, FILL = MAPS[NAME]
+    return np.memmap(MAP_FILE(STATE, NAME), dtype=DTYPE, mode=MODE, shape=SHAPE(STATE['PAIRS'], STATE['COLUMNS']))
+
+# An empty state kept in STATE_DIR
+def NEW_STATE(STATE_DIR):
+    if os.path.isdir(STATE_DIR):
+        shutil.rmtree(STATE_DIR)
+    os.makedirs('%s/genes' % STATE_DIR)
+    return {
+        'DIR': STATE_DIR, 'SPECIES': [], 'GENES': [], 'PAIRS': 0, 'COLUMNS': 0, 'RUN': 0,
+        'SIZE': np.zeros(0, dtype=np.int64), 'MTIME': np.zeros(0),
+        'NLOW': np.zeros(0, dtype=np.int64), 'NHIGH': np.zeros(0, dtype=np.int64),
+        'RATIOS': None, 'LOW': None, 'HIGH': None, 'WHERE': None }
+
+# Load the state saved by SAVE_STATE in STATE_DIR. Without one, or when the last run did not finish
+# saving it, an empty state is started.
+def LOAD_STATE(STATE_DIR):
+    STATE_FILE = '%s/state.npz' % STATE_DIR
+    if os.path.isfile('%s/updating' % STATE_DIR) or not os.path.isfile(STATE_FILE):
+        return NEW_STATE(STATE_DIR)
+    try:
+        with np.load(STATE_FILE) as SAVED:
+            STATE = { 'DIR': STATE_DIR, 'SPECIES': SAVED['SPECIES'].tolist(), 'GENES': SAVED['GENES'].tolist() }
+            for NAME in ( 'SIZE', 'MTIME', 'NLOW', 'NHIGH' ):
+                STATE[NAME] = SAVED[NAME]
+            for NAME in ( 'PAIRS', 'COLUMNS', 'RUN' ):
+                STATE[NAME] = int(SAVED[NAME])
+        for NAME in MAPS:
+            STATE[NAME] = OPEN_MAP(STATE, NAME) if STATE['PAIRS'] else None
+    except (IOError, OSError, EOFError, KeyError, ValueError, zipfile.BadZipfile):
+        print('Could not read the scoring state in %s, starting a new one' % STATE_DIR)
+        return NEW_STATE(STATE_DIR)
+    return STATE
+
+# Mark the state as being updated before any of its files are changed
+def MARK_UPDATING(STATE):
+    open('%s/updating' % STATE['DIR'], 'w').close()
+
+# Save the state, writing to a temporary file first, and clear the mark left by MARK_UPDATING
+def SAVE_STATE(STATE):
+    for NAME in MAPS:
+        if STATE[NAME] is not None:
+            STATE[NAME].flush()
+    STATE_FILE = '%s/state.npz' % STATE['DIR']
+    TMP_FILE = '%s.%d.tmp' % ( STATE_FILE, os.getpid() )
+    with open(TMP_FILE, 'wb') as OUT:
+        np.savez_compressed(OUT, SPECIES=np.array(STATE['SPECIES'], dtype=str), GENES=np.array(STATE['GENES'], dtype=str),
+                            SIZE=STATE['SIZE'], MTIME=STATE['MTIME'], NLOW=STATE['NLOW'], NHIGH=STATE['NHIGH'],
+                            PAIRS=STATE['PAIRS'], COLUMNS=STATE['COLUMNS'], RUN=STATE['RUN'])
+    os.rename(TMP_FILE, STATE_FILE)
+    if os.path.isfile('%s/updating' % STATE['DIR']):
+        os.remove('%s/updating' % STATE['DIR'])
+
+# Species indexes of every pair row for TOTAL_SPECIES species
+def PAIR_INDEXES(TOTAL_SPECIES):
+    PAIR_J = np.repeat(np.arange(TOTAL_SPECIES), np.arange(1, TOTAL_SPECIES + 1))
+    PAIR_I = np.arange(len(PAIR_J)) - ( PAIR_J * ( PAIR_J + 1 ) ) // 2
+    return PAIR_I, PAIR_J
+
+# Make room for TOTAL_SPECIES species and at least one free gene column. The memory-mapped arrays
+# are copied into files of the new size, which only happens when species are added or the gene
+# columns run out (their number is doubled).
+def GROW(STATE, TOTAL_SPECIES):
+    PAIRS = ( TOTAL_SPECIES * ( TOTAL_SPECIES + 1 ) ) // 2
+    OLD_PAIRS, OLD_COLUMNS = STATE['PAIRS'], STATE['COLUMNS']
+    COLUMNS = OLD_COLUMNS
+    if '' not in STATE['GENES'] and len(STATE['GENES']) == OLD_COLUMNS:
+        COLUMNS = max(2 * OLD_COLUMNS, 8)
+    if PAIRS == OLD_PAIRS and COLUMNS == OLD_COLUMNS:
+        return
+    STATE['PAIRS'], STATE['COLUMNS'] = PAIRS, COLUMNS
+    for NAME in MAPS:
+        DTYPE, SHAPE, FILL = MAPS[NAME]
+        TMP_FILE = '%s.%d.tmp' % ( MAP_FILE(STATE, NAME), os.getpid() )
+        NEW = np.memmap(TMP_FILE, dtype=DTYPE, mode='w+', shape=SHAPE(PAIRS, COLUMNS))
+        NEW[:] = FILL
+        OLD = STATE[NAME]
+        if OLD is not None:
+            NEW[:OLD.shape[0], :OLD.shape[1]] = OLD
+        NEW.flush()
+        del NEW, OLD
+        STATE[NAME] = None
+        os.rename(TMP_FILE, MAP_FILE(STATE, NAME))
+        STATE[NAME] = OPEN_MAP(STATE, NAME)
+    STATE['NLOW'] = np.r_[STATE['NLOW'], np.zeros(PAIRS - OLD_PAIRS, dtype=np.int64)]
+    STATE['NHIGH'] = np.r_[STATE['NHIGH'], np.zeros(PAIRS - OLD_PAIRS, dtype=np.int64)]
+    STATE['SIZE'] = np.r_[STATE['SIZE'], np.zeros(COLUMNS - OLD_COLUMNS, dtype=np.int64)]
+    STATE['MTIME'] = np.r_[STATE['MTIME'], np.zeros(COLUMNS - OLD_COLUMNS)]
+
+#### HEAP FUNCTIONS:
+# Every heap function works on many pairs at once, one entry per pair: ROWS are distinct pair rows
+# and POSITION the heap position for each of them.
+
+# Sort keys of the entries at POSITION in heap NAME, largest on top for both heaps
+def KEYS(STATE, NAME, ROWS, POSITION):
+    return HEAPS[NAME][1] * STATE['RATIOS'][STATE[NAME][ROWS, POSITION], ROWS]
+
+# Swap two positions of heap NAME in every row and keep WHERE in step
+def SWAP(STATE, NAME, ROWS, FIRST, SECOND):
+    HEAP = STATE[NAME]
+    TAG = HEAPS[NAME][2]
+    A = HEAP[ROWS, FIRST]
+    B = HEAP[ROWS, SECOND]
+    HEAP[ROWS, FIRST] = B
+    HEAP[ROWS, SECOND] = A
+    STATE['WHERE'][ROWS, B] = TAG * ( FIRST + 1 )
+    STATE['WHERE'][ROWS, A] = TAG * ( SECOND + 1 )
+
+def SIFT_UP(STATE, NAME, ROWS, POSITION):
+    while len(ROWS):
+        MOVE = POSITION > 0
+        ROWS, POSITION = ROWS[MOVE], POSITION[MOVE]
+        PARENT = ( POSITION - 1 ) // 2
+        MOVE = KEYS(STATE, NAME, ROWS, POSITION) > KEYS(STATE, NAME, ROWS, PARENT)
+        ROWS, POSITION, PARENT = ROWS[MOVE], POSITION[MOVE], PARENT[MOVE]
+        SWAP(STATE, NAME, ROWS, POSITION, PARENT)
+        POSITION = PARENT
+
+def SIFT_DOWN(STATE, NAME, ROWS, POSITION):
+    SIZE = STATE[HEAPS[NAME][0]]
+    LAST = STATE[NAME].shape[1] - 1
+    while len(ROWS):
+        BEST = POSITION.copy()
+        BEST_KEY = KEYS(STATE, NAME, ROWS, POSITION)
+        for CHILD in ( 2 * POSITION + 1, 2 * POSITION + 2 ):
+            KEY = KEYS(STATE, NAME, ROWS, np.minimum(CHILD, LAST))
+            with np.errstate(invalid='ignore'):
+                BETTER = ( CHILD < SIZE[ROWS] ) & ( KEY > BEST_KEY )
+            BEST = np.where(BETTER, CHILD, BEST)
+            BEST_KEY = np.where(BETTER, KEY, BEST_KEY)
+        MOVE = BEST != POSITION
+        ROWS, POSITION, BEST = ROWS[MOVE], POSITION[MOVE], BEST[MOVE]
+        SWAP(STATE, NAME, ROWS, POSITION, BEST)
+        POSITION = BEST
+
+# Add gene COLUMNS (one for each row) to heap NAME
+def PUSH(STATE, NAME, ROWS, COLUMNS):
+    SIZE = STATE[HEAPS[NAME][0]]
+    POSITION = SIZE[ROWS].copy()
+    STATE[NAME][ROWS, POSITION] = COLUMNS
+    STATE['WHERE'][ROWS, COLUMNS] = HEAPS[NAME][2] * ( POSITION + 1 )
+    SIZE[ROWS] += 1
+    SIFT_UP(STATE, NAME, ROWS, POSITION)
+
+# Take the entries at POSITION out of heap NAME. The last entry fills the gap and is sifted into
+# place. Returns the genes taken out.
+def DELETE(STATE, NAME, ROWS, POSITION):
+    HEAP = STATE[NAME]
+    SIZE = STATE[HEAPS[NAME][0]]
+    GONE = HEAP[ROWS, POSITION]
+    STATE['WHERE'][ROWS, GONE] = 0
+    SIZE[ROWS] -= 1
+    FILL = POSITION < SIZE[ROWS]
+    ROWS, POSITION = ROWS[FILL], POSITION[FILL]
+    MOVED = HEAP[ROWS, SIZE[ROWS]]
+    HEAP[ROWS, POSITION] = MOVED
+    STATE['WHERE'][ROWS, MOVED] = HEAPS[NAME][2] * ( POSITION + 1 )
+    SIFT_UP(STATE, NAME, ROWS, POSITION)
+    SIFT_DOWN(STATE, NAME, ROWS, np.absolute(STATE['WHERE'][ROWS, MOVED]) - 1)
+    return GONE
+
+# Move the top of the bigger heap to the other one wherever the low heap is not the same size as
+# the high heap or one bigger
+def BALANCE(STATE, ROWS):
+    MOVE = ROWS[STATE['NLOW'][ROWS] > STATE['NHIGH'][ROWS] + 1]
+    PUSH(STATE, 'HIGH', MOVE, DELETE(STATE, 'LOW', MOVE, np.zeros(len(MOVE), dtype=np.int64)))
+    MOVE = ROWS[STATE['NHIGH'][ROWS] > STATE['NLOW'][ROWS]]
+    PUSH(STATE, 'LOW', MOVE, DELETE(STATE, 'HIGH', MOVE, np.zeros(len(MOVE), dtype=np.int64)))
+
+# Median ratio of every pair from the tops of its heaps, NaN for pairs in no gene. With an even
+# number of genes it is the mean of the two middle ratios, as np.nanmedian gives.
+def HEAP_MEDIANS(STATE):
+    if not STATE['PAIRS']:
+        return np.zeros(0)
+    ROWS = np.arange(STATE['PAIRS'])
+    LOW = STATE['RATIOS'][STATE['LOW'][:, 0], ROWS]
+    HIGH = STATE['RATIOS'][STATE['HIGH'][:, 0], ROWS]
+    MEDIAN = np.where(STATE['NLOW'] > STATE['NHIGH'], LOW, ( LOW + HIGH ) / 2)
+    return np.where(STATE['NLOW'] > 0, MEDIAN, np.nan)
+
+# Build every heap from the ratios: the lower half of each pair's ratios sorted in descending order
+# is a max-heap and the upper half in ascending order a min-heap.
+def BUILD_HEAPS(STATE):
+    COLUMNS = STATE['COLUMNS']
+    HALF = STATE['LOW'].shape[1]
+    BLOCK = max(BLOCK_BYTES // ( 8 * 4 * COLUMNS ), 1)
+    for START in range(0, STATE['PAIRS'], BLOCK):
+        STOP = min(START + BLOCK, STATE['PAIRS'])
+        RATIOS = np.array(STATE['RATIOS'][:, START:STOP].T)
+        ORDER = np.argsort(RATIOS, axis=1, kind='mergesort')
+        COUNT = ( ~np.isnan(RATIOS) ).sum(axis=1)
+        NLOW = ( COUNT + 1 ) // 2
+        NHIGH = COUNT // 2
+        ROWS = np.arange(STOP - START)[:, None]
+        RANK = np.arange(HALF)[None, :]
+        LOW = ORDER[ROWS, np.clip(NLOW[:, None] - 1 - RANK, 0, COLUMNS - 1)]
+        HIGH = ORDER[ROWS, np.clip(NLOW[:, None] + RANK, 0, COLUMNS - 1)]
+        WHERE = np.zeros((STOP - START, COLUMNS), dtype=np.int32)
+        IN_LOW = RANK < NLOW[:, None]
+        IN_HIGH = RANK < NHIGH[:, None]
+        WHERE[np.broadcast_to(ROWS, LOW.shape)[IN_LOW], LOW[IN_LOW]] = np.broadcast_to(RANK + 1, LOW.shape)[IN_LOW]
+        WHERE[np.broadcast_to(ROWS, HIGH.shape)[IN_HIGH], HIGH[IN_HIGH]] = -np.broadcast_to(RANK + 1, HIGH.shape)[IN_HIGH]
+        STATE['LOW'][START:STOP] = np.where(IN_LOW, LOW, 0)
+        STATE['HIGH'][START:STOP] = np.where(IN_HIGH, HIGH, 0)
+        STATE['WHERE'][START:STOP] = WHERE
+        STATE['NLOW'][START:STOP] = NLOW
+        STATE['NHIGH'][START:STOP] = NHIGH
+
+# Check the heap medians against np.nanmedian of the ratios, a full recompute, and rebuild the heaps
+# if any pair does not match. Returns True when they matched.
+def CHECK_HEAPS(STATE):
+    MEDIAN = HEAP_MEDIANS(STATE)
+    BLOCK = max(BLOCK_BYTES // ( 8 * 2 * max(STATE['COLUMNS'], 1) ), 1)
+    for START in range(0, STATE['PAIRS'], BLOCK):
+        STOP = min(START + BLOCK, STATE['PAIRS'])
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            FULL = np.nanmedian(STATE['RATIOS'][:, START:STOP], axis=0)
+        if not np.allclose(FULL, MEDIAN[START:STOP], rtol=1e-12, atol=0, equal_nan=True):
+            print('The pair medians of the scoring state in %s did not match its ratios, rebuilding them' % STATE['DIR'])
+            BUILD_HEAPS(STATE)
+            return False
+    return True
+
+#### GENE FUNCTIONS:
+def LABELS_FILE(STATE, GENE):
+    return '%s/genes/%s.txt' % ( STATE['DIR'], GENE )
+
+# Add one gene's distances to the state. With UPDATE_HEAPS=False only the ratios are stored and
+# BUILD_HEAPS has to be run afterwards.
+def ADD_GENE(STATE, GENE, LABELS, I, J, DISTANCES, SIZE=0, MTIME=0.0, UPDATE_HEAPS=True):
+    SPECIES_INDEX = dict( ( S, N ) for N, S in enumerate(STATE['SPECIES']) )
+    for S in zscore_engine.LABEL_SPECIES(LABELS):
+        if S not in SPECIES_INDEX:
+            SPECIES_INDEX[S] = len(STATE['SPECIES'])
+            STATE['SPECIES'].append(S)
+    GROW(STATE, len(STATE['SPECIES']))
+    if '' in STATE['GENES']:
+        COLUMN = STATE['GENES'].index('')
+        STATE['GENES'][COLUMN] = GENE
+    else:
+        COLUMN = len(STATE['GENES'])
+        STATE['GENES'].append(GENE)
+    STATE['SIZE'][COLUMN] = SIZE
+    STATE['MTIME'][COLUMN] = MTIME
+    with open(LABELS_FILE(STATE, GENE), 'w') as OUT:
+        OUT.write(''.join( '%s\n' % LABEL for LABEL in LABELS ))
+    LOW, HIGH, VALUES = zscore_engine.GENE_PAIRS(LABELS, I, J, DISTANCES, SPECIES_INDEX)
+    ROWS = ( HIGH * ( HIGH + 1 ) ) // 2 + LOW
+    # A pair seen more than once in a gene keeps its last distance, missing ratios are left out
+    ROWS, LAST = np.unique(ROWS[::-1], return_index=True)
+    VALUES = VALUES[::-1][LAST]
+    KEEP = ~np.isnan(VALUES)
+    ROWS = ROWS[KEEP]
+    VALUES = VALUES[KEEP]
+    STATE['RATIOS'][COLUMN] = np.nan
+    STATE['RATIOS'][COLUMN, ROWS] = VALUES
+    if not UPDATE_HEAPS:
+        return
+    # Into the low heap when at or below its top, then even out the two heaps
+    TOP = STATE['RATIOS'][STATE['LOW'][ROWS, 0], ROWS]
+    with np.errstate(invalid='ignore'):
+        TO_LOW = ( STATE['NLOW'][ROWS] == 0 ) | ( VALUES <= TOP )
+    PUSH(STATE, 'LOW', ROWS[TO_LOW], np.full(TO_LOW.sum(), COLUMN, dtype=np.int64))
+    PUSH(STATE, 'HIGH', ROWS[~TO_LOW], np.full(len(ROWS) - TO_LOW.sum(), COLUMN, dtype=np.int64))
+    BALANCE(STATE, ROWS)
+
+# Remove a gene from the state
+def REMOVE_GENE(STATE, GENE):
+    COLUMN = STATE['GENES'].index(GENE)
+    PRESENT = np.flatnonzero(~np.isnan(STATE['RATIOS'][COLUMN]))
+    WHERE = STATE['WHERE'][PRESENT, COLUMN]
+    for NAME, TAG in ( ( 'LOW', 1 ), ( 'HIGH', -1 ) ):
+        ON_HEAP = WHERE * TAG > 0
+        DELETE(STATE, NAME, PRESENT[ON_HEAP], WHERE[ON_HEAP] * TAG - 1)
+    BALANCE(STATE, PRESENT)
+    STATE['RATIOS'][COLUMN] = np.nan
+    STATE['GENES'][COLUMN] = ''
+    if os.path.isfile(LABELS_FILE(STATE, GENE)):
+        os.remove(LABELS_FILE(STATE, GENE))
+
+# Bring the state up to date with GENE_FILES, a list of (GENE, FILE). Genes that are gone or whose
+# file changed size or modification time are removed, and new or changed genes are added. A new
+# state is filled first and its heaps built once at the end.
+def UPDATE_STATE(STATE, GENE_FILES, CACHE_DIR=None, READER=zscore_engine.READ_DISTANCES):
+    MARK_UPDATING(STATE)
+    CURRENT = dict( ( GENE, os.stat(GENE_FILE) ) for GENE, GENE_FILE in GENE_FILES )
+    for COLUMN, GENE in enumerate(list(STATE['GENES'])):
+        if not GENE:
+            continue
+        if GENE not in CURRENT or STATE['SIZE'][COLUMN] != CURRENT[GENE].st_size or STATE['MTIME'][COLUMN] != CURRENT[GENE].st_mtime:
+            REMOVE_GENE(STATE, GENE)
+    BULK = not any(STATE['GENES'])
+    for GENE, GENE_FILE in GENE_FILES:
+        if GENE in STATE['GENES']:
+            continue
+        LABELS, I, J, DISTANCES = zscore_engine.LOAD_DISTANCES(GENE_FILE, CACHE_DIR, READER)
+        ADD_GENE(STATE, GENE, LABELS, I, J, DISTANCES, CURRENT[GENE].st_size, CURRENT[GENE].st_mtime, UPDATE_HEAPS=not BULK)
+    if BULK and STATE['PAIRS']:
+        BUILD_HEAPS(STATE)
+    STATE['RUN'] += 1
+    if STATE['PAIRS'] and not BULK and STATE['RUN'] % VERIFY_EVERY == 0:
+        CHECK_HEAPS(STATE)
+    return STATE
+
+# The outlier ratios of the state in the same form as the matrix path: the species present in at
+# least one gene and the genes, both sorted, the sequence names of each gene and the species x gene
+# ratios. The ratios are normalized by the heap medians and summed in blocks of pairs.
+def STATE_RATIOS(STATE):
+    GENE_COLUMNS = sorted( ( GENE, COLUMN ) for COLUMN, GENE in enumerate(STATE['GENES']) if GENE )
+    COLUMNS = [COLUMN for GENE, COLUMN in GENE_COLUMNS]
+    TOTAL_SPECIES = len(STATE['SPECIES'])
+    SUMS = np.zeros((TOTAL_SPECIES, len(COLUMNS)))
+    COUNTS = np.zeros((TOTAL_SPECIES, len(COLUMNS)), dtype=np.int64)
+    if COLUMNS:
+        PAIR_I, PAIR_J = PAIR_INDEXES(TOTAL_SPECIES)
+        MEDIAN = HEAP_MEDIANS(STATE)
+        BLOCK = max(BLOCK_BYTES // ( 8 * 4 * len(COLUMNS) ), 1)
+        for START in range(0, STATE['PAIRS'], BLOCK):
+            STOP = min(START + BLOCK, STATE['PAIRS'])
+            RATIOS = np.array(STATE['RATIOS'][COLUMNS, START:STOP].T)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                NORMALIZED = np.log(RATIOS / ( 0.1 * MEDIAN[START:STOP] )[:, None])
+            # Rows are ordered by the second species of each pair
+            zscore_engine.SPECIES_SUMS(NORMALIZED, ~np.isnan(RATIOS), PAIR_J[START:STOP], PAIR_I[START:STOP], TOTAL_SPECIES, SUMS, COUNTS)
+    SPECIES_ROWS = sorted( ( S, ROW ) for ROW, S in enumerate(STATE['SPECIES']) if COUNTS[ROW].any() )
+    ROWS = [ROW for S, ROW in SPECIES_ROWS]
+    RATIOS = zscore_engine.OUTLIER_RATIOS(SUMS[ROWS], COUNTS[ROWS])
+    GENE_LABELS = []
+    for GENE, COLUMN in GENE_COLUMNS:
+        with open(LABELS_FILE(STATE, GENE), 'r') as INPUT:
+            GENE_LABELS.append([ LINE.rstrip('\n') for LINE in INPUT ])
+    return [S for S, ROW in SPECIES_ROWS], [GENE for GENE, COLUMN in GENE_COLUMNS], GENE_LABELS, RATIOS